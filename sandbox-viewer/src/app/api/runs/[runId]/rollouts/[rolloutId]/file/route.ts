@@ -4,6 +4,7 @@ import path from 'path'
 import * as tar from 'tar'
 import { createReadStream } from 'fs'
 import { createGunzip } from 'zlib'
+import { listZip, readZipEntry } from '@/lib/zipArchive'
 
 const DEBUG_OUTPUT_PATH = path.join(process.cwd(), 'debug_output', 'runs')
 
@@ -19,63 +20,52 @@ export async function GET(
       return NextResponse.json({ error: 'File path required' }, { status: 400 })
     }
 
-    const tarPath = path.join(
-      DEBUG_OUTPUT_PATH,
-      params.runId,
-      'rollouts',
-      params.rolloutId,
-      'filesystem.tar.gz'
-    )
-
-    try {
-      await fs.access(tarPath)
-    } catch {
-      return NextResponse.json({ error: 'Filesystem archive not found' }, { status: 404 })
-    }
+    const rolloutDir = path.join(DEBUG_OUTPUT_PATH, params.runId, 'rollouts', params.rolloutId)
+    const zipPath = path.join(rolloutDir, 'filesystem.zip')
+    const tarPath = path.join(rolloutDir, 'filesystem.tar.gz')
 
     // Normalize the path (remove leading slash for tar matching)
     const normalizedPath = filePath.startsWith('/') ? filePath.slice(1) : filePath
 
-    // Extract specific file content from tar
     let fileContent: string | null = null
     let isBinary = false
 
-    await new Promise<void>((resolve, reject) => {
-      const stream = createReadStream(tarPath)
-        .pipe(createGunzip())
-        .pipe(new tar.Parser())
-
-      stream.on('entry', async (entry: tar.ReadEntry) => {
-        const entryPath = entry.path.replace(/\/$/, '')
-        const targetPath = normalizedPath.replace(/\/$/, '')
-
-        if (entryPath === targetPath && entry.type === 'File') {
-          const chunks: Buffer[] = []
-
-          entry.on('data', (chunk: Buffer) => {
-            chunks.push(chunk)
-          })
-
-          entry.on('end', () => {
-            const buffer = Buffer.concat(chunks)
-            // Check if binary
-            const nullBytes = buffer.filter(b => b === 0).length
-            isBinary = nullBytes > buffer.length * 0.1 // More than 10% null bytes = binary
-
-            if (isBinary) {
-              fileContent = `[Binary file, ${buffer.length} bytes]`
-            } else {
-              fileContent = buffer.toString('utf-8')
-            }
-          })
-        } else {
-          entry.resume()
-        }
-      })
-
-      stream.on('end', resolve)
-      stream.on('error', reject)
-    })
+    const decode = (buffer: Buffer) => {
+      // Check if binary
+      const nullBytes = buffer.filter(b => b === 0).length
+      isBinary = nullBytes > buffer.length * 0.1 // More than 10% null bytes = binary
+
+      if (isBinary) {
+        fileContent = `[Binary file, ${buffer.length} bytes]`
+      } else {
+        fileContent = buffer.toString('utf-8')
+      }
+    }
+
+    let hasZip = true
+    try {
+      await fs.access(zipPath)
+    } catch {
+      hasZip = false
+    }
+
+    if (hasZip) {
+      // Seek straight to the one entry via the central directory
+      const targetPath = normalizedPath.replace(/^(\.\/)+/, '').replace(/\/$/, '')
+      const entry = (await listZip(zipPath)).find(e => e.path === targetPath && e.type !== 'directory')
+      if (entry) {
+        decode(await readZipEntry(zipPath, entry))
+      }
+    } else {
+      try {
+        await fs.access(tarPath)
+      } catch {
+        return NextResponse.json({ error: 'Filesystem archive not found' }, { status: 404 })
+      }
+
+      // Extract specific file content from tar
+      await extractFromTar(tarPath, normalizedPath, decode)
+    }
 
     if (fileContent === null) {
       return NextResponse.json({ error: 'File not found in archive' }, { status: 404 })
@@ -87,3 +77,34 @@ export async function GET(
     return NextResponse.json({ error: 'Failed to read file' }, { status: 500 })
   }
 }
+
+// Captures written before filesystem.zip: scan the gzip stream for the entry
+function extractFromTar(tarPath: string, normalizedPath: string, decode: (buffer: Buffer) => void) {
+  return new Promise<void>((resolve, reject) => {
+    const stream = createReadStream(tarPath)
+      .pipe(createGunzip())
+      .pipe(new tar.Parser())
+
+    stream.on('entry', async (entry: tar.ReadEntry) => {
+      const entryPath = entry.path.replace(/\/$/, '')
+      const targetPath = normalizedPath.replace(/\/$/, '')
+
+      if (entryPath === targetPath && entry.type === 'File') {
+        const chunks: Buffer[] = []
+
+        entry.on('data', (chunk: Buffer) => {
+          chunks.push(chunk)
+        })
+
+        entry.on('end', () => {
+          decode(Buffer.concat(chunks))
+        })
+      } else {
+        entry.resume()
+      }
+    })
+
+    stream.on('end', resolve)
+    stream.on('error', reject)
+  })
+}
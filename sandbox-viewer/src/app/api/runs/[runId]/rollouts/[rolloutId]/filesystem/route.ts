@@ -5,6 +5,7 @@ import * as tar from 'tar'
 import { createReadStream } from 'fs'
 import { createGunzip } from 'zlib'
 import { FileNode } from '@/types'
+import { listZip } from '@/lib/zipArchive'
 
 const DEBUG_OUTPUT_PATH = path.join(process.cwd(), 'debug_output', 'runs')
 
@@ -14,46 +15,63 @@ interface TarEntry {
   size?: number;
 }
 
+async function exists(p: string): Promise<boolean> {
+  try {
+    await fs.access(p)
+    return true
+  } catch {
+    return false
+  }
+}
+
+// Captures written before filesystem.zip: scan the whole gzip stream
+async function listTar(tarPath: string): Promise<TarEntry[]> {
+  const entries: TarEntry[] = []
+
+  await new Promise<void>((resolve, reject) => {
+    const stream = createReadStream(tarPath)
+      .pipe(createGunzip())
+      .pipe(new tar.Parser())
+
+    stream.on('entry', (entry: tar.ReadEntry) => {
+      entries.push({
+        path: entry.path,
+        type: entry.type === 'Directory' ? 'directory' : 'file',
+        size: entry.size,
+      })
+      entry.resume()
+    })
+
+    stream.on('end', resolve)
+    stream.on('error', reject)
+  })
+
+  return entries
+}
+
 export async function GET(
   request: Request,
   { params }: { params: { runId: string; rolloutId: string } }
 ) {
   try {
-    const tarPath = path.join(
-      DEBUG_OUTPUT_PATH,
-      params.runId,
-      'rollouts',
-      params.rolloutId,
-      'filesystem.tar.gz'
-    )
-
-    try {
-      await fs.access(tarPath)
-    } catch {
+    const rolloutDir = path.join(DEBUG_OUTPUT_PATH, params.runId, 'rollouts', params.rolloutId)
+    const zipPath = path.join(rolloutDir, 'filesystem.zip')
+    const tarPath = path.join(rolloutDir, 'filesystem.tar.gz')
+
+    // Listing comes from the zip central directory; no file data is read
+    let entries: TarEntry[]
+    if (await exists(zipPath)) {
+      entries = (await listZip(zipPath)).map(e => ({
+        path: e.path,
+        type: e.type === 'directory' ? 'directory' : 'file',
+        size: e.size,
+      }))
+    } else if (await exists(tarPath)) {
+      entries = await listTar(tarPath)
+    } else {
       return NextResponse.json({ error: 'Filesystem archive not found' }, { status: 404 })
     }
 
-    // Parse the tar.gz to get file listing
-    const entries: TarEntry[] = []
-
-    await new Promise<void>((resolve, reject) => {
-      const stream = createReadStream(tarPath)
-        .pipe(createGunzip())
-        .pipe(new tar.Parser())
-
-      stream.on('entry', (entry: tar.ReadEntry) => {
-        entries.push({
-          path: entry.path,
-          type: entry.type === 'Directory' ? 'directory' : 'file',
-          size: entry.size,
-        })
-        entry.resume()
-      })
-
-      stream.on('end', resolve)
-      stream.on('error', reject)
-    })
-
     // Build tree structure
     const root: FileNode = {
       name: '/',
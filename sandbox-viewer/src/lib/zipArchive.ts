@@ -0,0 +1,114 @@
+import fs from 'fs/promises'
+import { inflateRawSync } from 'zlib'
+
+// Reads filesystem.zip captures through the central directory: listing
+// touches only the index, reading a file touches only that file's bytes.
+
+export interface ZipEntry {
+  path: string;
+  type: 'file' | 'directory' | 'symlink';
+  size: number;
+  compressedSize: number;
+  method: number;
+  localHeaderOffset: number;
+}
+
+const EOCD_SIG = 0x06054b50
+const EOCD64_LOCATOR_SIG = 0x07064b50
+const CENTRAL_SIG = 0x02014b50
+const MAX_EOCD_SEARCH = 22 + 0xffff
+const S_IFMT = 0o170000
+const S_IFLNK = 0o120000
+
+async function readAt(handle: fs.FileHandle, position: number, length: number): Promise<Buffer> {
+  const buffer = Buffer.alloc(length)
+  const { bytesRead } = await handle.read(buffer, 0, length, position)
+  return buffer.subarray(0, bytesRead)
+}
+
+async function findCentralDirectory(handle: fs.FileHandle): Promise<{ offset: number; size: number }> {
+  const { size: fileSize } = await handle.stat()
+  const tailStart = Math.max(0, fileSize - MAX_EOCD_SEARCH)
+  const tail = await readAt(handle, tailStart, fileSize - tailStart)
+
+  for (let i = tail.length - 22; i >= 0; i--) {
+    if (tail.readUInt32LE(i) !== EOCD_SIG) continue
+    let size = tail.readUInt32LE(i + 12)
+    let offset = tail.readUInt32LE(i + 16)
+    // Zip64: the real values live in the zip64 end record
+    if (i >= 20 && tail.readUInt32LE(i - 20) === EOCD64_LOCATOR_SIG) {
+      const eocd64Offset = Number(tail.readBigUInt64LE(i - 20 + 8))
+      const eocd64 = await readAt(handle, eocd64Offset, 56)
+      size = Number(eocd64.readBigUInt64LE(40))
+      offset = Number(eocd64.readBigUInt64LE(48))
+    }
+    return { offset, size }
+  }
+  throw new Error('Not a zip archive')
+}
+
+export async function listZip(zipPath: string): Promise<ZipEntry[]> {
+  const handle = await fs.open(zipPath, 'r')
+  try {
+    const { offset, size } = await findCentralDirectory(handle)
+    const dir = await readAt(handle, offset, size)
+    const entries: ZipEntry[] = []
+
+    let p = 0
+    while (p + 46 <= dir.length && dir.readUInt32LE(p) === CENTRAL_SIG) {
+      const method = dir.readUInt16LE(p + 10)
+      let compressedSize = dir.readUInt32LE(p + 20)
+      let uncompressedSize = dir.readUInt32LE(p + 24)
+      const nameLength = dir.readUInt16LE(p + 28)
+      const extraLength = dir.readUInt16LE(p + 30)
+      const commentLength = dir.readUInt16LE(p + 32)
+      const externalAttr = dir.readUInt32LE(p + 38)
+      let localHeaderOffset = dir.readUInt32LE(p + 42)
+      const name = dir.toString('utf-8', p + 46, p + 46 + nameLength)
+
+      // Zip64 extra field: only the fields that overflowed are present, in this order
+      let e = p + 46 + nameLength
+      const extraEnd = e + extraLength
+      while (e + 4 <= extraEnd) {
+        const id = dir.readUInt16LE(e)
+        const len = dir.readUInt16LE(e + 2)
+        if (id === 0x0001) {
+          let q = e + 4
+          if (uncompressedSize === 0xffffffff) { uncompressedSize = Number(dir.readBigUInt64LE(q)); q += 8 }
+          if (compressedSize === 0xffffffff) { compressedSize = Number(dir.readBigUInt64LE(q)); q += 8 }
+          if (localHeaderOffset === 0xffffffff) { localHeaderOffset = Number(dir.readBigUInt64LE(q)) }
+        }
+        e += 4 + len
+      }
+
+      const mode = externalAttr >>> 16
+      const isDirectory = name.endsWith('/')
+      entries.push({
+        path: name.replace(/\/$/, ''),
+        type: isDirectory ? 'directory' : (mode & S_IFMT) === S_IFLNK ? 'symlink' : 'file',
+        size: uncompressedSize,
+        compressedSize,
+        method,
+        localHeaderOffset,
+      })
+      p = extraEnd + commentLength
+    }
+    return entries
+  } finally {
+    await handle.close()
+  }
+}
+
+export async function readZipEntry(zipPath: string, entry: ZipEntry): Promise<Buffer> {
+  const handle = await fs.open(zipPath, 'r')
+  try {
+    const header = await readAt(handle, entry.localHeaderOffset, 30)
+    const dataStart = entry.localHeaderOffset + 30 + header.readUInt16LE(26) + header.readUInt16LE(28)
+    const data = await readAt(handle, dataStart, entry.compressedSize)
+    if (entry.method === 0) return data
+    if (entry.method === 8) return inflateRawSync(data)
+    throw new Error(`Unsupported zip compression method ${entry.method}`)
+  } finally {
+    await handle.close()
+  }
+}
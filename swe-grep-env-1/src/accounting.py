@@ -0,0 +1,222 @@
+"""Bytes and token accounting for tool calls and sandbox traffic.
+
+Two things are measured per rollout:
+
+    tools   what the model sent (JSON args) and got back (tool response),
+            with response tokens estimated as bytes / 4
+    wire    what each execute_command / upload_file moved to and from the
+            sandbox, labelled by the tool that issued it ("setup" before
+            the first tool call, "prefetch", "teardown" after release)
+
+UsageTracker keeps per-rollout totals from setup until the sandbox is
+deleted, so the debug capture pulled during delete is charged to its
+rollout. release() hands the totals so far to the state for scoring;
+close() after the delete records the final totals. Run-wide distributions
+(per call and per rollout) are kept in fixed-size reservoirs.
+"""
+
+import contextvars
+import json
+import os
+import random
+from array import array
+
+_label = contextvars.ContextVar("swe_grep_usage_label", default=None)
+
+
+def set_label(label: str | None):
+    """Attribute sandbox traffic in the current task to `label` (usually a tool name)."""
+    return _label.set(label)
+
+
+def reset_label(token):
+    _label.reset(token)
+
+
+def estimate_tokens(text: str | bytes | int) -> int:
+    """Rough token count: ~4 bytes per token for code and English."""
+    if isinstance(text, str):
+        text = len(text.encode())
+    elif isinstance(text, bytes):
+        text = len(text)
+    return (text + 3) // 4
+
+
+class Reservoir:
+    """Exact count/mean/max plus a uniform sample of at most `size` values for percentiles."""
+
+    __slots__ = ("n", "total", "max", "samples", "size")
+
+    def __init__(self, size: int = 4096):
+        self.n = 0
+        self.total = 0
+        self.max = None
+        self.samples = array("q")
+        self.size = size
+
+    def add(self, value: int):
+        self.n += 1
+        self.total += value
+        if self.max is None or value > self.max:
+            self.max = value
+        if len(self.samples) < self.size:
+            self.samples.append(value)
+        else:
+            i = random.randrange(self.n)
+            if i < self.size:
+                self.samples[i] = value
+
+    def distribution(self) -> dict:
+        if not self.n:
+            return {"n": 0}
+        ordered = sorted(self.samples)
+        k = len(ordered)
+        return {
+            "n": self.n,
+            "mean": round(self.total / self.n, 1),
+            "p50": ordered[k // 2],
+            "p90": ordered[min(k - 1, k * 9 // 10)],
+            "p99": ordered[min(k - 1, k * 99 // 100)],
+            "max": self.max,
+        }
+
+
+class _Counts:
+    __slots__ = ("calls", "bytes_in", "bytes_out")
+
+    def __init__(self):
+        self.calls = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+
+class _RolloutUsage:
+    def __init__(self):
+        self.tools: dict[str, _Counts] = {}
+        self.wire: dict[str, _Counts] = {}
+        self.released = False
+
+    def summary(self) -> dict:
+        tools = {
+            name: {"calls": c.calls, "bytes_in": c.bytes_in, "bytes_out": c.bytes_out,
+                   "tokens_out": estimate_tokens(c.bytes_out)}
+            for name, c in self.tools.items()
+        }
+        wire = {
+            label: {"commands": c.calls, "bytes_in": c.bytes_in, "bytes_out": c.bytes_out}
+            for label, c in self.wire.items()
+        }
+        return {
+            "tools": tools,
+            "wire": wire,
+            "tool_calls": sum(c.calls for c in self.tools.values()),
+            "tool_bytes_out": sum(c.bytes_out for c in self.tools.values()),
+            "tool_tokens_out": sum(t["tokens_out"] for t in tools.values()),
+            "wire_bytes_in": sum(c.bytes_in for c in self.wire.values()),
+            "wire_bytes_out": sum(c.bytes_out for c in self.wire.values()),
+        }
+
+
+class UsageTracker:
+    def __init__(self, reservoir_size: int = 4096):
+        self._rollouts: dict[str, _RolloutUsage] = {}
+        # Run-wide series: "tool.<name>.tokens_out", "wire.<label>.bytes_out", "rollout.<field>"
+        self._samples: dict[str, Reservoir] = {}
+        self._reservoir_size = reservoir_size
+
+    def _sample(self, key: str, value: int):
+        samples = self._samples.get(key)
+        if samples is None:
+            samples = self._samples[key] = Reservoir(self._reservoir_size)
+        samples.add(value)
+
+    def open(self, sandbox_id: str, previous: str | None = None):
+        """Start accounting for a rollout's sandbox; `previous` carries over a failed setup attempt."""
+        usage = self._rollouts.pop(previous, None) if previous else None
+        self._rollouts[sandbox_id] = usage or _RolloutUsage()
+
+    def tool_call(self, sandbox_id: str, tool_name: str, args: dict, response: str):
+        args = {k: v for k, v in args.items() if k != "sandbox_id"}
+        bytes_in = len(json.dumps(args).encode())
+        bytes_out = len(response.encode())
+        self._sample(f"tool.{tool_name}.tokens_out", estimate_tokens(bytes_out))
+        usage = self._rollouts.get(sandbox_id)
+        if usage is None:
+            return
+        counts = usage.tools.get(tool_name)
+        if counts is None:
+            counts = usage.tools[tool_name] = _Counts()
+        counts.calls += 1
+        counts.bytes_in += bytes_in
+        counts.bytes_out += bytes_out
+
+    def wire(self, sandbox_id: str, bytes_in: int, bytes_out: int):
+        usage = self._rollouts.get(sandbox_id)
+        label = _label.get() or ("setup" if usage is not None and not usage.released else "teardown")
+        self._sample(f"wire.{label}.bytes_in", bytes_in)
+        self._sample(f"wire.{label}.bytes_out", bytes_out)
+        if usage is None:
+            return
+        counts = usage.wire.get(label)
+        if counts is None:
+            counts = usage.wire[label] = _Counts()
+        counts.calls += 1
+        counts.bytes_in += bytes_in
+        counts.bytes_out += bytes_out
+
+    def release(self, sandbox_id: str) -> dict | None:
+        """The rollout's totals so far; later traffic (the delete, captures) is labelled "teardown"."""
+        usage = self._rollouts.get(sandbox_id)
+        if usage is None:
+            return None
+        usage.released = True
+        return usage.summary()
+
+    def snapshot(self, sandbox_id: str) -> dict | None:
+        usage = self._rollouts.get(sandbox_id)
+        return usage.summary() if usage is not None else None
+
+    def close(self, sandbox_id: str) -> dict | None:
+        """Stop accounting for a deleted sandbox and record its rollout's final totals."""
+        usage = self._rollouts.pop(sandbox_id, None)
+        if usage is None:
+            return None
+        summary = usage.summary()
+        for field in ("tool_calls", "tool_tokens_out", "wire_bytes_in", "wire_bytes_out"):
+            self._sample(f"rollout.{field}", summary[field])
+        return summary
+
+    def distribution(self, key: str) -> dict | None:
+        samples = self._samples.get(key)
+        return samples.distribution() if samples is not None else None
+
+    def summary(self) -> dict:
+        """Run-wide distributions for every sampled series."""
+        return {key: samples.distribution() for key, samples in sorted(self._samples.items())}
+
+
+class MeteredSandboxClient:
+    """Sandbox client wrapper that reports bytes moved per call to a UsageTracker."""
+
+    def __init__(self, client, tracker: UsageTracker):
+        self._client = client
+        self._tracker = tracker
+
+    async def execute_command(self, sandbox_id: str, command: str, **kwargs):
+        bytes_in = len(command.encode())
+        try:
+            result = await self._client.execute_command(sandbox_id, command, **kwargs)
+        except Exception:
+            self._tracker.wire(sandbox_id, bytes_in, 0)
+            raise
+        bytes_out = len((result.stdout or "").encode()) + len((result.stderr or "").encode())
+        self._tracker.wire(sandbox_id, bytes_in, bytes_out)
+        return result
+
+    async def upload_file(self, sandbox_id: str, file_path: str, local_file_path: str):
+        result = await self._client.upload_file(sandbox_id, file_path, local_file_path)
+        self._tracker.wire(sandbox_id, os.path.getsize(local_file_path), 0)
+        return result
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
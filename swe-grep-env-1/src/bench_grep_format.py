@@ -0,0 +1,103 @@
+"""Compare grep_tool's text and grouped output formats on a local checkout.
+
+For each pattern both pipelines are run exactly as grep_tool runs them in
+the sandbox and scored on estimated tokens (bytes / 4), match lines shown,
+tokens per match, and, when the dataset has gt_files, whether the
+ground-truth file made it into the output.
+
+Usage:
+    python -m src.bench_grep_format grep_dataset_5k_v2.parquet --repo ./vscode -n 200
+    python -m src.bench_grep_format --repo ./vscode --pattern registerAction2 --pattern onDidChange
+"""
+
+import argparse
+import shlex
+import subprocess
+import sys
+from pathlib import Path
+
+from src.accounting import estimate_tokens
+from src.prefetch import parse_grep_hits, parse_grouped_hits
+from src import rg_format
+
+MAX_LINES = 50
+
+
+def run_text(pattern: str, repo: Path, context: int) -> str:
+    """grep_tool's "text" mode: rg -n | head, then per-line truncation."""
+    cmd = (
+        f"rg -n --max-filesize 100K -C {context} {shlex.quote(pattern)} {shlex.quote(repo.name)} 2>&1 "
+        f"| head -{MAX_LINES + 1}"
+    )
+    output = subprocess.run(cmd, shell=True, cwd=repo.parent, capture_output=True, text=True).stdout.strip()
+    if not output:
+        return "No matches found."
+    lines = [line[:300] + '...' if len(line) > 300 else line for line in output.split('\n')]
+    if len(lines) > MAX_LINES:
+        output = '\n'.join(lines[:MAX_LINES])
+        return f"{output}\n\n[TRUNCATED - results exceed {MAX_LINES} lines. Narrow your search with a more specific pattern or file_pattern]"
+    return '\n'.join(lines)
+
+
+def run_grouped(pattern: str, repo: Path, context: int, max_bytes: int) -> str:
+    cmd = (
+        f"rg --json --max-filesize 100K -C {context} {shlex.quote(pattern)} {shlex.quote(repo.name)} 2>&1 "
+        f"| {shlex.quote(sys.executable)} {shlex.quote(rg_format.__file__)} --context {context} --max-bytes {max_bytes}"
+    )
+    output = subprocess.run(cmd, shell=True, cwd=repo.parent, capture_output=True, text=True).stdout.strip()
+    return output or "No matches found."
+
+
+def score(output: str, hits: list[tuple[str, list[int]]], gt_files: list[str] | None) -> dict:
+    matches = sum(len(lines) for _, lines in hits)
+    shown = {Path(path).as_posix().split("/", 1)[-1] for path, _ in hits}
+    return {
+        "tokens": estimate_tokens(output),
+        "matches": matches,
+        "gt_shown": None if gt_files is None else any(f in shown for f in gt_files),
+    }
+
+
+def summarize(name: str, rows: list[dict]):
+    tokens = sum(r["tokens"] for r in rows)
+    matches = sum(r["matches"] for r in rows)
+    gt = [r["gt_shown"] for r in rows if r["gt_shown"] is not None]
+    print(f"{name:8s} tokens={tokens:>9,d}  matches={matches:>7,d}  "
+          f"tokens/match={tokens / max(matches, 1):6.1f}  tokens/query={tokens / max(len(rows), 1):7.1f}"
+          + (f"  gt_file_shown={sum(gt) / len(gt):.1%}" if gt else ""))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("dataset", nargs="?", help="Parquet with an answer column (and optionally gt_files)")
+    parser.add_argument("--repo", default="./vscode")
+    parser.add_argument("--pattern", action="append", default=[])
+    parser.add_argument("-n", type=int, default=200, help="Dataset rows to sample")
+    parser.add_argument("--context", type=int, default=2)
+    parser.add_argument("--max-bytes", type=int, default=8000)
+    args = parser.parse_args()
+
+    queries = [(p, None) for p in args.pattern]
+    if args.dataset:
+        import pandas as pd
+
+        df = pd.read_parquet(args.dataset)
+        df = df[df["answer"].str.len() > 0].sample(min(args.n, len(df)), random_state=0)
+        gt = df["gt_files"] if "gt_files" in df else [None] * len(df)
+        queries += [(answer, list(files) if files is not None else None) for answer, files in zip(df["answer"], gt)]
+
+    repo = Path(args.repo).resolve()
+    text_rows, grouped_rows = [], []
+    for pattern, gt_files in queries:
+        out = run_text(pattern, repo, args.context)
+        text_rows.append(score(out, parse_grep_hits(out, top_n=10**6), gt_files))
+        out = run_grouped(pattern, repo, args.context, args.max_bytes)
+        grouped_rows.append(score(out, parse_grouped_hits(out, top_n=10**6), gt_files))
+
+    print(f"{len(queries)} queries against {repo}")
+    summarize("text", text_rows)
+    summarize("grouped", grouped_rows)
+
+
+if __name__ == "__main__":
+    main()
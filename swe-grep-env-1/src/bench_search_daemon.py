@@ -0,0 +1,123 @@
+"""Compare grep_tool's per-call rg pipeline with the warm search daemon.
+
+Starts src/rg_server.py against a local checkout, then runs every pattern
+through both paths exactly as grep_tool issues them (rg | head vs the bash
+/dev/tcp client) and reports per-call latency percentiles, how often the
+daemon fell back to rg, and any pattern whose match lines differ.
+
+Usage:
+    python -m src.bench_search_daemon grep_dataset_5k_v2.parquet --repo ./vscode -n 200
+    python -m src.bench_search_daemon --repo ./vscode --patterns patterns.txt
+    python -m src.bench_search_daemon --repo ./vscode --pattern registerAction2 --pattern 'on[A-Z]\\w+Change'
+"""
+
+import argparse
+import shlex
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+from src import rg_server
+
+MAX_LINES = 50
+FELL_BACK = "__FELL_BACK__"
+
+
+def rg_command(pattern: str, path: str, context: int) -> str:
+    flags = f"-n --max-filesize 100K -C {context}" if context else "-n --max-filesize 100K"
+    return f"rg {flags} {shlex.quote(pattern)} {shlex.quote(path)} 2>&1 | head -{MAX_LINES + 1}"
+
+
+def timed(cmd: str, cwd: Path) -> tuple[float, str]:
+    start = time.perf_counter()
+    out = subprocess.run(["bash", "-c", cmd], cwd=cwd, capture_output=True, text=True).stdout
+    return time.perf_counter() - start, out
+
+
+def wait_for_port(port: int, timeout: float = 30.0) -> bool:
+    deadline = time.monotonic() + timeout
+    probe = f"exec 3<>/dev/tcp/127.0.0.1/{port}"
+    while time.monotonic() < deadline:
+        if subprocess.run(["bash", "-c", probe], capture_output=True).returncode == 0:
+            return True
+        time.sleep(0.1)
+    return False
+
+
+def report(name: str, seconds: list[float]):
+    ms = np.array(seconds) * 1000
+    print(f"{name:8s} p50={np.percentile(ms, 50):7.1f}ms  p90={np.percentile(ms, 90):7.1f}ms  "
+          f"mean={ms.mean():7.1f}ms  total={ms.sum() / 1000:6.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("dataset", nargs="?", help="Parquet with an answer column")
+    parser.add_argument("--repo", default="./vscode")
+    parser.add_argument("--pattern", action="append", default=[])
+    parser.add_argument("--patterns", help="File with one pattern per line")
+    parser.add_argument("-n", type=int, default=200, help="Dataset rows to sample")
+    parser.add_argument("--context", type=int, default=2)
+    parser.add_argument("--port", type=int, default=rg_server.DEFAULT_PORT + 1)
+    parser.add_argument("--warmup", type=float, default=10, help="Seconds to let the daemon preload before timing")
+    parser.add_argument("--drop-caches", action="store_true", help="echo 3 > /proc/sys/vm/drop_caches first (root)")
+    args = parser.parse_args()
+
+    patterns = list(args.pattern)
+    if args.patterns:
+        patterns += [line for line in Path(args.patterns).read_text().splitlines() if line]
+    if args.dataset:
+        import pandas as pd
+
+        df = pd.read_parquet(args.dataset)
+        df = df[df["answer"].str.len() > 0].sample(min(args.n, len(df)), random_state=0)
+        patterns += list(df["answer"])
+
+    repo = Path(args.repo).resolve()
+    if args.drop_caches:
+        subprocess.run(["bash", "-c", "sync && echo 3 > /proc/sys/vm/drop_caches"], check=False)
+
+    server = subprocess.Popen(
+        [sys.executable, rg_server.__file__, "--root", repo.name, "--port", str(args.port)],
+        cwd=repo.parent, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        if not wait_for_port(args.port):
+            sys.exit("search daemon did not start")
+        time.sleep(args.warmup)
+        rg_times, daemon_times, fallbacks, mismatches = [], [], 0, []
+        for pattern in patterns:
+            cmd = rg_command(pattern, repo.name, args.context)
+            seconds, rg_out = timed(cmd, repo.parent)
+            rg_times.append(seconds)
+
+            # Declined requests run rg exactly as grep_tool's fallback would, so they're timed at full cost
+            request = {"pattern": pattern, "path": repo.name, "context": args.context, "max_lines": MAX_LINES + 1}
+            seconds, daemon_out = timed(rg_server.client_command(request, f"echo {FELL_BACK}; {cmd}", args.port), repo.parent)
+            daemon_times.append(seconds)
+            rg_lines, daemon_lines = rg_out.splitlines(), daemon_out.splitlines()
+            if daemon_lines[:1] == [FELL_BACK]:
+                fallbacks += 1
+            elif len(rg_lines) > MAX_LINES:
+                # Truncated: which files make the cut depends on walk order, so only compare the count
+                if len(daemon_lines) != len(rg_lines):
+                    mismatches.append(pattern)
+            elif sorted(rg_lines) != sorted(daemon_lines):
+                mismatches.append(pattern)
+    finally:
+        server.terminate()
+        server.wait()
+
+    print(f"{len(patterns)} patterns against {repo}")
+    report("rg", rg_times)
+    report("daemon", daemon_times)
+    print(f"fallbacks={fallbacks}  mismatches={len(mismatches)}")
+    for pattern in mismatches[:20]:
+        print(f"  mismatch: {pattern!r}")
+
+
+if __name__ == "__main__":
+    main()
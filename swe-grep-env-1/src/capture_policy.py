@@ -0,0 +1,66 @@
+"""Which rollouts DebugSandboxClient writes to disk.
+
+Capturing every rollout's command log and filesystem tarball is far more
+than we need at training scale. A policy decides cheaply at setup time
+(sampling, first K per run) and, when that is inconclusive, again once the
+reward is known (errors/retries, reward buckets). Rollouts still undecided
+at setup are buffered in memory and only hit the disk if they are kept.
+"""
+
+import bisect
+import zlib
+
+
+class CapturePolicy:
+    def __init__(
+        self,
+        sample_rate: float = 1.0,
+        first_k: int = 0,
+        capture_errors: bool = True,
+        reward_buckets: list[float] | None = None,
+        per_bucket: int = 0,
+        decision_timeout: float = 600.0,
+    ):
+        """
+        Args:
+            sample_rate: Fraction of rollouts captured unconditionally (by rollout id hash)
+            first_k: Always capture the first K rollouts of each run
+            capture_errors: Capture rollouts that errored or needed setup retries
+            reward_buckets: Sorted bucket edges, e.g. [0.5, 1.5] gives (<0.5, 0.5-1.5, >=1.5)
+            per_bucket: Capture up to this many rollouts per reward bucket per run
+            decision_timeout: Seconds a deferred rollout waits for its reward before being dropped
+        """
+        self.sample_rate = sample_rate
+        self.first_k = first_k
+        self.capture_errors = capture_errors
+        self.reward_buckets = sorted(reward_buckets or [])
+        self.per_bucket = per_bucket
+        self.decision_timeout = decision_timeout
+        self._run_counts: dict[str, int] = {}
+        self._bucket_counts: dict[tuple[str, int], int] = {}
+
+    @property
+    def defers(self) -> bool:
+        """Whether some rollouts can only be decided at reward time."""
+        return self.capture_errors or self.per_bucket > 0
+
+    def decide_at_setup(self, run_id: str, rollout_id: str) -> bool | None:
+        """True to capture, False to drop, None to buffer until the reward is known."""
+        seen = self._run_counts.get(run_id, 0)
+        self._run_counts[run_id] = seen + 1
+        if seen < self.first_k:
+            return True
+        if zlib.crc32(rollout_id.encode()) / 2**32 < self.sample_rate:
+            return True
+        return None if self.defers else False
+
+    def decide_at_reward(self, run_id: str, reward: float | None, had_error: bool) -> bool:
+        if had_error and self.capture_errors:
+            return True
+        if self.per_bucket > 0 and reward is not None:
+            key = (run_id, bisect.bisect_right(self.reward_buckets, reward))
+            count = self._bucket_counts.get(key, 0)
+            if count < self.per_bucket:
+                self._bucket_counts[key] = count + 1
+                return True
+        return False
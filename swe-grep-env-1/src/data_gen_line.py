@@ -4,11 +4,11 @@ import asyncio
 import random
 import httpx
 import anthropic
-import subprocess
 from pathlib import Path
 from chatan import async_generator, async_dataset
 from anthropic import AsyncAnthropic
 from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
+from src.repos import DEFAULT_REPO, local_checkout
 
 client = AsyncAnthropic(
     api_key=os.getenv("ANTHROPIC_API_KEY"), 
@@ -19,17 +19,13 @@ client = AsyncAnthropic(
     )
 )
 
-def setup_repo():
-    repo = Path("./vscode")
-    if not repo.exists():
-        subprocess.run(["git", "clone", "--depth", "1", 
-                       "https://github.com/microsoft/vscode.git"], check=True)
-    return repo
+def setup_repo(name: str = DEFAULT_REPO, commit: str = None) -> tuple[Path, str]:
+    """Checkout of the repo at a pinned commit from the node-local git cache; returns (path, sha)."""
+    return local_checkout(name, commit)
 
 
-def get_file_with_lines() -> str:
+def get_file_with_lines(repo_path: Path) -> str:
     """Return file content with line numbers and path header."""
-    repo_path = Path("./vscode")
     files = list(repo_path.rglob("*.ts"))
     files = [f for f in files if "node_modules" not in str(f) and f.stat().st_size < 30000]
     f = random.choice(files)
@@ -68,8 +64,8 @@ def parse_ground_truth(raw: str) -> dict:
     return result
 
 
-async def make_dataset(n: int = 100):
-    setup_repo()
+async def make_dataset(n: int = 100, repo: str = DEFAULT_REPO, commit: str = None):
+    repo_path, sha = setup_repo(repo, commit)
     gen = async_generator("anthropic", os.getenv("ANTHROPIC_API_KEY"), model="claude-haiku-4-5-20251001")
     gen._generator.client = client
     original = gen._generator.generate
@@ -88,7 +84,7 @@ async def make_dataset(n: int = 100):
     gen._generator.generate = with_retry
     
     ds = async_dataset({
-        "file": lambda ctx: get_file_with_lines(),
+        "file": lambda ctx: get_file_with_lines(repo_path),
         
         "ground_truth_raw": gen("""Look at this file and identify ONE specific, searchable code element.
 
@@ -137,6 +133,9 @@ Only respond with the question, nothing else."""),
     results["answer"] = results["ground_truth"].apply(lambda x: x["answer"])
     results["gt_files"] = results["ground_truth"].apply(lambda x: x["files"])
     results["gt_lines"] = results["ground_truth"].apply(lambda x: x["lines"])
+    # Rollouts check out exactly the snapshot the questions were written against
+    results["repo"] = repo
+    results["commit"] = sha
     
     # Drop intermediate columns
     results = results.drop(columns=["file", "ground_truth_raw", "ground_truth"])
@@ -2,22 +2,32 @@ import json
 import time
 import base64
 import os
+import asyncio
 from pathlib import Path
 from datetime import datetime
 
+from src.capture_policy import CapturePolicy
+from src.fs_archive import ARCHIVE_NAME, tar_bytes_to_zip
+from src import tracing
+
 # Default output to sandbox-viewer's debug_output directory
 DEFAULT_OUTPUT_DIR = Path(__file__).parent.parent.parent / "sandbox-viewer" / "debug_output"
 
 
 class DebugSandboxClient:
-    def __init__(self, client, output_dir=None, workspace="/root"):
+    def __init__(self, client, output_dir=None, workspace="/root", policy: CapturePolicy = None, usage=None):
         if output_dir is None:
             output_dir = os.environ.get("DEBUG_OUTPUT_DIR", str(DEFAULT_OUTPUT_DIR))
         self._client = client
         self._output_dir = Path(output_dir)
         self._workspace = workspace
+        self._policy = policy or CapturePolicy()
+        # UsageTracker, so the metadata's totals include the capture below
+        self._usage = usage
         # Per-sandbox state to handle parallel rollouts
         self._sandbox_state = {}
+        # Captured rollouts already deleted but not yet scored (reward arrives after cleanup)
+        self._awaiting_reward = {}
 
     def set_context(
         self,
@@ -26,59 +36,85 @@ class DebugSandboxClient:
         sandbox_id: str,
         question: str = None,
         answer: str = None,
-        tools: list = None
+        tools: list = None,
+        setup_retries: int = 0
     ):
         started_at = datetime.now().isoformat()
 
         # Structure: debug_output/runs/{run_id}/rollouts/{rollout_id}/
         run_dir = self._output_dir / "runs" / run_id
         rollout_dir = run_dir / "rollouts" / rollout_id
-        rollout_dir.mkdir(parents=True, exist_ok=True)
 
         # Store per-sandbox state
-        self._sandbox_state[sandbox_id] = {
+        state = {
             "run_id": run_id,
             "rollout_id": rollout_id,
             "sandbox_id": sandbox_id,
             "started_at": started_at,
             "command_count": 0,
+            "run_dir": run_dir,
             "rollout_dir": rollout_dir,
             "log_file": rollout_dir / "commands.jsonl",
-            "tar_file": rollout_dir / "filesystem.tar.gz",
+            "archive_file": rollout_dir / ARCHIVE_NAME,
             "question": question,
             "answer": answer,
             "tools": tools,
+            # True: write to disk as we go, None: buffer until decided, False: drop
+            "capture": self._policy.decide_at_setup(run_id, rollout_id),
+            "decided": asyncio.Event(),
+            "entries": [],
+            "had_error": setup_retries > 0,
         }
+        self._sandbox_state[sandbox_id] = state
+        if state["capture"] is not None:
+            state["decided"].set()
+        if state["capture"]:
+            self._open_capture(state)
+
+    def _open_capture(self, state: dict):
+        """Create the rollout directory and write its initial metadata."""
+        state["rollout_dir"].mkdir(parents=True, exist_ok=True)
 
         # Write rollout metadata immediately (will be updated in delete with finished_at)
-        rollout_metadata = {
-            "run_id": run_id,
-            "rollout_id": rollout_id,
-            "sandbox_id": sandbox_id,
-            "started_at": started_at,
-            "finished_at": None,
-            "commands_count": 0,
-            "question": question,
-            "answer": answer,
-            "tools": tools,
-            "reward": None
-        }
-        metadata_file = rollout_dir / "metadata.json"
-        metadata_file.write_text(json.dumps(rollout_metadata, indent=2))
+        self._write_metadata(state, finished_at=None)
 
         # Write/update run metadata
-        run_metadata_file = run_dir / "metadata.json"
+        run_metadata_file = state["run_dir"] / "metadata.json"
         if run_metadata_file.exists():
             run_metadata = json.loads(run_metadata_file.read_text())
             run_metadata["rollout_count"] = run_metadata["rollout_count"] + 1
         else:
             run_metadata = {
-                "run_id": run_id,
-                "started_at": started_at,
+                "run_id": state["run_id"],
+                "started_at": state["started_at"],
                 "rollout_count": 1
             }
         run_metadata_file.write_text(json.dumps(run_metadata, indent=2))
 
+        # Flush anything buffered while the decision was pending
+        if state["entries"]:
+            with open(state["log_file"], "a") as f:
+                f.writelines(json.dumps(entry) + "\n" for entry in state["entries"])
+            state["entries"] = []
+
+    def _write_metadata(self, state: dict, finished_at: str = None):
+        rollout_metadata = {
+            "run_id": state["run_id"],
+            "rollout_id": state["rollout_id"],
+            "sandbox_id": state["sandbox_id"],
+            "started_at": state["started_at"],
+            "finished_at": finished_at,
+            "commands_count": state["command_count"],
+            "question": state.get("question"),
+            "answer": state.get("answer"),
+            "tools": state.get("tools"),
+            "reward": state.get("reward"),
+            "usage": state.get("usage"),
+            "tarball_bytes": state.get("tarball_bytes")
+        }
+        metadata_file = state["rollout_dir"] / "metadata.json"
+        metadata_file.write_text(json.dumps(rollout_metadata, indent=2))
+
     async def execute_command(self, sandbox_id: str, command: str, **kwargs):
         start = time.perf_counter()
         try:
@@ -89,6 +125,10 @@ class DebugSandboxClient:
             self._log(sandbox_id, command, "", "", time.perf_counter() - start, str(e))
             raise
 
+    def log_local_command(self, sandbox_id: str, command: str, stdout: str):
+        """Log a command answered locally (e.g. from the tree snapshot) without a sandbox round-trip."""
+        self._log(sandbox_id, f"[local] {command}", stdout, "", 0.0)
+
     def set_turn_context(self, sandbox_id: str, turn: int, tool_call_id: str, tool_name: str = None, tool_args: dict = None):
         """Set the current turn context for command logging."""
         state = self._sandbox_state.get(sandbox_id)
@@ -102,6 +142,10 @@ class DebugSandboxClient:
         state = self._sandbox_state.get(sandbox_id)
         if not state:
             return
+        if error:
+            state["had_error"] = True
+        if state["capture"] is False:
+            return
         state["command_count"] += 1
         # Store the log entry so we can update it with tool_response later
         entry = {
@@ -118,6 +162,9 @@ class DebugSandboxClient:
             "tool_response": None
         }
         state["last_entry"] = entry
+        if state["capture"] is None:
+            state["entries"].append(entry)
+            return
         with open(state["log_file"], "a") as f:
             f.write(json.dumps(entry) + "\n")
 
@@ -127,11 +174,62 @@ class DebugSandboxClient:
         if state:
             state["reward"] = reward
 
+    def set_usage(self, sandbox_id: str, usage: dict):
+        """Attach the rollout's byte/token accounting to its metadata."""
+        state = self._sandbox_state.get(sandbox_id)
+        if state:
+            state["usage"] = usage
+
+    def settle_all(self):
+        """Decide every rollout still waiting for a reward as if none will come (e.g. at teardown)."""
+        for sandbox_id, state in list(self._sandbox_state.items()):
+            if not state["decided"].is_set():
+                self.finalize(sandbox_id, state.get("reward"))
+
+    def flush_awaiting_reward(self):
+        """Write the metadata of captured rollouts whose reward never arrived."""
+        for state in self._awaiting_reward.values():
+            self._write_metadata(state, finished_at=state["finished_at"])
+        self._awaiting_reward.clear()
+
+    def finalize(self, sandbox_id: str, reward: float = None, had_error: bool = False):
+        """Record the final reward and settle any capture decision deferred at setup."""
+        finished = self._awaiting_reward.pop(sandbox_id, None)
+        if finished:
+            finished["reward"] = reward
+            self._write_metadata(finished, finished_at=finished["finished_at"])
+            return
+        state = self._sandbox_state.get(sandbox_id)
+        if not state:
+            return
+        state["reward"] = reward
+        state["finalized"] = True
+        if state["capture"] is None:
+            state["capture"] = self._policy.decide_at_reward(
+                state["run_id"], reward, had_error or state["had_error"]
+            )
+            if not state["capture"]:
+                state["entries"] = []
+        state["decided"].set()
+
+    async def wait_for_decision(self, sandbox_id: str):
+        """Block until the rollout's capture decision is made (or the policy times out)."""
+        state = self._sandbox_state.get(sandbox_id)
+        if not state or state["decided"].is_set():
+            return
+        try:
+            await asyncio.wait_for(state["decided"].wait(), self._policy.decision_timeout)
+        except asyncio.TimeoutError:
+            pass
+
     def log_tool_response(self, sandbox_id: str, response: str):
         """Log the tool's return value (what gets sent back to the LLM)."""
         state = self._sandbox_state.get(sandbox_id)
         if not state or "last_entry" not in state:
             return
+        if state["capture"] is not True:
+            state["last_entry"]["tool_response"] = response
+            return
         # Update the last log entry with the tool response
         # We need to rewrite the file to update the last line
         log_file = state["log_file"]
@@ -146,37 +244,46 @@ class DebugSandboxClient:
 
     async def delete(self, sandbox_id, **kwargs):
         state = self._sandbox_state.get(sandbox_id)
+        if state and state["capture"] is None:
+            # Reward never arrived in time: nothing asked for this rollout, drop it
+            state["capture"] = False
+        if state and not state["capture"]:
+            del self._sandbox_state[sandbox_id]
+            state = None
+        elif state and not state["rollout_dir"].exists():
+            self._open_capture(state)
 
         # Only capture filesystem if we have state for this sandbox
         if state:
             try:
                 # Capture from the sandbox's working directory (where vscode is cloned)
-                result = await self._client.execute_command(
-                    sandbox_id, "tar -czf - . 2>/dev/null | base64 -w0"
-                )
+                with tracing.span("capture_filesystem", rollout=state["rollout_id"]):
+                    result = await self._client.execute_command(
+                        sandbox_id, "tar -czf - . 2>/dev/null | base64 -w0"
+                    )
                 if result.stdout:
-                    state["tar_file"].write_bytes(base64.b64decode(result.stdout))
+                    # tar.gz is smallest on the wire; store it as a seekable zip (off the event loop)
+                    tarball = await asyncio.to_thread(base64.b64decode, result.stdout)
+                    state["tarball_bytes"] = len(tarball)
+                    await asyncio.to_thread(tar_bytes_to_zip, tarball, state["archive_file"])
             except:
                 pass
 
             # Write rollout metadata
-            rollout_metadata = {
-                "run_id": state["run_id"],
-                "rollout_id": state["rollout_id"],
-                "sandbox_id": state["sandbox_id"],
-                "started_at": state["started_at"],
-                "finished_at": datetime.now().isoformat(),
-                "commands_count": state["command_count"],
-                "question": state.get("question"),
-                "answer": state.get("answer"),
-                "tools": state.get("tools"),
-                "reward": state.get("reward")
-            }
-            metadata_file = state["rollout_dir"] / "metadata.json"
-            metadata_file.write_text(json.dumps(rollout_metadata, indent=2))
+            if self._usage is not None:
+                state["usage"] = self._usage.snapshot(sandbox_id) or state.get("usage")
+            state["finished_at"] = datetime.now().isoformat()
+            self._write_metadata(state, finished_at=state["finished_at"])
 
             # Clean up state
             del self._sandbox_state[sandbox_id]
+            if state["decided"].is_set() and state.get("reward") is None and not state.get("finalized"):
+                state.pop("last_entry", None)
+                self._awaiting_reward[sandbox_id] = state
+                # Metadata is already written without a reward; stop waiting for one eventually
+                asyncio.get_running_loop().call_later(
+                    self._policy.decision_timeout, self._awaiting_reward.pop, sandbox_id, None
+                )
 
         return await self._client.delete(sandbox_id, **kwargs)
 
@@ -0,0 +1,234 @@
+"""Seekable filesystem captures.
+
+DebugSandboxClient used to store each rollout's filesystem as
+filesystem.tar.gz, which has to be gunzipped and scanned end to end to list
+it or pull out one file. Captures are now written as filesystem.zip: every
+file is deflated on its own and the central directory at the end of the
+archive indexes them, so listing reads only the index and extracting a file
+reads only that file's compressed bytes. The sandbox still sends a tar.gz
+(smallest on the wire); it is converted on the way to disk.
+
+Usage:
+    python -m src.fs_archive convert [DEBUG_OUTPUT_DIR] [--keep]   # upgrade old captures
+    python -m src.fs_archive ls filesystem.zip [DIR]
+    python -m src.fs_archive cat filesystem.zip vscode/package.json
+"""
+
+import argparse
+import calendar
+import io
+import posixpath
+import shutil
+import stat
+import sys
+import tarfile
+import time
+import zipfile
+from pathlib import Path
+
+ARCHIVE_NAME = "filesystem.zip"
+LEGACY_NAME = "filesystem.tar.gz"
+
+MAX_SYMLINK_HOPS = 40
+
+# Files that rarely compress get stored as-is
+_STORED_SUFFIXES = {".png", ".jpg", ".jpeg", ".gif", ".webp", ".gz", ".zip", ".zst", ".woff", ".woff2"}
+
+
+def _normalize(name: str) -> str:
+    while name.startswith("./"):
+        name = name[2:]
+    return name.lstrip("/")
+
+
+def tar_to_zip(src, dest: str | Path):
+    """Rewrite a tar.gz (path or file object) as a zip; members are streamed, not buffered."""
+    dest = Path(dest)
+    tmp = dest.with_suffix(".zip.tmp")
+    with tarfile.open(src, "r:gz") if isinstance(src, (str, Path)) else tarfile.open(fileobj=src, mode="r:gz") as tar, \
+            zipfile.ZipFile(tmp, "w", zipfile.ZIP_DEFLATED, compresslevel=6) as zf:
+        for member in tar:
+            name = _normalize(member.name)
+            if not name or name == ".":
+                continue
+            mtime = time.gmtime(max(member.mtime, 315532800))[:6]  # zip can't go before 1980
+            if member.isdir():
+                info = zipfile.ZipInfo(name.rstrip("/") + "/", mtime)
+                info.external_attr = (stat.S_IFDIR | member.mode) << 16 | 0x10
+                zf.writestr(info, b"")
+            elif member.issym():
+                info = zipfile.ZipInfo(name, mtime)
+                info.external_attr = (stat.S_IFLNK | 0o777) << 16
+                zf.writestr(info, member.linkname.encode())
+            elif member.isfile() or member.islnk():
+                if member.islnk():
+                    # zip has no hard links: store another copy of the target's contents
+                    try:
+                        member = tar.getmember(member.linkname)
+                    except KeyError:
+                        continue
+                info = zipfile.ZipInfo(name, mtime)
+                info.external_attr = (stat.S_IFREG | member.mode) << 16
+                info.file_size = member.size
+                if Path(name).suffix.lower() in _STORED_SUFFIXES:
+                    info.compress_type = zipfile.ZIP_STORED
+                else:
+                    info.compress_type = zipfile.ZIP_DEFLATED
+                with tar.extractfile(member) as fsrc, zf.open(info, "w", force_zip64=member.size > 2**31) as fdst:
+                    shutil.copyfileobj(fsrc, fdst, 1 << 20)
+    tmp.replace(dest)
+    return dest
+
+
+def tar_bytes_to_zip(data: bytes, dest: str | Path):
+    return tar_to_zip(io.BytesIO(data), dest)
+
+
+class Entry:
+    __slots__ = ("path", "type", "size", "mode", "mtime", "compressed_size")
+
+    def __init__(self, info: zipfile.ZipInfo):
+        mode = info.external_attr >> 16
+        self.path = info.filename.rstrip("/")
+        if info.is_dir():
+            self.type = "directory"
+        elif stat.S_ISLNK(mode):
+            self.type = "symlink"
+        else:
+            self.type = "file"
+        self.size = info.file_size
+        self.compressed_size = info.compress_size
+        self.mode = stat.S_IMODE(mode)
+        self.mtime = calendar.timegm(info.date_time)  # written from the tar's UTC mtime
+
+    def __repr__(self):
+        return f"Entry({self.path!r}, {self.type}, size={self.size})"
+
+
+class CaptureArchive:
+    """Read-only view of a filesystem capture, backed by the zip central directory."""
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self._zip = zipfile.ZipFile(self.path)
+        self._infos = {info.filename.rstrip("/"): info for info in self._zip.infolist()}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._zip.close()
+
+    def entries(self) -> list[Entry]:
+        """Every file, directory and symlink, from the index alone."""
+        return [Entry(info) for info in self._infos.values()]
+
+    def listdir(self, directory: str = "") -> list[Entry]:
+        """Direct children of `directory` (implicit parent directories included)."""
+        prefix = _normalize(directory).rstrip("/")
+        prefix = prefix + "/" if prefix else ""
+        children: dict[str, Entry | None] = {}
+        for name, info in self._infos.items():
+            if not name.startswith(prefix) or name == prefix.rstrip("/"):
+                continue
+            head, sep, _ = name[len(prefix):].partition("/")
+            if sep:
+                children.setdefault(head, None)
+            else:
+                children[head] = Entry(info)
+        return [entry or _implicit_dir(prefix + name) for name, entry in sorted(children.items())]
+
+    def stat(self, path: str) -> Entry | None:
+        info = self._infos.get(_normalize(path).rstrip("/"))
+        return Entry(info) if info else None
+
+    def readlink(self, path: str) -> str:
+        info = self._infos.get(_normalize(path).rstrip("/"))
+        if info is None or not stat.S_ISLNK(info.external_attr >> 16):
+            raise OSError(f"not a symlink: {path}")
+        return self._zip.read(info).decode()
+
+    def _resolve(self, path: str) -> zipfile.ZipInfo:
+        """The file member `path` names, following symlinks that stay inside the archive."""
+        name = _normalize(path).rstrip("/")
+        for _ in range(MAX_SYMLINK_HOPS):
+            info = self._infos.get(name)
+            if info is None or info.is_dir():
+                raise FileNotFoundError(path)
+            if not stat.S_ISLNK(info.external_attr >> 16):
+                return info
+            target = self._zip.read(info).decode()
+            if target.startswith("/"):
+                # Absolute links point into the sandbox, not into the capture
+                raise FileNotFoundError(f"{path} -> {target}")
+            name = posixpath.normpath(posixpath.join(posixpath.dirname(name), target))
+            if name == ".." or name.startswith("../"):
+                raise FileNotFoundError(f"{path} -> {target}")
+        raise OSError(f"too many levels of symbolic links: {path}")
+
+    def read(self, path: str) -> bytes:
+        """Contents of one file (or a symlink's target); reads only that member's bytes."""
+        return self._zip.read(self._resolve(path))
+
+    def open(self, path: str):
+        return self._zip.open(self._resolve(path))
+
+
+def _implicit_dir(path: str) -> Entry:
+    entry = Entry.__new__(Entry)
+    entry.path, entry.type, entry.size, entry.compressed_size, entry.mode, entry.mtime = path, "directory", 0, 0, 0o755, 0
+    return entry
+
+
+def convert_tree(root: str | Path, keep: bool = False) -> int:
+    """Upgrade every filesystem.tar.gz under `root` to filesystem.zip."""
+    converted = 0
+    for legacy in sorted(Path(root).rglob(LEGACY_NAME)):
+        dest = legacy.with_name(ARCHIVE_NAME)
+        if not dest.exists():
+            try:
+                tar_to_zip(legacy, dest)
+            except (tarfile.TarError, OSError, EOFError) as e:
+                print(f"skip {legacy}: {e}", file=sys.stderr)
+                continue
+            converted += 1
+            print(f"{legacy} -> {dest.name} ({legacy.stat().st_size:,} -> {dest.stat().st_size:,} bytes)")
+        if not keep:
+            legacy.unlink()
+    return converted
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("convert", help="Convert filesystem.tar.gz captures to filesystem.zip")
+    p.add_argument("root", nargs="?", default=None)
+    p.add_argument("--keep", action="store_true", help="Keep the original tar.gz")
+    p = sub.add_parser("ls", help="List a directory from the index")
+    p.add_argument("archive")
+    p.add_argument("dir", nargs="?", default="")
+    p = sub.add_parser("cat", help="Print one file")
+    p.add_argument("archive")
+    p.add_argument("path")
+    args = parser.parse_args()
+
+    if args.cmd == "convert":
+        if args.root is None:
+            from src.debug_wrapper import DEFAULT_OUTPUT_DIR
+            args.root = DEFAULT_OUTPUT_DIR
+        print(f"converted {convert_tree(args.root, keep=args.keep)} captures")
+    elif args.cmd == "ls":
+        with CaptureArchive(args.archive) as archive:
+            for entry in archive.listdir(args.dir):
+                suffix = "/" if entry.type == "directory" else ""
+                print(f"{entry.size:>10}  {entry.path.rsplit('/', 1)[-1]}{suffix}")
+    else:
+        with CaptureArchive(args.archive) as archive:
+            sys.stdout.buffer.write(archive.read(args.path))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""Event-loop lag watchdog and sampling profiler.
+
+Every rollout in a worker shares one asyncio loop, so one blocking call
+(a large synchronous file write, decoding a tarball) stalls all of them.
+
+LoopMonitor runs a heartbeat task on the loop and a watchdog thread beside
+it. When the heartbeat is late by more than `threshold` seconds the
+watchdog logs the loop thread's current stack (the code that is blocking),
+once per stall, and every lag sample goes to the loop_lag histogram.
+
+SamplingProfiler samples the loop thread's stack from a thread and writes
+collapsed stacks (flamegraph.pl / speedscope input) every N rollouts. It is
+off unless enabled:
+
+    SWE_GREP_PROFILE=/tmp/profiles SWE_GREP_PROFILE_EVERY=100   # from startup
+    kill -USR1 <pid>                                            # toggle at runtime
+"""
+
+import asyncio
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from pathlib import Path
+
+logger = logging.getLogger("SweGrepEnv.loop")
+
+
+class LoopMonitor:
+    def __init__(self, threshold: float = 0.25, interval: float = 0.05, on_lag=None):
+        """
+        Args:
+            threshold: Heartbeat lateness (seconds) that counts as a stall and dumps the stack
+            interval: Heartbeat period
+            on_lag: Called with every measured lag in seconds (e.g. a histogram)
+        """
+        self.threshold = threshold
+        self.interval = interval
+        self.on_lag = on_lag
+        self.stalls = 0
+        self.max_lag = 0.0
+        self._beat = 0.0
+        self._reported = False
+        self._loop_thread = None
+        self._task: asyncio.Task | None = None
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self):
+        """Start on the running loop; safe to call repeatedly."""
+        if self._task is not None and not self._task.done():
+            return
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._task = asyncio.get_running_loop().create_task(self._heartbeat())
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _heartbeat(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(now - expected, 0.0)
+            self._beat = now
+            if self.on_lag is not None:
+                self.on_lag(lag)
+            if lag > self.threshold:
+                self.stalls += 1
+                self.max_lag = max(self.max_lag, lag)
+                logger.warning(f"[LOOP] event loop blocked for {lag * 1000:.0f}ms")
+            self._reported = False
+
+    def _watch(self):
+        while not self._stop.wait(self.interval):
+            late = time.monotonic() - self._beat - self.interval
+            if late <= self.threshold or self._reported:
+                continue
+            self._reported = True
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            stack = "".join(traceback.format_stack(frame))
+            logger.warning(f"[LOOP] event loop blocked for {late * 1000:.0f}ms so far, in:\n{stack}")
+
+
+def _collapse(frame) -> str:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class SamplingProfiler:
+    def __init__(self, out_dir: str | None = None, every: int = 100, interval: float = 0.005):
+        """
+        Args:
+            out_dir: Where collapsed-stack files go; profiling starts immediately when set
+            every: Dump (and reset) the samples after this many rollouts
+            interval: Seconds between stack samples
+        """
+        self.out_dir = Path(out_dir or os.environ.get("SWE_GREP_PROFILE", "/tmp/swe-grep-profiles"))
+        self.every = every
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self.rollouts = 0
+        self._dumps = 0
+        self._target = None
+        self._running = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._autostart = out_dir is not None
+
+    @classmethod
+    def from_env(cls) -> "SamplingProfiler":
+        return cls(os.environ.get("SWE_GREP_PROFILE"), int(os.environ.get("SWE_GREP_PROFILE_EVERY", "100")))
+
+    @property
+    def enabled(self) -> bool:
+        return self._running.is_set()
+
+    def install(self):
+        """Attach to the running loop's thread; SIGUSR1 toggles sampling."""
+        if self._target is not None:
+            return
+        self._target = threading.get_ident()
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGUSR1, self.toggle)
+        except (NotImplementedError, RuntimeError, ValueError):
+            pass
+        if self._autostart:
+            self.start()
+
+    def toggle(self):
+        if self.enabled:
+            self.stop()
+            self.dump()
+        else:
+            self.start()
+
+    def start(self):
+        if self.enabled:
+            return
+        self._running.set()
+        self._thread = threading.Thread(target=self._sample, name="loop-profiler", daemon=True)
+        self._thread.start()
+        logger.info(f"[PROFILE] sampling every {self.interval * 1000:.0f}ms, dumping every {self.every} rollouts to {self.out_dir}")
+
+    def stop(self):
+        self._running.clear()
+
+    def _sample(self):
+        while self._running.is_set():
+            frame = sys._current_frames().get(self._target)
+            if frame is not None:
+                self.samples[_collapse(frame)] += 1
+            time.sleep(self.interval)
+
+    def rollout_done(self):
+        if not self.enabled:
+            return
+        self.rollouts += 1
+        if self.rollouts % self.every == 0:
+            self.dump()
+
+    def dump(self) -> Path | None:
+        """Write samples since the last dump as `stack count` lines and start over."""
+        samples, self.samples = self.samples, Counter()
+        if not samples:
+            return None
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        self._dumps += 1
+        path = self.out_dir / f"profile-{os.getpid()}-{self._dumps:04d}.collapsed"
+        path.write_text("".join(f"{stack} {count}\n" for stack, count in samples.most_common()))
+        logger.info(f"[PROFILE] {sum(samples.values())} samples over {self.rollouts} rollouts -> {path}")
+        return path
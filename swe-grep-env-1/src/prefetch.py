@@ -0,0 +1,218 @@
+"""Speculative prefetch of grep hits for read_file.
+
+Models almost always follow a grep_tool call with read_file on one of the
+matched files, a full model turn later. While the model is thinking we pull
+the regions around the top matches into memory so that read_file can be
+answered without a sandbox round-trip.
+"""
+
+import asyncio
+import logging
+import os
+import re
+import shlex
+import uuid
+
+from src import accounting
+
+logger = logging.getLogger("SweGrepEnv.prefetch")
+
+# `rg -n` prints `path:line:text` for matches and `path-line-text` for context.
+# Either separator can also appear in a path or in the text, so each one is a candidate split
+_SEP_RE = re.compile(r":(\d+):|-(\d+)-")
+# Grouped output (src/rg_format.py): a path header, then `line:text` / `line-text`
+_GROUPED_MATCH_RE = re.compile(r"^(\d+):")
+
+
+def _splits(line: str) -> list[tuple[str, int, bool]]:
+    """Every (path, line number, is_match) reading of one `rg -n` line, shortest path first."""
+    return [
+        (line[:m.start()], int(m.group(1) or m.group(2)), m.group(1) is not None)
+        for m in _SEP_RE.finditer(line)
+        if m.start()
+    ]
+
+
+def parse_grep_hits(output: str, top_n: int) -> list[tuple[str, list[int]]]:
+    """Top `top_n` matched files (in output order) with their match line numbers."""
+    lines = [_splits(line) for line in output.split("\n")]
+    hits: dict[str, list[int]] = {}
+    for i, splits in enumerate(lines):
+        # Adjacent lines of one file share its path, and only its path: anything
+        # longer would include the line number. A line with no such neighbour
+        # has no context around it, so it is a match.
+        neighbours = {path for j in (i - 1, i + 1) if 0 <= j < len(lines) for path, _, _ in lines[j]}
+        shared = [split for split in splits if split[0] in neighbours]
+        if shared:
+            path, line_number, is_match = shared[-1]
+        else:
+            path, line_number, is_match = next((split for split in splits if split[2]), (None, 0, False))
+        if not is_match:
+            continue
+        if path not in hits:
+            if len(hits) >= top_n:
+                continue
+            hits[path] = []
+        hits[path].append(line_number)
+    return list(hits.items())
+
+
+def parse_grouped_hits(output: str, top_n: int) -> list[tuple[str, list[int]]]:
+    """parse_grep_hits for rg_format's grouped output."""
+    hits: dict[str, list[int]] = {}
+    path, at_header = None, True
+    for line in output.split("\n"):
+        if not line:
+            at_header = True
+            continue
+        if at_header:
+            path, at_header = line, False
+            continue
+        m = _GROUPED_MATCH_RE.match(line)
+        if not m:
+            continue
+        if path not in hits:
+            if len(hits) >= top_n:
+                break
+            hits[path] = []
+        hits[path].append(int(m.group(1)))
+    return list(hits.items())
+
+
+class _Region:
+    __slots__ = ("start", "lines", "eof", "newline_at_eof", "nbytes", "hit")
+
+    def __init__(self, start: int, lines: list[str], eof: bool, newline_at_eof: bool, nbytes: int):
+        self.start = start
+        self.lines = lines
+        self.eof = eof
+        self.newline_at_eof = newline_at_eof
+        self.nbytes = nbytes
+        self.hit = False
+
+
+class _RolloutPrefetch:
+    def __init__(self, budget: int):
+        self.budget = budget
+        self.regions: dict[str, _Region] = {}
+        self.pending: dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.bytes_fetched = 0
+
+
+class GrepPrefetcher:
+    def __init__(
+        self,
+        client,
+        top_n: int = 3,
+        lines_before: int = 50,
+        window_lines: int = 200,
+        max_bytes_per_file: int = 32_000,
+        max_bytes_per_rollout: int = 256_000,
+    ):
+        self._client = client
+        self.top_n = top_n
+        self.lines_before = lines_before
+        self.window_lines = window_lines
+        self.max_bytes_per_file = max_bytes_per_file
+        self.max_bytes_per_rollout = max_bytes_per_rollout
+        self._rollouts: dict[str, _RolloutPrefetch] = {}
+
+    def _rollout(self, sandbox_id: str) -> _RolloutPrefetch:
+        rollout = self._rollouts.get(sandbox_id)
+        if rollout is None:
+            rollout = _RolloutPrefetch(self.max_bytes_per_rollout)
+            self._rollouts[sandbox_id] = rollout
+        return rollout
+
+    def schedule(self, sandbox_id: str, grep_output: str, grouped: bool = False):
+        """Start fetching the top matched files of a grep_tool result in the background."""
+        rollout = self._rollout(sandbox_id)
+        wanted = []
+        parse = parse_grouped_hits if grouped else parse_grep_hits
+        for path, match_lines in parse(grep_output, self.top_n):
+            key = os.path.normpath(path)
+            if key in rollout.regions or key in rollout.pending:
+                continue
+            start = max(1, min(match_lines) - self.lines_before)
+            wanted.append((key, start, start + self.window_lines - 1))
+        if not wanted or rollout.budget <= 0:
+            return
+        task = asyncio.create_task(self._fetch(sandbox_id, rollout, wanted))
+        for key, _, _ in wanted:
+            rollout.pending[key] = task
+
+    async def _fetch(self, sandbox_id: str, rollout: _RolloutPrefetch, wanted: list[tuple[str, int, int]]):
+        accounting.set_label("prefetch")
+        per_file = max(1, min(self.max_bytes_per_file, rollout.budget // len(wanted)))
+        marker = f"__prefetch_{uuid.uuid4().hex}__"
+        parts = []
+        for key, start, end in wanted:
+            q = shlex.quote(key)
+            parts.append(f"echo {marker}; sed -n '{start},{end}p;{end}q' {q} 2>/dev/null | head -c {per_file}")
+        try:
+            result = await self._client.execute_command(sandbox_id, "; ".join(parts))
+            chunks = (result.stdout or "").split(marker + "\n")[1:]
+            for (key, start, end), chunk in zip(wanted, chunks):
+                nbytes = len(chunk.encode())
+                rollout.bytes_fetched += nbytes
+                rollout.budget -= nbytes
+                if not chunk:
+                    continue  # missing file or past EOF; let read_file report it
+                truncated = nbytes >= per_file
+                newline = chunk.endswith("\n")
+                lines = chunk.split("\n")
+                if newline or truncated:
+                    lines.pop()  # trailing newline, or a partial line cut by head -c
+                complete = not truncated and (not newline or len(lines) < end - start + 1)
+                rollout.regions[key] = _Region(start, lines, complete, newline, nbytes)
+        except Exception as e:
+            logger.debug(f"prefetch failed for {sandbox_id}: {str(e)[:100]}")
+        finally:
+            for key, _, _ in wanted:
+                rollout.pending.pop(key, None)
+
+    async def lookup(self, sandbox_id: str, file_path: str, start_line: int, end_line: int) -> str | None:
+        """Return `sed -n 'start_line,end_line p'` output if it is fully prefetched, else None."""
+        rollout = self._rollouts.get(sandbox_id)
+        if rollout is None:
+            return None
+        key = os.path.normpath(file_path)
+        task = rollout.pending.get(key)
+        if task is not None:
+            try:
+                await asyncio.shield(task)
+            except asyncio.CancelledError:
+                return None
+        region = rollout.regions.get(key)
+        if region is None or start_line < region.start:
+            rollout.misses += 1
+            return None
+        region_end = region.start + len(region.lines) - 1
+        if end_line > region_end and not region.eof:
+            rollout.misses += 1
+            return None
+        rollout.hits += 1
+        region.hit = True
+        lines = region.lines[start_line - region.start:end_line - region.start + 1]
+        if not lines:
+            return ""
+        at_eof = region.eof and end_line >= region_end
+        return "\n".join(lines) + ("" if at_eof and not region.newline_at_eof else "\n")
+
+    def release(self, sandbox_id: str) -> dict | None:
+        """Cancel outstanding fetches and return the rollout's prefetch stats."""
+        rollout = self._rollouts.pop(sandbox_id, None)
+        if rollout is None:
+            return None
+        for task in set(rollout.pending.values()):
+            task.cancel()
+        lookups = rollout.hits + rollout.misses
+        return {
+            "hits": rollout.hits,
+            "misses": rollout.misses,
+            "hit_rate": rollout.hits / lookups if lookups else 0.0,
+            "bytes_fetched": rollout.bytes_fetched,
+            "bytes_wasted": sum(r.nbytes for r in rollout.regions.values() if not r.hit),
+        }
@@ -0,0 +1,48 @@
+"""Telling a live process apart from a dead one whose pid was reused.
+
+Files that outlive their writer (teardown journals, shared metric slots)
+record the owner's pid together with its start time. A pid alone is not
+enough: a restarted container usually hands the new process the same pid as
+its predecessor, and an unrelated process can pick up a dead worker's pid.
+"""
+
+import os
+import socket
+
+
+def pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def start_time(pid: int) -> int:
+    """Start time of `pid` in clock ticks since boot (0 if unknown, e.g. not Linux)."""
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as f:
+            stat = f.read()
+    except OSError:
+        return 0
+    # comm (field 2) may hold spaces and parens; starttime is field 22
+    fields = stat[stat.rfind(b")") + 2:].split()
+    try:
+        return int(fields[19])
+    except (IndexError, ValueError):
+        return 0
+
+
+def is_running(pid: int, started: int) -> bool:
+    """Whether the process that was `pid` when it started at `started` is still alive."""
+    if not pid_alive(pid):
+        return False
+    if not started:
+        return True  # no start time recorded or readable: the pid is all we have
+    return start_time(pid) in (started, 0)
+
+
+def hostname() -> str:
+    return socket.gethostname() or "localhost"
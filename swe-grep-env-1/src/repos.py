@@ -0,0 +1,167 @@
+"""Repo registry and node-local git object cache.
+
+Every repo the environment can search is described by a RepoSpec (URL,
+pinned commit, directory inside the sandbox). Instead of every sandbox and
+every data generation run cloning from GitHub, one bare repo per URL lives
+in a node-local cache; each pinned commit is fetched into it once and turned
+into a tarball snapshot that sandboxes and local checkouts are built from.
+That also guarantees rollouts see exactly the commit a dataset row was
+generated from, rather than whatever HEAD was at clone time.
+"""
+
+import fcntl
+import os
+import subprocess
+import tarfile
+from contextlib import contextmanager
+from pathlib import Path
+
+DEFAULT_CACHE_DIR = Path.home() / ".cache" / "swe-grep-env" / "git"
+
+
+class RepoSpec:
+    def __init__(self, name: str, url: str, commit: str | None = None, path: str | None = None):
+        """
+        Args:
+            name: Registry key, stored in dataset rows
+            url: Clone URL
+            commit: Pinned full commit SHA; None pins the remote HEAD once per process
+            path: Directory the repo is unpacked to inside the sandbox
+        """
+        self.name = name
+        self.url = url
+        self.commit = commit
+        self.path = path or name
+
+    def __repr__(self):
+        return f"RepoSpec({self.name!r}, {self.url!r}, commit={self.commit!r}, path={self.path!r})"
+
+
+REPOS: dict[str, RepoSpec] = {
+    "vscode": RepoSpec("vscode", "https://github.com/microsoft/vscode.git"),
+}
+DEFAULT_REPO = "vscode"
+
+
+def register_repos(config: dict[str, dict]):
+    """Add or override registry entries, e.g. {"vscode": {"url": ..., "commit": "abc123"}}."""
+    for name, fields in config.items():
+        current = REPOS.get(name)
+        REPOS[name] = RepoSpec(
+            name,
+            fields.get("url", current.url if current else None),
+            fields.get("commit", current.commit if current else None),
+            fields.get("path", current.path if current else None),
+        )
+
+
+def _git(*args, cwd: Path | None = None) -> str:
+    return subprocess.run(
+        ["git", *args], cwd=cwd, capture_output=True, text=True, check=True
+    ).stdout.strip()
+
+
+@contextmanager
+def _file_lock(path: Path):
+    """Serialize cache updates across env worker processes on the node."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class GitObjectCache:
+    def __init__(self, root: str | Path | None = None):
+        if root is None:
+            root = os.environ.get("SWE_GREP_GIT_CACHE", str(DEFAULT_CACHE_DIR))
+        self.root = Path(root)
+        # Commits resolved from a moving HEAD, pinned for the life of the process
+        self._pinned: dict[str, str] = {}
+
+    def _bare(self, spec: RepoSpec) -> Path:
+        return self.root / f"{spec.name}.git"
+
+    def _has_commit(self, bare: Path, commit: str) -> bool:
+        try:
+            _git("cat-file", "-e", f"{commit}^{{commit}}", cwd=bare)
+            return True
+        except subprocess.CalledProcessError:
+            return False
+
+    def resolve(self, spec: RepoSpec) -> str:
+        """Full SHA of the spec's commit, fetching it into the bare cache if needed."""
+        if spec.commit is None and spec.name in self._pinned:
+            return self._pinned[spec.name]
+        bare = self._bare(spec)
+        with _file_lock(self.root / f"{spec.name}.lock"):
+            # Another thread may have pinned HEAD while this one waited for the lock
+            if spec.commit is None and spec.name in self._pinned:
+                return self._pinned[spec.name]
+            if not bare.exists():
+                _git("init", "--bare", "--quiet", str(bare))
+                _git("remote", "add", "origin", spec.url, cwd=bare)
+            if spec.commit is not None and self._has_commit(bare, spec.commit):
+                return _git("rev-parse", f"{spec.commit}^{{commit}}", cwd=bare)
+            _git("fetch", "--quiet", "--depth", "1", "origin", spec.commit or "HEAD", cwd=bare)
+            sha = _git("rev-parse", "FETCH_HEAD^{commit}", cwd=bare)
+            if spec.commit is None:
+                self._pinned[spec.name] = sha
+        return sha
+
+    def snapshot(self, spec: RepoSpec, sha: str) -> Path:
+        """Tarball of the tree at `sha`, with entries under `spec.path/`."""
+        out = self.root / "snapshots" / f"{spec.name}-{sha}.tar.gz"
+        if out.exists():
+            return out
+        with _file_lock(self.root / f"{spec.name}.lock"):
+            if not out.exists():
+                out.parent.mkdir(parents=True, exist_ok=True)
+                tmp = out.with_suffix(f".tmp{os.getpid()}")
+                _git("archive", "--format=tar.gz", f"--prefix={spec.path}/", f"--output={tmp}", sha,
+                     cwd=self._bare(spec))
+                tmp.rename(out)
+        return out
+
+    def checkout(self, spec: RepoSpec, sha: str, dest: str | Path) -> Path:
+        """Unpack the snapshot into `dest`/`spec.path` for local use (data generation, verification)."""
+        dest = Path(dest)
+        repo_dir = dest / spec.path
+        marker = repo_dir / ".swe-grep-commit"
+        if marker.exists() and marker.read_text().strip() == sha:
+            return repo_dir
+        if repo_dir.exists():
+            raise RuntimeError(f"{repo_dir} exists at a different commit; remove it or choose another dest")
+        with tarfile.open(self.snapshot(spec, sha)) as tar:
+            if hasattr(tarfile, "data_filter"):
+                tar.extractall(dest, filter="data")
+            else:
+                tar.extractall(dest)  # Python without extraction filters (< 3.10.12)
+        marker.write_text(sha + "\n")
+        return repo_dir
+
+
+def sandbox_fetch_command(spec: RepoSpec, sha: str) -> str:
+    """Fallback when the snapshot can't be uploaded: fetch exactly `sha` inside the sandbox.
+
+    .git is dropped afterwards so the tree matches an unpacked snapshot.
+    """
+    import shlex
+
+    p, url = shlex.quote(spec.path), shlex.quote(spec.url)
+    return (
+        f"git init -q {p} && git -C {p} fetch -q --depth 1 {url} {sha} "
+        f"&& git -C {p} checkout -q FETCH_HEAD && rm -rf {p}/.git"
+    )
+
+
+def local_checkout(name: str = DEFAULT_REPO, commit: str | None = None, root: str | Path = "./checkouts") -> tuple[Path, str]:
+    """Checkout of a registered repo at `commit` (or its pinned commit) under `root`/<sha>/; returns (path, sha)."""
+    spec = REPOS[name]
+    if commit is not None:
+        spec = RepoSpec(spec.name, spec.url, commit, spec.path)
+    cache = GitObjectCache()
+    sha = cache.resolve(spec)
+    return cache.checkout(spec, sha, Path(root) / sha[:12]), sha
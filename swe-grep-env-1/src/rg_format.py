@@ -0,0 +1,151 @@
+"""Compact, file-grouped rendering of `rg --json` output.
+
+Runs inside the sandbox as a stdin filter, so the byte budget is enforced
+before anything crosses the wire (stdlib only; the env uploads this file to
+/tmp at setup):
+
+    rg --json -C 2 PATTERN vscode 2>&1 | python3 /tmp/rg_format.py --context 2
+
+Output, one block per file, path printed once:
+
+    vscode/src/vs/base/common/async.ts
+    41-export class Throttler {
+    42:	private activePromise: Promise<any> | null;
+    --
+    97:	queue(promiseFactory: ITask<Promise<T>>): Promise<T> {
+    (+4 more matches)
+
+Overlapping context windows are merged (each line printed once), lines
+longer than --max-line are cut down to a window around the match, and at
+most --max-per-file matches are shown per file. Once --max-bytes is reached
+the filter stops reading, which also stops rg early.
+"""
+
+import argparse
+import base64
+import json
+import sys
+
+REMOTE_PATH = "/tmp/rg_format.py"
+TRUNCATED_NOTE = "[TRUNCATED - output budget reached. Narrow your search with a more specific pattern or file_pattern]"
+
+
+def _text(field: dict) -> str:
+    if "text" in field:
+        return field["text"]
+    return base64.b64decode(field.get("bytes", "")).decode("utf-8", errors="replace")
+
+
+def collapse(line: str, spans: list[tuple[int, int]], max_line: int) -> str:
+    """Shorten a long line to a window around its first match (or drop a long context line).
+
+    `spans` are rg's byte offsets into the line.
+    """
+    if len(line) <= max_line:
+        return line
+    if not spans:
+        return f"[{len(line)} chars]"
+    encoded = line.encode()
+    start = len(encoded[:spans[0][0]].decode(errors="ignore"))
+    end = len(encoded[:spans[0][1]].decode(errors="ignore"))
+    pad = max((max_line - (end - start)) // 2, 20)
+    lo, hi = max(start - pad, 0), min(end + pad, len(line))
+    return f"{'...' if lo else ''}{line[lo:hi]}{'...' if hi < len(line) else ''} [{len(line)} chars]"
+
+
+class FileBlock:
+    def __init__(self, path: str, context: int, max_per_file: int, max_line: int):
+        self.path = path
+        self.context = context
+        self.max_per_file = max_per_file
+        self.max_line = max_line
+        self.lines: list[tuple[int, bool, str]] = []
+        self.pending: list[tuple[int, bool, str]] = []
+        self.shown = 0
+        self.extra = 0
+        self.last_shown = -1
+
+    def add(self, line_number: int, is_match: bool, text: str, spans: list[tuple[int, int]]):
+        entry = (line_number, is_match, collapse(text.rstrip("\r\n"), spans, self.max_line))
+        if not is_match:
+            if self.shown and line_number <= self.last_shown + self.context:
+                self.lines.append(entry)
+            else:
+                self.pending.append(entry)
+            return
+        if self.shown >= self.max_per_file:
+            self.extra += 1
+            self.pending = []
+            return
+        self.lines.extend(e for e in self.pending if e[0] >= line_number - self.context)
+        self.pending = []
+        self.lines.append(entry)
+        self.shown += 1
+        self.last_shown = line_number
+
+    def render(self) -> list[str]:
+        out = [self.path]
+        prev = None
+        for line_number, is_match, text in self.lines:
+            if prev is not None and line_number > prev + 1:
+                out.append("--")
+            out.append(f"{line_number}{':' if is_match else '-'}{text}")
+            prev = line_number
+        if self.extra:
+            out.append(f"(+{self.extra} more matches)")
+        return out
+
+
+def format_stream(stream, context: int = 2, max_bytes: int = 8000, max_per_file: int = 5, max_line: int = 200):
+    """Yield output lines for an `rg --json` stream until the byte budget runs out."""
+    used = 0
+    block = None
+    for raw in stream:
+        try:
+            msg = json.loads(raw)
+        except ValueError:
+            # rg errors (bad regex, unreadable path) arrive on the same pipe as plain text
+            if raw.strip():
+                yield raw.rstrip("\n")
+            continue
+        kind, data = msg.get("type"), msg.get("data", {})
+        if kind == "begin":
+            block = FileBlock(_text(data["path"]), context, max_per_file, max_line)
+        elif kind in ("match", "context") and block is not None:
+            spans = [(s["start"], s["end"]) for s in data.get("submatches", [])]
+            block.add(data["line_number"], kind == "match", _text(data["lines"]), spans)
+        elif kind == "end" and block is not None:
+            lines = block.render()
+            if used:
+                lines.insert(0, "")
+            for line in lines:
+                size = len(line.encode()) + 1
+                if used + size > max_bytes:
+                    yield TRUNCATED_NOTE
+                    return
+                used += size
+                yield line
+            block = None
+
+
+def install_command(dest: str = REMOTE_PATH) -> str:
+    """Shell command that writes this module into the sandbox."""
+    with open(__file__, "rb") as f:
+        source = base64.b64encode(f.read()).decode()
+    return f"echo {source} | base64 -d > {dest}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Group rg --json output by file")
+    parser.add_argument("--context", type=int, default=2)
+    parser.add_argument("--max-bytes", type=int, default=8000)
+    parser.add_argument("--max-per-file", type=int, default=5)
+    parser.add_argument("--max-line", type=int, default=200)
+    args = parser.parse_args()
+    stdin = open(sys.stdin.fileno(), encoding="utf-8", errors="replace", closefd=False)
+    for line in format_stream(stdin, args.context, args.max_bytes, args.max_per_file, args.max_line):
+        sys.stdout.write(line + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,456 @@
+"""Long-lived search daemon for grep_tool, run inside the sandbox.
+
+Every grep_tool call used to start a fresh `rg` pipeline that walks the
+tree and reads files again. This daemon lists the repo once with
+`rg --files` (so rg's ignore rules still apply), loads the text into a few
+large strings in path order, and answers requests on a local TCP port with
+output in the same format as `rg -n [-C N] [-g GLOB]`.
+
+A request is a C-speed `str.find` for a literal every match must contain
+(pulled out of the regex's parse tree), then the regex on each candidate
+line only, so matching is line by line exactly as rg does it. The daemon
+explicitly declines, and the caller runs rg as before, whenever rg would be
+faster or might answer differently: no required literal of 3+ characters,
+case-insensitive search, rg-only syntax, anchors/lookarounds/backrefs,
+path or negated globs, paths outside the root, a repo larger than
+--max-memory, or while the text is still loading.
+
+The client is pure bash (/dev/tcp), so a tool call is one short request
+instead of a process pipeline. Stdlib only; the env uploads and starts it
+during setup:
+
+    python3 /tmp/rg_server.py --root vscode --port 7777
+"""
+
+import argparse
+import base64
+import bisect
+import fnmatch
+import json
+import os
+import re
+import shlex
+import shutil
+import socketserver
+import subprocess
+import sys
+import threading
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+REMOTE_PATH = "/tmp/rg_server.py"
+DEFAULT_PORT = 7777
+DEFAULT_MAX_MEMORY = 128 << 20
+OK = "__RG_OK__"
+FALLBACK = "__RG_FALLBACK__"
+MAX_FILESIZE = 100 * 1024  # rg --max-filesize 100K
+MIN_LITERAL = 3
+SAMPLE_CHARS, SAMPLE_SLICE = 1 << 20, 4096
+SEGMENT_CHARS = 16 << 20  # bounds the extra memory held while joining a segment
+_META = set(".^$*+?{}[]\\|()")
+# Syntax Python's re doesn't support or reads differently from rg's regex crate
+_RG_ONLY = re.compile(r"\\[pPz]|\(\?<[^=!]|\(\?[^:=!<imsxP-]|\[\[:|\\x\{|[*+?}]\+")
+# The only unescaped `{` rg accepts outside a class; Python's re reads any other as a literal
+_COUNTED_REPEAT = re.compile(r"\{\d+(?:,\d*)?\}")
+# Parse-tree nodes that make per-line matching differ from rg (or that rg rejects)
+_UNSUPPORTED_OPS = {"ASSERT", "ASSERT_NOT", "GROUPREF", "GROUPREF_EXISTS", "GROUPREF_IGNORE", "ATOMIC_GROUP", "POSSESSIVE_REPEAT"}
+_UNSUPPORTED_AT = {"AT_BEGINNING_STRING", "AT_END_STRING"}
+
+
+class Segment:
+    """Text of consecutive (sorted) files joined into one string, each ending in a newline."""
+
+    __slots__ = ("paths", "starts", "text")
+
+    def __init__(self, paths: list[str], texts: list[str]):
+        self.paths = paths
+        self.starts = []
+        offset = 0
+        for text in texts:
+            self.starts.append(offset)
+            offset += len(text)
+        self.starts.append(offset)
+        self.text = "".join(texts)
+
+    def memory(self) -> int:
+        return sys.getsizeof(self.text) + 8 * len(self.starts)
+
+
+def _kind(text: str) -> int:
+    """Bytes per character CPython uses to store `text`."""
+    if text.isascii():
+        return 1
+    top = ord(max(text))
+    return 1 if top < 0x100 else 2 if top < 0x10000 else 4
+
+
+class Index:
+    def __init__(self, root: str, max_memory: int = DEFAULT_MAX_MEMORY):
+        self.root = os.path.normpath(root)
+        self.max_memory = max_memory
+        self.files = sorted(self._list())
+        self.segments: list[Segment] = []
+        # path -> (segment, file number) for every text file that was loaded
+        self.where: dict[str, tuple[Segment, int]] = {}
+        self.memory = 0
+        # Slices from across the repo, for estimating how common a literal is
+        self.sample = ""
+        self.ready = False
+
+    def _list(self) -> list[str]:
+        if shutil.which("rg"):
+            out = subprocess.run(
+                ["rg", "--files", "--max-filesize", "100K", self.root], capture_output=True, text=True
+            ).stdout
+            return [os.path.normpath(p) for p in out.splitlines() if p]
+        files = []
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+            files.extend(os.path.join(dirpath, f) for f in filenames if not f.startswith("."))
+        return [f for f in files if os.path.getsize(f) <= MAX_FILESIZE]
+
+    def preload(self):
+        """Load every text file; stays not-ready (all requests fall back) if they don't fit."""
+        # One pending segment per storage width, so ASCII code isn't widened by one emoji file
+        pending: dict[int, tuple[list[str], list[str]]] = {}
+        pending_chars = dict.fromkeys((1, 2, 4), 0)
+        segments, memory = [], 0
+
+        def flush(kind: int):
+            nonlocal memory
+            paths, texts = pending.pop(kind)
+            segment = Segment(paths, texts)
+            segments.append(segment)
+            memory += segment.memory() - pending_chars[kind] * kind
+            pending_chars[kind] = 0
+
+        for path in self.files:
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+            except OSError:
+                continue
+            if not data or b"\0" in data:
+                continue  # binary: rg skips these when searching a directory
+            text = data.decode("utf-8", errors="replace")
+            if not text.endswith("\n"):
+                text += "\n"
+            kind = _kind(text)
+            paths, texts = pending.setdefault(kind, ([], []))
+            paths.append(path)
+            texts.append(text)
+            pending_chars[kind] += len(text)
+            memory += len(text) * kind
+            if memory > self.max_memory:
+                print(f"repo text exceeds {self.max_memory} bytes; every request falls back to rg", file=sys.stderr)
+                return
+            if pending_chars[kind] >= SEGMENT_CHARS:
+                flush(kind)
+        for kind in list(pending):
+            flush(kind)
+
+        self.where = {path: (segment, i) for segment in segments for i, path in enumerate(segment.paths)}
+        self.segments, self.memory = segments, memory
+        step = max(sum(len(segment.text) for segment in segments) * SAMPLE_SLICE // SAMPLE_CHARS, SAMPLE_SLICE)
+        self.sample = "".join(
+            segment.text[i:i + SAMPLE_SLICE] for segment in segments for i in range(0, len(segment.text), step)
+        )
+        self.ready = True
+
+
+def _children(op: str, av) -> list:
+    if op == "SUBPATTERN":
+        return [av[-1]]
+    if op == "BRANCH":
+        return list(av[1])
+    if op in ("MAX_REPEAT", "MIN_REPEAT", "POSSESSIVE_REPEAT", "ASSERT", "ASSERT_NOT"):
+        return [av[-1]]
+    if op == "ATOMIC_GROUP":
+        return [av]
+    if op == "GROUPREF_EXISTS":
+        return [sub for sub in av[1:] if sub is not None]
+    return []
+
+
+def _supported(items) -> bool:
+    for op, av in items:
+        op = str(op)
+        if op in _UNSUPPORTED_OPS or (op == "AT" and str(av) in _UNSUPPORTED_AT):
+            return False
+        if op == "LITERAL" and av == 10:
+            return False  # rg rejects a literal \n outside multiline mode
+        if op == "IN" and any(str(o) == "LITERAL" and a == 10 for o, a in av):
+            return False
+        if not all(_supported(sub) for sub in _children(op, av)):
+            return False
+    return True
+
+
+def _required_literals(items, sample: str = "") -> list[str] | None:
+    """Literals at least one of which is in every match; None if there aren't useful ones.
+
+    Of several options the one that occurs least in `sample` wins (then the longest),
+    since each occurrence is a candidate line the regex has to check.
+    """
+    best: list[str] | None = None
+    best_cost = None
+    run: list[str] = []
+
+    def consider(candidates):
+        nonlocal best, best_cost
+        if candidates and min(map(len, candidates)) >= MIN_LITERAL:
+            cost = (sum(sample.count(lit) for lit in candidates), -min(map(len, candidates)))
+            if best is None or cost < best_cost:
+                best, best_cost = candidates, cost
+
+    def walk(items):
+        for op, av in items:
+            op = str(op)
+            if op == "LITERAL":
+                run.append(chr(av))
+                continue
+            consider(["".join(run)])
+            run.clear()
+            if op == "SUBPATTERN" and not av[1] and not av[2]:
+                walk(av[-1])  # a plain group is part of the sequence
+            elif op == "BRANCH":
+                alternatives = [_required_literals(sub, sample) for sub in av[1]]
+                if all(alternatives):
+                    consider(sorted({lit for alt in alternatives for lit in alt}))
+            elif op in ("MAX_REPEAT", "MIN_REPEAT") and av[0] >= 1:
+                consider(_required_literals(av[-1], sample))
+
+    walk(items)
+    consider(["".join(run)])
+    return best
+
+
+def _braces_are_repeats(pattern: str) -> bool:
+    """Whether every `{` outside escapes and classes opens a counted repetition."""
+    i, in_class = 0, False
+    while i < len(pattern):
+        c = pattern[i]
+        if c == "\\":
+            i += 2
+            continue
+        if in_class:
+            if c == "]":
+                in_class = False
+        elif c == "[":
+            in_class = True
+            # `]` first in a class ([]x] or [^]x]) is a literal
+            i += 2 if pattern[i + 1:i + 2] == "]" else 3 if pattern[i + 1:i + 3] == "^]" else 1
+            continue
+        elif c == "{" and not _COUNTED_REPEAT.match(pattern, i):
+            return False
+        i += 1
+    return True
+
+
+def _plan(pattern: str, ignore_case: bool, sample: str = ""):
+    """(regex or None, required literals), or None when rg should answer the request."""
+    if ignore_case or "\n" in pattern:
+        return None  # no fast case-insensitive scan here; rg is quicker
+    if not any(c in _META for c in pattern):
+        return (None, [pattern]) if len(pattern) >= MIN_LITERAL else None
+    if _RG_ONLY.search(pattern) or not _braces_are_repeats(pattern):
+        return None
+    try:
+        parsed = sre_parse.parse(pattern)
+        if parsed.state.flags & (re.IGNORECASE | re.DOTALL) or not _supported(parsed):
+            return None
+        literals = _required_literals(parsed, sample)
+        regex = re.compile(pattern, re.MULTILINE)
+    except (re.error, AttributeError, IndexError, TypeError, ValueError):
+        return None
+    return (regex, literals) if literals else None
+
+
+def _glob_matcher(glob: str):
+    """Basename globs only; path globs, negations and brace sets go to rg."""
+    if not glob:
+        return lambda path: True
+    if glob.startswith("!") or "/" in glob or "{" in glob:
+        return None
+    return lambda path: fnmatch.fnmatchcase(os.path.basename(path), glob)
+
+
+def _matching_lines(text: str, start: int, end: int, regex, literals: list[str]):
+    """Offsets of the starts of lines in text[start:end] that match, in order."""
+    find, rfind = text.find, text.rfind
+    if len(literals) == 1:
+        # The common case, kept to C calls only: about 1us per candidate line
+        literal = literals[0]
+        search = regex.search if regex is not None else None
+        at = find(literal, start, end)
+        while at >= 0:
+            line_start = rfind("\n", start, at) + 1 or start
+            line_end = find("\n", at, end)
+            if search is None or search(text, line_start, line_end):
+                yield line_start
+            at = find(literal, line_end + 1, end)
+        return
+
+    upcoming = {lit: find(lit, start, end) for lit in literals}
+    pos = start
+    while True:
+        for lit, at in upcoming.items():
+            if 0 <= at < pos:
+                upcoming[lit] = find(lit, pos, end)
+        found = [at for at in upcoming.values() if at >= 0]
+        if not found:
+            return
+        at = min(found)
+        line_start = rfind("\n", start, at) + 1 or start
+        line_end = find("\n", at, end)
+        if regex is None or regex.search(text, line_start, line_end):
+            yield line_start
+        pos = line_end + 1
+
+
+def _emit(out: list[str], shown: str, lines: list[str], hits: list[int], context: int, limit: int) -> bool:
+    """Append one file's match and context lines as rg prints them; True once `limit` is reached."""
+    hit_set = set(hits)
+    last = -2
+    for i in hits:
+        start, end = max(i - context, last + 1, 0), min(i + context, len(lines) - 1)
+        if context and out and start > last + 1:
+            out.append("--")
+        for j in range(start, end + 1):
+            sep = ":" if j in hit_set else "-"
+            out.append(f"{shown}{sep}{j + 1}{sep}{lines[j]}" if shown else f"{j + 1}{sep}{lines[j]}")
+        last = max(last, end)
+        if len(out) >= limit:
+            del out[limit:]
+            return True
+    return False
+
+
+def search(index: Index, req: dict) -> list[str] | None:
+    """rg -n style output lines, or None to make the caller fall back to rg."""
+    if not index.ready:
+        return None
+    plan = _plan(req["pattern"], req.get("ignore_case", False), index.sample)
+    matches_glob = _glob_matcher(req.get("glob", ""))
+    if plan is None or matches_glob is None:
+        return None
+    regex, literals = plan
+    context = max(0, min(int(req.get("context", 0)), 5))
+    limit = int(req.get("max_lines", 51))
+
+    given = req.get("path") or index.root
+    target = os.path.normpath(given)
+    if target != index.root and not target.startswith(index.root + os.sep):
+        return None
+    if os.path.isfile(target):
+        # rg searches an explicit file even if ignored, binary or outside the glob, and prints no file name
+        if target not in index.where:
+            return None
+        segment, i = index.where[target]
+        ranges, prefix, matches_glob = [(segment, i, i + 1)], None, lambda path: True
+    elif target == index.root:
+        ranges, prefix = [(s, 0, len(s.paths)) for s in index.segments], given.rstrip("/")
+    else:
+        # Paths are sorted, so a directory is a contiguous run of each segment
+        lo_key, hi_key = target + os.sep, target + chr(ord(os.sep) + 1)
+        ranges = [(s, bisect.bisect_left(s.paths, lo_key), bisect.bisect_left(s.paths, hi_key)) for s in index.segments]
+        prefix = given.rstrip("/")
+
+    out: list[str] = []
+    for segment, lo, hi in ranges:
+        if lo >= hi:
+            continue
+        text, starts = segment.text, segment.starts
+        current, hits, skip_to = -1, [], -1
+        for line_start in _matching_lines(text, starts[lo], starts[hi], regex, literals):
+            if line_start < skip_to:
+                continue
+            i = bisect.bisect_right(starts, line_start) - 1
+            if i != current:
+                if hits and _emit_file(out, segment, current, hits, target, prefix, context, limit):
+                    return out
+                current, hits = i, []
+                if not matches_glob(segment.paths[i]):
+                    skip_to = starts[i + 1]
+                    continue
+            if len(hits) < limit:
+                hits.append(text.count("\n", starts[i], line_start))
+        if hits and _emit_file(out, segment, current, hits, target, prefix, context, limit):
+            return out
+    return out
+
+
+def _emit_file(out, segment: Segment, i: int, hits: list[int], target: str, prefix: str | None, context: int, limit: int) -> bool:
+    path = segment.paths[i]
+    shown = "" if prefix is None else prefix + path[len(target):]
+    lines = segment.text[segment.starts[i]:segment.starts[i + 1] - 1].split("\n")
+    return _emit(out, shown, lines, hits, context, limit)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            req = json.loads(self.rfile.readline())
+            lines = search(self.server.index, req)
+        except Exception:
+            lines = None
+        if lines is None:
+            self.wfile.write(f"{FALLBACK}\n".encode())
+            return
+        self.wfile.write(("\n".join([OK] + lines) + "\n").encode("utf-8", errors="replace"))
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def serve(root: str, port: int = DEFAULT_PORT, max_memory: int = DEFAULT_MAX_MEMORY):
+    index = Index(root, max_memory)
+    threading.Thread(target=index.preload, daemon=True).start()
+    with _Server(("127.0.0.1", port), _Handler) as server:
+        server.index = index
+        server.serve_forever()
+
+
+def install_command(dest: str = REMOTE_PATH) -> str:
+    """Shell command that writes this module into the sandbox."""
+    with open(__file__, "rb") as f:
+        source = base64.b64encode(f.read()).decode()
+    return f"echo {source} | base64 -d > {dest}"
+
+
+def start_command(root: str, port: int = DEFAULT_PORT, script: str = REMOTE_PATH) -> str:
+    """Start the daemon detached, then wait until it accepts connections."""
+    return (
+        f"setsid nohup python3 {script} --root {shlex.quote(root)} --port {port} "
+        f"> /tmp/rg_server.log 2>&1 < /dev/null & "
+        f"for i in $(seq 100); do (exec 3<>/dev/tcp/127.0.0.1/{port}) 2>/dev/null && exit 0; sleep 0.1; done; exit 1"
+    )
+
+
+def client_command(req: dict, fallback: str, port: int = DEFAULT_PORT) -> str:
+    """One request to the daemon; runs `fallback` if it is down or declines the request."""
+    script = (
+        f'exec 3<>/dev/tcp/127.0.0.1/{port} || exit 1; printf "%s\\n" "$0" >&3; '
+        f'IFS= read -r first <&3; [ "$first" = {OK} ] || exit 1; '
+        f'while IFS= read -r line <&3; do printf "%s\\n" "$line"; done'
+    )
+    return f"bash -c {shlex.quote(script)} {shlex.quote(json.dumps(req))} 2>/dev/null || {{ {fallback}; }}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Warm search daemon for grep_tool")
+    parser.add_argument("--root", required=True)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--max-memory", type=int, default=DEFAULT_MAX_MEMORY,
+                        help="Bytes of file text held in memory (measured as stored); larger repos always fall back to rg")
+    args = parser.parse_args()
+    serve(args.root, args.port, args.max_memory)
+
+
+if __name__ == "__main__":
+    main()
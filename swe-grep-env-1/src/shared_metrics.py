@@ -0,0 +1,378 @@
+"""Node-wide counters and latency histograms in a shared mmap file.
+
+Every env worker process on the node maps the same file (in /dev/shm by
+default) and claims one slot in it. A process only ever writes its own
+slot, so incrementing a counter is a plain in-place add on shared memory:
+no locks, no IPC, and no lost updates since each slot has a single writer.
+Readers sum all slots. Slots of exited workers are kept so totals still
+include their work; a new worker that finds no free slot takes over a dead
+worker's slot and keeps adding to its counts.
+
+A slot records its owner's pid and start time, so a pid reused by another
+process (a restarted container's worker usually gets its predecessor's pid)
+never passes for the owner. The file outlives processes, so the env opens it
+with fresh=True: if no worker that claimed a slot is still alive, the counts
+belong to an earlier run and are zeroed before this run starts counting.
+
+--reset never writes into a live worker's slot. It bumps the file's epoch;
+each owner zeroes its own counts when it next sees the new epoch, and until
+then readers skip counts from before the reset.
+
+One process per node holds the aggregator lock and logs node-wide totals
+from maybe_log; the same report is available from any shell:
+
+    python -m src.shared_metrics --watch 10
+    python -m src.shared_metrics --reset      # start a fresh run
+
+SWE_GREP_METRICS_PATH overrides the file, e.g. to keep jobs apart.
+"""
+
+import argparse
+import bisect
+import fcntl
+import json
+import logging
+import mmap
+import os
+import tempfile
+import time
+import zlib
+from array import array
+from contextlib import contextmanager
+
+from src import procs
+
+logger = logging.getLogger("SweGrepEnv.metrics")
+
+COUNTERS = (
+    "creation_success",
+    "creation_failed",
+    "exec_502_errors",
+    "exec_409_errors",
+    "exec_other_errors",
+    "exec_attempts",
+    "clone_failed",
+    "setup_success",
+    "setup_failed",
+    "exec_retries",
+    "setup_retries",
+    "prefetch_hits",
+    "prefetch_misses",
+    "prefetch_bytes",
+    "prefetch_wasted_bytes",
+)
+HISTOGRAMS = ("setup_seconds", "exec_seconds", "tool_seconds", "loop_lag_seconds")
+# Upper bucket edges in seconds: 1ms doubling up to ~9 minutes, plus an overflow bucket
+BUCKETS = tuple(0.001 * 2 ** i for i in range(20))
+
+_MAGIC = 0x53574547524550  # "SWEGREP"
+_HEADER_WORDS = 5  # magic, layout, slots, slot words, reset epoch
+_EPOCH = 4
+_SLOT_HEADER = 4  # owner pid, owner start time, claimed at (unix seconds), epoch its counts are from
+_OWNER, _STARTED, _CLAIMED, _APPLIED = range(_SLOT_HEADER)
+_HIST_WORDS = len(BUCKETS) + 2  # buckets + overflow + total microseconds
+_SLOT_WORDS = _SLOT_HEADER + len(COUNTERS) + len(HISTOGRAMS) * _HIST_WORDS
+_LAYOUT = zlib.crc32(json.dumps([_SLOT_HEADER, COUNTERS, HISTOGRAMS, BUCKETS]).encode())
+
+_COUNTER_INDEX = {name: _SLOT_HEADER + i for i, name in enumerate(COUNTERS)}
+_HIST_INDEX = {name: _SLOT_HEADER + len(COUNTERS) + i * _HIST_WORDS for i, name in enumerate(HISTOGRAMS)}
+
+
+def default_path() -> str:
+    if "SWE_GREP_METRICS_PATH" in os.environ:
+        return os.environ["SWE_GREP_METRICS_PATH"]
+    base = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    # Layout in the name so a code change never reads an old file with different offsets
+    return os.path.join(base, f"swe-grep-env-{_LAYOUT:08x}.metrics")
+
+
+class SharedMetrics:
+    def __init__(self, path: str | None = None, slots: int = 256, fresh: bool = False):
+        """
+        Args:
+            path: Shared file (default_path() if None)
+            slots: Worker slots when creating the file
+            fresh: Zero counts left by an earlier run (no live slot owners) when opening
+        """
+        self.path = path or default_path()
+        self.slots = slots
+        self._leader_fd = None
+        self._slot = None
+        self._started = procs.start_time(os.getpid())
+        try:
+            self._map = self._open(fresh)
+        except OSError as e:
+            logger.warning(f"[METRICS] shared metrics unavailable ({e}), counting per process")
+            self.path = None
+            self._map = bytearray((_HEADER_WORDS + _SLOT_WORDS) * 8)
+            self.slots = 1
+        self._words = memoryview(self._map).cast("q")
+        os.register_at_fork(after_in_child=self._forget_slot)
+
+    def _open(self, fresh: bool):
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o666)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            size = (_HEADER_WORDS + self.slots * _SLOT_WORDS) * 8
+            if os.fstat(fd).st_size == 0:
+                os.ftruncate(fd, size)
+                with mmap.mmap(fd, _HEADER_WORDS * 8) as m:
+                    header = memoryview(m).cast("q")
+                    header[0], header[1], header[2], header[3] = _MAGIC, _LAYOUT, self.slots, _SLOT_WORDS
+                    header.release()
+            else:
+                with mmap.mmap(fd, _HEADER_WORDS * 8) as m:
+                    magic, layout, slots, slot_words, _ = memoryview(m).cast("q").tolist()
+                if (magic, layout, slot_words) != (_MAGIC, _LAYOUT, _SLOT_WORDS):
+                    raise OSError(f"{self.path} has an incompatible layout")
+                self.slots = slots
+                size = (_HEADER_WORDS + slots * _SLOT_WORDS) * 8
+                if fresh:
+                    self._clear_finished_run(fd, size)
+            return mmap.mmap(fd, size)
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    def _clear_finished_run(self, fd: int, size: int):
+        with mmap.mmap(fd, size) as m:
+            words = memoryview(m).cast("q")
+            if not any(_slot_live(words, _HEADER_WORDS + s * _SLOT_WORDS) for s in range(self.slots)):
+                words[_HEADER_WORDS:] = array("q", bytes((len(words) - _HEADER_WORDS) * 8))
+            words.release()
+
+    @contextmanager
+    def _locked(self):
+        """Hold the file lock (claims and resets); a no-op when counting privately."""
+        fd = os.open(self.path, os.O_RDONLY) if self.path else None
+        try:
+            if fd is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            if fd is not None:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+                os.close(fd)
+
+    def _forget_slot(self):
+        self._slot = None
+        self._leader_fd = None
+
+    def _claim(self) -> int:
+        """Index of this process's first word; claims a slot on first use.
+
+        Prefers a slot this process already owns, then a free one, then one
+        whose owner has exited (its counts stay, so totals don't drop).
+        """
+        pid = os.getpid()
+        with self._locked():
+            free = dead = None
+            for i in range(self.slots):
+                base = _HEADER_WORDS + i * _SLOT_WORDS
+                owner = self._words[base + _OWNER]
+                if self.path is None or (owner == pid and self._words[base + _STARTED] == self._started):
+                    free = base
+                    break
+                if owner == 0:
+                    if free is None:
+                        free = base
+                elif free is None and dead is None and not _slot_live(self._words, base):
+                    dead = base
+            base = free if free is not None else dead
+            if base is not None:
+                self._words[base + _OWNER] = pid
+                self._words[base + _STARTED] = self._started
+                self._words[base + _CLAIMED] = int(time.time())
+                self._slot = base
+                return base
+        # Every slot held by a live worker: keep counting privately rather than clobber one
+        logger.warning(
+            f"[METRICS] all {self.slots} slots in {self.path} are held by live workers; "
+            f"pid {pid} counts privately and is missing from node totals"
+        )
+        self.path = None
+        self._map = bytearray((_HEADER_WORDS + _SLOT_WORDS) * 8)
+        self._words = memoryview(self._map).cast("q")
+        self.slots = 1
+        return self._claim()
+
+    def _base(self) -> int:
+        base = self._slot if self._slot is not None else self._claim()
+        epoch = self._words[_EPOCH]
+        if self._words[base + _APPLIED] != epoch:
+            # A reset happened since this slot last counted; only its owner zeroes it
+            self._words[base + _SLOT_HEADER:base + _SLOT_WORDS] = memoryview(array("q", bytes((_SLOT_WORDS - _SLOT_HEADER) * 8)))
+            self._words[base + _APPLIED] = epoch
+        return base
+
+    def get(self, name: str) -> int:
+        return self._words[self._base() + _COUNTER_INDEX[name]]
+
+    def set(self, name: str, value: int):
+        self._words[self._base() + _COUNTER_INDEX[name]] = value
+
+    def incr(self, name: str, n: int = 1):
+        i = self._base() + _COUNTER_INDEX[name]
+        self._words[i] += n
+
+    def observe(self, name: str, seconds: float):
+        i = self._base() + _HIST_INDEX[name]
+        self._words[i + bisect.bisect_left(BUCKETS, seconds)] += 1
+        self._words[i + _HIST_WORDS - 1] += int(seconds * 1e6)
+
+    def is_aggregator(self) -> bool:
+        """Whether this process reports for the node (first to take the lock keeps it)."""
+        if self.path is None:
+            return True
+        if self._leader_fd is None:
+            fd = os.open(self.path + ".leader", os.O_RDWR | os.O_CREAT, 0o666)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                return False
+            self._leader_fd = fd
+        return True
+
+    def totals(self) -> dict:
+        """Sum every slot: counters, histogram buckets, and worker counts."""
+        words = self._words.tolist()
+        counters = dict.fromkeys(COUNTERS, 0)
+        hists = {name: [0] * _HIST_WORDS for name in HISTOGRAMS}
+        workers = live = 0
+        for s in range(self.slots):
+            base = _HEADER_WORDS + s * _SLOT_WORDS
+            if words[base + _OWNER] == 0:
+                continue
+            workers += 1
+            live += self.path is None or _slot_live(words, base)
+            if words[base + _APPLIED] != words[_EPOCH]:
+                continue  # counted before the last reset; its owner zeroes it on its next write
+            for name, i in _COUNTER_INDEX.items():
+                counters[name] += words[base + i]
+            for name, i in _HIST_INDEX.items():
+                hist = hists[name]
+                for j in range(_HIST_WORDS):
+                    hist[j] += words[base + i + j]
+        return {"workers": workers, "live_workers": live, "counters": counters, "histograms": hists}
+
+    def reset(self):
+        """Start counting from zero without writing into live workers' slots.
+
+        Bumps the epoch (owners zero their own slots when they see it) and frees
+        the slots of exited workers, which nobody else writes.
+        """
+        zeros = memoryview(array("q", bytes(_SLOT_WORDS * 8)))
+        with self._locked():
+            self._words[_EPOCH] += 1
+            for s in range(self.slots):
+                base = _HEADER_WORDS + s * _SLOT_WORDS
+                if self._words[base + _OWNER] and not _slot_live(self._words, base):
+                    self._words[base:base + _SLOT_WORDS] = zeros
+
+
+def _slot_live(words, base: int) -> bool:
+    owner = words[base + _OWNER]
+    return bool(owner) and procs.is_running(owner, words[base + _STARTED])
+
+
+def percentile(hist: list[int], q: float) -> float | None:
+    """Upper edge of the bucket holding the q-th quantile (inf for the overflow bucket)."""
+    counts = hist[:-1]
+    n = sum(counts)
+    if n == 0:
+        return None
+    rank, seen = q * n, 0
+    for edge, count in zip(BUCKETS + (float("inf"),), counts):
+        seen += count
+        if seen >= rank:
+            return edge
+    return float("inf")
+
+
+def node_report(totals: dict) -> dict:
+    c = totals["counters"]
+    setups = c["setup_success"] + c["setup_failed"]
+    exec_errors = c["exec_502_errors"] + c["exec_409_errors"] + c["exec_other_errors"]
+    latency = {}
+    for name, hist in totals["histograms"].items():
+        n = sum(hist[:-1])
+        latency[name] = {
+            "n": n,
+            "mean": hist[-1] / 1e6 / n if n else None,
+            "p50": percentile(hist, 0.5),
+            "p90": percentile(hist, 0.9),
+            "p99": percentile(hist, 0.99),
+        }
+    return {
+        "workers": totals["workers"],
+        "live_workers": totals["live_workers"],
+        "setups": setups,
+        "setup_success_rate": c["setup_success"] / setups if setups else None,
+        "exec_error_rate": exec_errors / c["exec_attempts"] if c["exec_attempts"] else None,
+        "creation_failure_rate": (
+            c["creation_failed"] / (c["creation_success"] + c["creation_failed"])
+            if c["creation_success"] + c["creation_failed"] else None
+        ),
+        "counters": c,
+        "latency": latency,
+    }
+
+
+def format_report(report: dict) -> list[str]:
+    c = report["counters"]
+
+    def pct(x):
+        return "n/a" if x is None else f"{x:.1%}"
+
+    def secs(x):
+        return "n/a" if x is None else f"{x:.3g}s"
+
+    lines = [
+        f"workers={report['live_workers']}/{report['workers']} setups={report['setups']} "
+        f"ok={c['setup_success']} fail={c['setup_failed']} success={pct(report['setup_success_rate'])} "
+        f"502s={c['exec_502_errors']} 409s={c['exec_409_errors']} other={c['exec_other_errors']} "
+        f"exec_err={pct(report['exec_error_rate'])} create_fail={pct(report['creation_failure_rate'])} "
+        f"clone_fail={c['clone_failed']} retries={c['setup_retries']}",
+        " ".join(
+            f"{name.removesuffix('_seconds')} p50={secs(h['p50'])} p90={secs(h['p90'])} p99={secs(h['p99'])}"
+            for name, h in report["latency"].items() if h["n"]
+        ),
+    ]
+    if c["prefetch_bytes"]:
+        lookups = c["prefetch_hits"] + c["prefetch_misses"]
+        lines.append(
+            f"prefetch hit_rate={c['prefetch_hits'] / max(lookups, 1):.1%} hits={c['prefetch_hits']} "
+            f"misses={c['prefetch_misses']} bytes={c['prefetch_bytes']} wasted={c['prefetch_wasted_bytes']}"
+        )
+    return [line for line in lines if line]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Node-wide swe-grep-env metrics")
+    parser.add_argument("--path", default=None)
+    parser.add_argument("--watch", type=float, default=0, help="Refresh every N seconds")
+    parser.add_argument("--json", action="store_true")
+    parser.add_argument("--reset", action="store_true", help="Zero every slot")
+    args = parser.parse_args()
+
+    path = args.path or default_path()
+    if not os.path.exists(path):
+        raise SystemExit(f"no metrics file at {path}")
+    shared = SharedMetrics(path)
+    if args.reset:
+        shared.reset()
+        return
+    while True:
+        report = node_report(shared.totals())
+        if args.json:
+            print(json.dumps(report))
+        else:
+            print("\n".join(format_report(report)), flush=True)
+        if not args.watch:
+            break
+        time.sleep(args.watch)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+"""Background sandbox teardown.
+
+Deleting a sandbox (and, with DebugSandboxClient, capturing its filesystem
+first) used to sit on the rollout's completion path. TeardownQueue hands
+deletes to a bounded pool of worker tasks instead. Every pending delete is
+written to a per-process journal, so if the process dies the next one to
+start adopts the dead journal and reclaims the sandboxes.
+
+Journals are named after host, pid and process start time. A journal from
+this host is adopted once its process is gone, even when the new process
+got the same pid (the usual case in a restarted container). Another host's
+processes can't be checked, so when the journal directory is shared its
+journals are adopted only after they go `stale_after` seconds without a
+write; live queues touch theirs more often than that.
+
+Journal writes are batched by one writer task and done in a thread, so the
+event loop never blocks on the file; a crash can lose only the entries from
+the last few milliseconds. Deletes that still fail after their retries are
+queued again every `retry_interval` seconds while the process lives, and
+stay in the journal for the next process if it exits first.
+"""
+
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import time
+from pathlib import Path
+
+from src import procs, tracing
+
+logger = logging.getLogger("SweGrepEnv.teardown")
+
+DEFAULT_JOURNAL_DIR = Path.home() / ".cache" / "swe-grep-env" / "teardown"
+
+
+def _read_pending(journal: Path) -> list[str]:
+    pending: dict[str, None] = {}
+    try:
+        lines = journal.read_text().splitlines()
+    except OSError:
+        return []
+    for line in lines:
+        try:
+            entry = json.loads(line)
+        except json.JSONDecodeError:
+            continue  # torn write from a crash
+        if entry.get("op") == "add":
+            pending[entry["sandbox_id"]] = None
+        else:
+            pending.pop(entry.get("sandbox_id"), None)
+    return list(pending)
+
+
+def _entry(op: str, sandbox_id: str) -> str:
+    return json.dumps({"op": op, "sandbox_id": sandbox_id, "ts": time.time()}) + "\n"
+
+
+def journal_name(host: str, pid: int, started: int) -> str:
+    return f"{host}.{pid}.{started}.jsonl"
+
+
+def _journal_owner(journal: Path) -> tuple[str | None, int, int] | None:
+    """(host, pid, start time) from a journal's name; host is None for old `<pid>.jsonl` journals."""
+    if journal.stem.isdigit():
+        return None, int(journal.stem), 0
+    host, _, rest = journal.stem.rpartition(".")
+    host, _, pid = host.rpartition(".")
+    if not (host and pid.isdigit() and rest.isdigit()):
+        return None
+    return host, int(pid), int(rest)
+
+
+class TeardownQueue:
+    def __init__(
+        self,
+        client,
+        workers: int = 8,
+        max_pending: int = 512,
+        max_retries: int = 3,
+        retry_interval: float = 60.0,
+        stale_after: float = 900.0,
+        journal_dir: str | Path | None = None,
+        on_deleted=None,
+    ):
+        if journal_dir is None:
+            journal_dir = os.environ.get("TEARDOWN_JOURNAL_DIR", str(DEFAULT_JOURNAL_DIR))
+        self._client = client
+        self.workers = workers
+        self.max_retries = max_retries
+        self.retry_interval = retry_interval
+        self.stale_after = stale_after
+        self._max_pending = max_pending
+        self._on_deleted = on_deleted
+        self._journal_dir = Path(journal_dir)
+        self._host = procs.hostname()
+        self._journal = self._journal_dir / journal_name(self._host, os.getpid(), procs.start_time(os.getpid()))
+        self._queue: asyncio.Queue | None = None
+        self._tasks: list[asyncio.Task] = []
+        self._sweeper: asyncio.Task | None = None
+        self._heartbeat: asyncio.Task | None = None
+        self._writer: asyncio.Task | None = None
+        self._deferred: set[asyncio.Task] = set()
+        self._retries: set[asyncio.Task] = set()
+        self._lines: list[str] = []
+        self._wrote = None  # asyncio.Event, created on the loop
+        self._closing = False
+        self.deleted = 0
+        self.failed = 0
+        # Adopted now (the env is built before the loop runs); deleted once the workers start
+        self._orphans = self._adopt_orphans() if workers > 0 else []
+
+    def _owner_alive(self, journal: Path, host: str | None, pid: int, started: int) -> bool:
+        if host is not None and host != self._host:
+            try:
+                return time.time() - journal.stat().st_mtime < self.stale_after
+            except OSError:
+                return True
+        if pid == os.getpid() and not started:
+            return False  # old-style journal left by whoever had our pid before
+        return procs.is_running(pid, started)
+
+    def _adopt_orphans(self) -> list[str]:
+        """Move pending deletes from dead processes' journals into this one."""
+        if not self._journal_dir.exists():
+            return []
+        # A journal already at our own path was left by an earlier queue with our exact identity
+        orphans: list[str] = _read_pending(self._journal)
+        for journal in self._journal_dir.glob("*.jsonl"):
+            owner = _journal_owner(journal)
+            if journal == self._journal or owner is None or self._owner_alive(journal, *owner):
+                continue
+            pid = owner[1]
+            # Rename first so two starting processes can't both adopt the same journal
+            claimed = journal.with_name(f"{journal.stem}.adopted-{os.getpid()}")
+            try:
+                journal.rename(claimed)
+            except OSError:
+                continue
+            pending = _read_pending(claimed)
+            if pending:
+                logger.info(f"[TEARDOWN] reclaiming {len(pending)} sandboxes from dead process {pid}")
+                with open(self._journal, "a") as f:
+                    f.writelines(_entry("add", sandbox_id) for sandbox_id in pending)
+            claimed.unlink(missing_ok=True)
+            orphans.extend(pending)
+        return orphans
+
+    def _append(self, op: str, sandbox_id: str):
+        self._lines.append(_entry(op, sandbox_id))
+        self._wrote.set()
+
+    def _write(self, lines: list[str]):
+        self._journal_dir.mkdir(parents=True, exist_ok=True)
+        with open(self._journal, "a") as f:
+            f.writelines(lines)
+
+    async def _flush_journal(self):
+        """Write whatever accumulated while the previous write was in flight, in one go."""
+        while True:
+            await self._wrote.wait()
+            self._wrote.clear()
+            lines, self._lines = self._lines, []
+            if lines:
+                await asyncio.to_thread(self._write, lines)
+            if self._closing and not self._lines:
+                return
+
+    def start(self):
+        """Start the workers and begin deleting adopted orphans; needs the running loop."""
+        if self._queue is not None or self.workers <= 0:
+            return
+        self._queue = asyncio.Queue(maxsize=self._max_pending)
+        self._wrote = asyncio.Event()
+        # Workers outlive the rollout that happened to start them; don't inherit its trace context
+        ctx = contextvars.Context()
+        self._writer = ctx.run(asyncio.create_task, self._flush_journal())
+        self._tasks = [ctx.run(asyncio.create_task, self._worker(n)) for n in range(self.workers)]
+        self._sweeper = ctx.run(asyncio.create_task, self.sweep())
+        self._heartbeat = ctx.run(asyncio.create_task, self._touch_journal())
+
+    async def submit(self, sandbox_id: str, after=None):
+        """Journal the delete and hand it to a worker; returns without waiting for it.
+
+        `after` is an optional awaitable that must finish before the delete starts
+        (e.g. a pending capture decision); it doesn't hold a worker while it waits.
+        """
+        if self.workers <= 0:
+            if after is not None:
+                await after
+            await self._client.delete(sandbox_id)
+            if self._on_deleted:
+                self._on_deleted(sandbox_id)
+            return
+        self.start()
+        self._append("add", sandbox_id)
+        if after is None:
+            await self._queue.put(sandbox_id)
+            return
+
+        async def enqueue_after():
+            try:
+                await after
+            except asyncio.CancelledError:
+                return  # drain gave up waiting; the delete stays journaled for the next process
+            except Exception as e:
+                logger.warning(f"[TEARDOWN] waiting to delete {sandbox_id}: {type(e).__name__}: {str(e)[:100]}")
+            await self._queue.put(sandbox_id)
+
+        task = asyncio.create_task(enqueue_after())
+        self._deferred.add(task)
+        task.add_done_callback(self._deferred.discard)
+
+    async def _delete(self, sandbox_id: str) -> bool:
+        for attempt in range(self.max_retries + 1):
+            try:
+                with tracing.span("delete", sandbox_id=sandbox_id, attempt=attempt):
+                    await self._client.delete(sandbox_id)
+                return True
+            except Exception as e:
+                error_str = str(e)
+                if "404" in error_str or "not found" in error_str.lower():
+                    return True
+                if attempt < self.max_retries:
+                    await asyncio.sleep(2 ** attempt)
+                else:
+                    logger.error(f"[TEARDOWN] delete {sandbox_id} failed: {error_str[:100]}")
+        return False
+
+    def _retry_later(self, sandbox_id: str):
+        async def requeue():
+            await asyncio.sleep(self.retry_interval)
+            await self._queue.put(sandbox_id)
+
+        task = asyncio.create_task(requeue())
+        self._retries.add(task)
+        task.add_done_callback(self._retries.discard)
+
+    async def _worker(self, n: int):
+        # One lane per worker: deletes from different workers overlap and wouldn't nest in one lane
+        tracing.set_lane(f"teardown-{n}")
+        while True:
+            sandbox_id = await self._queue.get()
+            try:
+                if await self._delete(sandbox_id):
+                    self.deleted += 1
+                    self._append("done", sandbox_id)
+                    if self._on_deleted:
+                        self._on_deleted(sandbox_id)
+                else:
+                    # Still journaled; retried here later, or by the next process after a restart
+                    self.failed += 1
+                    self._retry_later(sandbox_id)
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"[TEARDOWN] {type(e).__name__}: {str(e)[:100]}")
+            finally:
+                self._queue.task_done()
+
+    async def _touch_journal(self):
+        """Keep the journal's mtime fresh so other hosts sharing the directory leave it alone."""
+        while True:
+            await asyncio.sleep(self.stale_after / 3)
+            try:
+                await asyncio.to_thread(os.utime, self._journal)
+            except OSError:
+                pass  # nothing journaled yet
+
+    async def sweep(self):
+        """Queue the deletes adopted from dead processes' journals at startup."""
+        orphans, self._orphans = self._orphans, []
+        for sandbox_id in orphans:
+            await self._queue.put(sandbox_id)
+
+    async def drain(self, timeout: float = 300.0):
+        """Wait for queued deletes to finish, then stop the workers."""
+        if self._queue is None:
+            return
+        try:
+            await asyncio.wait_for(self._sweeper, timeout)
+            if self._deferred:
+                await asyncio.wait(list(self._deferred), timeout=timeout)
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"[TEARDOWN] {self._queue.qsize()} deletes still pending after {timeout}s")
+        except Exception as e:
+            logger.error(f"[TEARDOWN] drain failed: {type(e).__name__}: {str(e)[:100]}")
+        finally:
+            # Deletes waiting for a retry or a decision stay journaled for the next process
+            deferred = list(self._deferred)
+            for task in [*self._tasks, *self._retries, *deferred, self._heartbeat]:
+                task.cancel()
+            await asyncio.gather(*deferred, return_exceptions=True)
+            # Let the writer finish in order rather than cancel it mid-write
+            self._closing = True
+            self._wrote.set()
+            await self._writer
+        if not _read_pending(self._journal):
+            self._journal.unlink(missing_ok=True)
@@ -0,0 +1,212 @@
+"""Lightweight span tracing for rollouts.
+
+Spans nest through a contextvar, so anything awaited inside a span (in the
+same task) becomes its child. Each rollout gets its own lane, keyed by the
+trajectory id set in setup_state; background tasks that outlive a rollout
+(teardown workers) set a lane of their own, since overlapping spans in one
+lane don't nest in a trace viewer. Finished spans are buffered and appended
+to a file in batches by a writer thread, so the event loop never waits on
+the file, either as Chrome trace events (open in Perfetto or chrome://tracing
+for a flame graph) or as OTLP/JSON lines.
+
+Tracing is off unless a path is configured:
+
+    SWE_GREP_TRACE=/tmp/rollouts.trace.json SWE_GREP_TRACE_FORMAT=chrome|otlp
+"""
+
+import atexit
+import contextvars
+import json
+import os
+import queue
+import random
+import threading
+import time
+import uuid
+
+_rollout = contextvars.ContextVar("swe_grep_rollout", default=None)
+_lane = contextvars.ContextVar("swe_grep_lane", default=None)
+_parent = contextvars.ContextVar("swe_grep_span", default=None)
+
+
+def set_rollout(rollout_id: str):
+    """Attribute spans in the current task (and tasks it spawns) to a rollout."""
+    _rollout.set(rollout_id)
+
+
+def set_lane(lane: str):
+    """Put spans in the current task (and tasks it spawns) in their own lane, whatever their rollout."""
+    _lane.set(lane)
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "lane", "rollout", "attrs", "span_id", "parent_id", "start", "_token")
+
+    def __init__(self, tracer: "Tracer", name: str, lane: str | None, rollout: str | None, attrs: dict):
+        self.tracer = tracer
+        self.name = name
+        self.rollout = rollout or _rollout.get()
+        self.lane = lane or _lane.get() or self.rollout or "main"
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        parent = _parent.get()
+        self.parent_id = parent.span_id if parent is not None and parent.lane == self.lane else None
+        self.span_id = random.getrandbits(64)
+        self._token = _parent.set(self)
+        self.start = time.time_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.time_ns()
+        _parent.reset(self._token)
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        self.tracer._record(self, end)
+        return False
+
+
+class Tracer:
+    def __init__(self, path: str | None = None, fmt: str = "chrome", flush_every: int = 512):
+        self.path = path
+        self.fmt = fmt
+        self.flush_every = flush_every
+        self._buffer: list[tuple] = []
+        self._lanes: dict[str, int] = {}
+        self._lock = threading.Lock()
+        # Held while converting and appending a batch: keeps lane ids and file order consistent
+        self._write_lock = threading.Lock()
+        self._batches: queue.Queue = queue.Queue()
+        self._writer: threading.Thread | None = None
+        self._pid = os.getpid()
+        atexit.register(self.flush)
+
+    @property
+    def enabled(self) -> bool:
+        return self.path is not None
+
+    def span(self, name: str, lane: str | None = None, rollout: str | None = None, **attrs):
+        """Context manager timing a block; `lane` overrides the rollout lane (e.g. "teardown")."""
+        if self.path is None:
+            return _NOOP
+        return _Span(self, name, lane, rollout, attrs)
+
+    def _record(self, span: _Span, end: int):
+        with self._lock:
+            self._buffer.append((span.name, span.lane, span.rollout, span.span_id, span.parent_id, span.start, end, span.attrs))
+            if len(self._buffer) < self.flush_every:
+                return
+            spans, self._buffer = self._buffer, []
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_batches, name="swe-grep-trace", daemon=True)
+                self._writer.start()
+        self._batches.put((self.path, self.fmt, spans))
+
+    def _write_batches(self):
+        while True:
+            path, fmt, spans = self._batches.get()
+            try:
+                self._write(path, fmt, spans)
+            except OSError:
+                pass  # tracing must never take the run down
+            finally:
+                self._batches.task_done()
+
+    def flush(self):
+        """Write everything recorded so far; blocks until it is on disk."""
+        with self._lock:
+            spans, self._buffer = self._buffer, []
+        self._batches.join()
+        if spans and self.path is not None:
+            self._write(self.path, self.fmt, spans)
+
+    def _write(self, path: str | None, fmt: str, spans: list[tuple]):
+        if path is None:
+            return
+        with self._write_lock:
+            if fmt == "otlp":
+                lines = [json.dumps(self._otlp(spans)) + "\n"]
+            else:
+                lines = [json.dumps(ev) + ",\n" for ev in self._chrome(spans)]
+            new_file = not os.path.exists(path)
+            with open(path, "a") as f:
+                if new_file and fmt != "otlp":
+                    f.write("[\n")  # Chrome accepts an unterminated event array
+                f.writelines(lines)
+
+    def _chrome(self, spans: list[tuple]) -> list[dict]:
+        events = []
+        for name, lane, rollout, _, _, start, end, attrs in spans:
+            tid = self._lanes.get(lane)
+            if tid is None:
+                tid = self._lanes[lane] = len(self._lanes) + 1
+                events.append({"name": "thread_name", "ph": "M", "pid": self._pid, "tid": tid, "args": {"name": lane}})
+            args = dict(attrs, rollout=rollout) if rollout else attrs
+            events.append({
+                "name": name, "ph": "X", "pid": self._pid, "tid": tid,
+                "ts": start / 1000, "dur": (end - start) / 1000, "args": args,
+            })
+        return events
+
+    def _otlp(self, spans: list[tuple]) -> dict:
+        otlp_spans = []
+        for name, lane, rollout, span_id, parent_id, start, end, attrs in spans:
+            trace_id = rollout if rollout and len(rollout) == 32 else uuid.uuid5(uuid.NAMESPACE_OID, lane).hex
+            span = {
+                "traceId": trace_id,
+                "spanId": f"{span_id:016x}",
+                "name": name,
+                "kind": 1,
+                "startTimeUnixNano": str(start),
+                "endTimeUnixNano": str(end),
+                "attributes": [_otlp_attr(k, v) for k, v in attrs.items()],
+                "status": {"code": 2 if "error" in attrs else 0},
+            }
+            if parent_id is not None:
+                span["parentSpanId"] = f"{parent_id:016x}"
+            otlp_spans.append(span)
+        return {"resourceSpans": [{
+            "resource": {"attributes": [_otlp_attr("service.name", "swe-grep-env"), _otlp_attr("process.pid", self._pid)]},
+            "scopeSpans": [{"scope": {"name": "swe-grep-env"}, "spans": otlp_spans}],
+        }]}
+
+
+def _otlp_attr(key: str, value) -> dict:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+tracer = Tracer(os.environ.get("SWE_GREP_TRACE"), os.environ.get("SWE_GREP_TRACE_FORMAT", "chrome"))
+
+
+def configure(path: str | None, fmt: str = "chrome"):
+    """Point the process-wide tracer at a file (None disables it)."""
+    tracer.flush()
+    tracer.path = path
+    tracer.fmt = fmt
+
+
+def span(name: str, lane: str | None = None, rollout: str | None = None, **attrs):
+    return tracer.span(name, lane=lane, rollout=rollout, **attrs)
@@ -0,0 +1,114 @@
+"""Compact per-rollout trajectory summaries for reward functions.
+
+Walking `state["trajectory"]` response objects is slow and every reward or
+analysis used to redo it. TrajectorySummary walks it once at rollout end
+and keeps only small typed arrays (tool calls per turn, which tool each
+call was) plus scalar totals. GroupSummary stacks a group's summaries into
+NumPy columns so group rewards are a few vectorized ops:
+
+    g = GroupSummary.from_states(states)
+    g.turns, g.correct, g.mean_parallel, g.tool_counts[:, tool_id("grep_tool")]
+"""
+
+from array import array
+
+import numpy as np
+
+# Interned tool names; ids are stable for the life of the process
+TOOL_NAMES: list[str] = []
+_TOOL_IDS: dict[str, int] = {}
+
+
+def tool_id(name: str) -> int:
+    i = _TOOL_IDS.get(name)
+    if i is None:
+        i = _TOOL_IDS[name] = len(TOOL_NAMES)
+        TOOL_NAMES.append(name)
+    return i
+
+
+class TrajectorySummary:
+    __slots__ = ("turns", "calls_per_turn", "call_tools", "tool_tokens_out", "wire_bytes_out", "correct")
+
+    def __init__(self):
+        self.turns = 0
+        self.calls_per_turn = array("H")
+        self.call_tools = array("H")
+        self.tool_tokens_out = 0
+        self.wire_bytes_out = 0
+        self.correct: bool | None = None
+
+    @classmethod
+    def from_state(cls, state: dict) -> "TrajectorySummary":
+        summary = cls()
+        trajectory = state.get("trajectory") or []
+        summary.turns = len(trajectory)
+        for step in trajectory:
+            calls = 0
+            response = step["response"]
+            if response.choices:
+                message = response.choices[0].message
+                if message and message.tool_calls:
+                    calls = len(message.tool_calls)
+                    summary.call_tools.extend(tool_id(call.function.name) for call in message.tool_calls)
+            summary.calls_per_turn.append(calls)
+        usage = state.get("usage") or {}
+        summary.tool_tokens_out = usage.get("tool_tokens_out", 0)
+        summary.wire_bytes_out = usage.get("wire_bytes_out", 0)
+        summary.correct = state.get("_is_correct")
+        return summary
+
+    @property
+    def total_calls(self) -> int:
+        return len(self.call_tools)
+
+    @property
+    def mean_parallel(self) -> float:
+        """Average tool calls over the turns that made any (0 if none did)."""
+        active = sum(1 for n in self.calls_per_turn if n)
+        return self.total_calls / active if active else 0.0
+
+
+def summarize(state: dict) -> TrajectorySummary:
+    """The rollout's summary, built on first use if the end-of-rollout hook didn't run."""
+    summary = state.get("trajectory_summary")
+    if summary is None:
+        summary = state["trajectory_summary"] = TrajectorySummary.from_state(state)
+    return summary
+
+
+class GroupSummary:
+    """Columns over a group of rollouts, one row per state."""
+
+    def __init__(self, summaries: list[TrajectorySummary]):
+        n = len(summaries)
+        self.size = n
+        self.turns = np.fromiter((s.turns for s in summaries), np.int32, n)
+        self.total_calls = np.fromiter((s.total_calls for s in summaries), np.int32, n)
+        self.active_turns = np.fromiter((sum(1 for c in s.calls_per_turn if c) for s in summaries), np.int32, n)
+        self.correct = np.fromiter((bool(s.correct) for s in summaries), bool, n)
+        self.tool_tokens_out = np.fromiter((s.tool_tokens_out for s in summaries), np.int64, n)
+        # Calls per (rollout, tool id)
+        counts = np.zeros((n, max(len(TOOL_NAMES), 1)), np.int32)
+        for row, s in enumerate(summaries):
+            if s.call_tools:
+                ids = np.frombuffer(s.call_tools, np.uint16)
+                counts[row, :ids.max() + 1] += np.bincount(ids)
+        self.tool_counts = counts
+
+    @classmethod
+    def from_states(cls, states: list) -> "GroupSummary":
+        summaries = []
+        for state in states:
+            summary = summarize(state)
+            # Correctness is judged after the rollout ends
+            summary.correct = state.get("_is_correct", summary.correct)
+            summaries.append(summary)
+        return cls(summaries)
+
+    @property
+    def mean_parallel(self) -> np.ndarray:
+        return np.divide(
+            self.total_calls, self.active_turns,
+            out=np.zeros(self.size, np.float64), where=self.active_turns > 0,
+        )
@@ -0,0 +1,183 @@
+"""Compact in-memory snapshot of a sandbox directory tree.
+
+The repo tree is static once setup_state finishes, so instead of running
+`ls -la` remotely on every list_files call we capture the whole tree once
+with `find -printf` and render `ls -la` output locally. Manifests are
+keyed by commit and shared by every rollout that cloned the same commit.
+"""
+
+import base64
+import gzip
+import os
+import shlex
+import stat
+import time
+from array import array
+from datetime import datetime, timezone
+
+# type, perms, nlink, user, group, size, mtime, 1K blocks, link target, path
+FIND_FORMAT = r"%y\t%m\t%n\t%u\t%g\t%s\t%T@\t%k\t%l\t%p\0"
+
+_TYPE_BITS = {
+    "d": stat.S_IFDIR, "f": stat.S_IFREG, "l": stat.S_IFLNK, "p": stat.S_IFIFO,
+    "s": stat.S_IFSOCK, "c": stat.S_IFCHR, "b": stat.S_IFBLK,
+}
+_SIX_MONTHS = 182 * 24 * 3600
+
+# Process-wide cache: commit -> TreeManifest
+_MANIFESTS: dict[str, "TreeManifest"] = {}
+
+
+def commit_command(root: str) -> str:
+    return f"git -C {shlex.quote(root)} rev-parse HEAD"
+
+
+def capture_command(root: str) -> str:
+    """One round-trip command that dumps the tree under `root` (plus its parent entry)."""
+    q = shlex.quote(root)
+    fmt = shlex.quote(FIND_FORMAT)
+    return (
+        f"{{ pwd; find {q}/.. -maxdepth 0 -printf {fmt}; find {q} -printf {fmt}; }} "
+        f"2>/dev/null | gzip -c | base64 -w0"
+    )
+
+
+class TreeManifest:
+    """Array-backed listing of every entry under a root directory."""
+
+    def __init__(self, root: str, cwd: str):
+        self.root = root.rstrip("/")
+        self.cwd = cwd.rstrip("/") or "/"
+        self.paths: list[str] = []
+        self.index: dict[str, int] = {}
+        self.kinds = array("B")
+        self.modes = array("H")
+        self.nlinks = array("I")
+        self.sizes = array("q")
+        self.mtimes = array("d")
+        self.blocks = array("q")
+        self.owners = array("H")
+        self.groups = array("H")
+        self.names: list[str] = []  # interned user/group names
+        self.link_targets: dict[int, str] = {}
+        self.children: dict[int, array] = {}
+        self.parent_entry = -1
+
+    def __len__(self):
+        return len(self.paths)
+
+    def _intern(self, name: str) -> int:
+        try:
+            return self.names.index(name)
+        except ValueError:
+            self.names.append(name)
+            return len(self.names) - 1
+
+    @classmethod
+    def from_capture(cls, root: str, output: str) -> "TreeManifest":
+        """Parse the base64 gzip stream produced by capture_command."""
+        raw = gzip.decompress(base64.b64decode(output)).decode("utf-8", errors="replace")
+        cwd, _, records = raw.partition("\n")
+        manifest = cls(root, cwd)
+        for record in records.split("\0"):
+            if record:
+                manifest._add(record)
+        manifest._link_children()
+        return manifest
+
+    def _add(self, record: str):
+        kind, perms, nlink, user, group, size, mtime, blocks, target, path = record.split("\t", 9)
+        i = len(self.paths)
+        self.paths.append(os.path.normpath(path))
+        self.kinds.append(ord(kind))
+        self.modes.append(_TYPE_BITS.get(kind, 0) | int(perms, 8))
+        self.nlinks.append(int(nlink))
+        self.owners.append(self._intern(user))
+        self.groups.append(self._intern(group))
+        self.sizes.append(int(size))
+        self.mtimes.append(float(mtime))
+        self.blocks.append(int(blocks))
+        if target:
+            self.link_targets[i] = target
+        if path.endswith("/.."):
+            self.parent_entry = i
+        else:
+            self.index[self.paths[i]] = i
+
+    def _link_children(self):
+        by_dir: dict[int, list[int]] = {}
+        for path, i in self.index.items():
+            if path == self.root:
+                continue
+            parent = self.index.get(os.path.dirname(path))
+            if parent is not None:
+                by_dir.setdefault(parent, []).append(i)
+        for parent, kids in by_dir.items():
+            kids.sort(key=lambda k: os.path.basename(self.paths[k]).encode())
+            self.children[parent] = array("I", kids)
+
+    def resolve(self, path: str) -> str | None:
+        """Map a tool path onto a manifest key, or None if it is outside the snapshot."""
+        path = path.strip() or "."
+        if os.path.isabs(path):
+            if not path.startswith(self.cwd.rstrip("/") + "/"):
+                return None
+            path = path[len(self.cwd.rstrip("/")) + 1:]
+        path = os.path.normpath(path)
+        if path == self.root or path.startswith(self.root + "/"):
+            return path
+        return None
+
+    def _line(self, i: int, name: str, widths: tuple, now: float) -> str:
+        dt = datetime.fromtimestamp(self.mtimes[i], timezone.utc)
+        if 0 <= now - self.mtimes[i] < _SIX_MONTHS:
+            when = f"{dt:%b} {dt.day:>2} {dt:%H:%M}"
+        else:
+            when = f"{dt:%b} {dt.day:>2}  {dt.year}"
+        if i in self.link_targets:
+            name = f"{name} -> {self.link_targets[i]}"
+        w_link, w_owner, w_group, w_size = widths
+        return (
+            f"{stat.filemode(self.modes[i])} {self.nlinks[i]:>{w_link}} "
+            f"{self.names[self.owners[i]]:<{w_owner}} {self.names[self.groups[i]]:<{w_group}} "
+            f"{self.sizes[i]:>{w_size}} {when} {name}"
+        )
+
+    def _widths(self, entries: list[int]) -> tuple:
+        return (
+            max(len(str(self.nlinks[i])) for i in entries),
+            max(len(self.names[self.owners[i]]) for i in entries),
+            max(len(self.names[self.groups[i]]) for i in entries),
+            max(len(str(self.sizes[i])) for i in entries),
+        )
+
+    def ls_la(self, path: str) -> str | None:
+        """Render `ls -la path` output, or None when the snapshot cannot answer it."""
+        key = self.resolve(path)
+        if key is None or key not in self.index:
+            return None
+        i = self.index[key]
+        now = time.time()
+        if chr(self.kinds[i]) == "l" and path.rstrip() != path.rstrip().rstrip("/"):
+            return None  # trailing slash follows the link
+        if chr(self.kinds[i]) != "d":
+            return self._line(i, path, self._widths([i]), now)
+
+        parent = self.index.get(os.path.dirname(key), self.parent_entry)
+        if parent < 0:
+            return None
+        kids = list(self.children.get(i, ()))
+        entries = [(i, "."), (parent, "..")] + [(k, os.path.basename(self.paths[k])) for k in kids]
+        ids = [e for e, _ in entries]
+        widths = self._widths(ids)
+        total = sum(self.blocks[e] for e in ids)
+        lines = [f"total {total}"] + [self._line(e, name, widths, now) for e, name in entries]
+        return "\n".join(lines)
+
+
+def get_manifest(commit: str) -> TreeManifest | None:
+    return _MANIFESTS.get(commit)
+
+
+def put_manifest(commit: str, manifest: TreeManifest):
+    _MANIFESTS[commit] = manifest
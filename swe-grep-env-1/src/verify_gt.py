@@ -0,0 +1,246 @@
+"""Verify generated ground truth against a local repo snapshot.
+
+Each row produced by data_gen_line.py claims an answer, a file and a line
+range. This checks every claim against a checkout of the repo:
+
+    gt_file_status   "ok", "missing", "binary" or "too_large" (over MAX_FILE_SIZE)
+    gt_file_exists   claimed file is present in the snapshot (readable or not)
+    gt_in_range      answer occurs inside the claimed line range
+    gt_found_line    first line in the claimed file containing the answer (-1 if none)
+    gt_match_files   number of files in the repo containing the answer (ambiguity);
+                     -1 when the answer has no identifier tokens and wasn't counted
+    gt_verified      file is readable and the answer is in range
+
+The claimed files are read once in the parent before the verify pool forks,
+so every worker shares them copy-on-write. Other files opened while
+confirming a match count go through a per-worker LRU.
+
+Usage:
+    python -m src.verify_gt grep_dataset_20k_v2.parquet --repo ./vscode --out verified.parquet
+
+Datasets with repo/commit columns are verified against that exact commit from
+the node-local git cache when --repo is not given.
+"""
+
+import argparse
+import multiprocessing as mp
+import os
+import re
+import subprocess
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+
+import pandas as pd
+
+from src.repos import local_checkout
+
+IDENT_RE = re.compile(r"[A-Za-z_$][\w$]*")
+MAX_FILE_SIZE = 1_000_000
+
+# Set in the parent before the pool forks so workers share them copy-on-write
+_REPO: Path = None
+_FILES: list[str] = []
+_POSTINGS: dict[str, list[int]] = {}
+_CLAIMED: dict[str, tuple[str, str | None]] = {}
+
+
+def checkout_commit(repo: Path, commit: str):
+    """Make sure the snapshot is at `commit`, fetching it if the clone is shallow."""
+    head = subprocess.run(["git", "-C", str(repo), "rev-parse", "HEAD"],
+                          capture_output=True, text=True, check=True).stdout.strip()
+    if head.startswith(commit) or commit.startswith(head):
+        return
+    subprocess.run(["git", "-C", str(repo), "fetch", "--depth", "1", "origin", commit], check=True)
+    subprocess.run(["git", "-C", str(repo), "checkout", "--quiet", commit], check=True)
+
+
+def list_repo_files(repo: Path) -> list[str]:
+    """Tracked files relative to the repo root (falls back to a walk without git)."""
+    if (repo / ".git").exists():
+        out = subprocess.run(["git", "-C", str(repo), "ls-files", "-z"],
+                             capture_output=True, check=True).stdout
+        files = [p for p in out.decode(errors="ignore").split("\0") if p]
+    else:
+        files = [str(p.relative_to(repo)) for p in repo.rglob("*") if p.is_file()]
+    return [f for f in files if "node_modules" not in f]
+
+
+def _read_text(path: Path) -> tuple[str, str | None]:
+    """(status, text); text is None unless status is "ok"."""
+    try:
+        if path.stat().st_size > MAX_FILE_SIZE:
+            return "too_large", None
+        data = path.read_bytes()
+    except OSError:
+        return "missing", None
+    if b"\0" in data[:8192]:
+        return "binary", None
+    return "ok", data.decode(errors="ignore")
+
+
+def _index_file(rel_path: str) -> set[str]:
+    _, text = _read_text(_REPO / rel_path)
+    return set(IDENT_RE.findall(text)) if text else set()
+
+
+@lru_cache(maxsize=4096)
+def _read_cached(rel_path: str) -> tuple[str, str | None]:
+    return _read_text(_REPO / rel_path)
+
+
+def _file_text(rel_path: str) -> tuple[str, str | None]:
+    return _CLAIMED.get(rel_path) or _read_cached(rel_path)
+
+
+def _count_matching_files(answer: str) -> int:
+    """How many files contain the answer; identifiers count exact token hits."""
+    if IDENT_RE.fullmatch(answer):
+        return len(_POSTINGS.get(answer, ()))
+    tokens = set(IDENT_RE.findall(answer))
+    if not tokens:
+        return -1
+    # Narrow to files holding every token, then confirm the literal substring
+    candidates = None
+    for token in sorted(tokens, key=lambda t: len(_POSTINGS.get(t, ()))):
+        ids = set(_POSTINGS.get(token, ()))
+        candidates = ids if candidates is None else candidates & ids
+        if not candidates:
+            return 0
+    return sum(1 for i in candidates if answer in (_file_text(_FILES[i])[1] or ""))
+
+
+def parse_line_range(gt_lines) -> tuple[int, int] | None:
+    """'path/to/file.ts:45-67' -> (45, 67)."""
+    if gt_lines is None or len(gt_lines) == 0:
+        return None
+    _, _, span = str(gt_lines[0]).rpartition(":")
+    start, _, end = span.partition("-")
+    try:
+        return int(start), int(end or start)
+    except ValueError:
+        return None
+
+
+def verify_row(row: tuple[str, str, tuple[int, int] | None]) -> dict:
+    answer, gt_file, line_range = row
+    verdict = {
+        "gt_file_status": "missing",
+        "gt_file_exists": False,
+        "gt_in_range": False,
+        "gt_found_line": -1,
+        "gt_match_files": 0,
+        "gt_verified": False,
+    }
+    status, text = _file_text(gt_file) if gt_file else ("missing", None)
+    verdict["gt_file_status"] = status
+    verdict["gt_file_exists"] = status != "missing"
+    if not answer:
+        return verdict
+    verdict["gt_match_files"] = _count_matching_files(answer)
+    if text is None:
+        return verdict
+
+    lines = text.split("\n")
+    for i, line in enumerate(lines):
+        if answer in line:
+            verdict["gt_found_line"] = i + 1
+            break
+    if line_range:
+        start, end = line_range
+        window = "\n".join(lines[max(start - 1, 0):end])
+        verdict["gt_in_range"] = answer in window
+    verdict["gt_verified"] = verdict["gt_in_range"]
+    return verdict
+
+
+def _verify_chunk(rows: list) -> list[dict]:
+    return [verify_row(r) for r in rows]
+
+
+def verify_dataset(df: pd.DataFrame, repo: str | Path, workers: int | None = None, chunk_size: int = 500) -> pd.DataFrame:
+    """Return a copy of `df` with the gt_* verdict columns attached."""
+    global _REPO, _FILES, _POSTINGS, _CLAIMED
+    workers = workers or os.cpu_count() or 1
+    _REPO = Path(repo).resolve()
+    _FILES = list_repo_files(_REPO)
+    _CLAIMED = {}
+    _read_cached.cache_clear()
+
+    # fork shares the index with workers; spawn re-imports and would lose it
+    ctx = mp.get_context("fork") if "fork" in mp.get_all_start_methods() else None
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+        token_sets = list(pool.map(_index_file, _FILES, chunksize=64))
+    postings: dict[str, list[int]] = {}
+    for file_id, tokens in enumerate(token_sets):
+        for token in tokens:
+            postings.setdefault(token, []).append(file_id)
+    _POSTINGS = postings
+    print(f"Indexed {len(_FILES)} files in {time.perf_counter() - start:.1f}s")
+
+    files = df["gt_files"].apply(lambda x: str(x[0]) if x is not None and len(x) else "")
+    rows = list(zip(df["answer"].fillna("").astype(str), files, df["gt_lines"].apply(parse_line_range)))
+
+    # Read each claimed file once here; the verify workers fork afterwards and share them
+    claimed = sorted({f for f in files if f})
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        _CLAIMED = dict(zip(claimed, pool.map(lambda f: _read_text(_REPO / f), claimed)))
+
+    # Group rows by claimed file so consecutive rows touch the same pages
+    order = sorted(range(len(rows)), key=lambda i: rows[i][1])
+    chunks = [[rows[i] for i in order[j:j + chunk_size]] for j in range(0, len(order), chunk_size)]
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+        verdicts = [v for chunk in pool.map(_verify_chunk, chunks) for v in chunk]
+    print(f"Verified {len(rows)} rows in {time.perf_counter() - start:.1f}s")
+
+    ordered = [None] * len(rows)
+    for i, verdict in zip(order, verdicts):
+        ordered[i] = verdict
+    return pd.concat([df.reset_index(drop=True), pd.DataFrame(ordered)], axis=1)
+
+
+def print_summary(df: pd.DataFrame):
+    total = len(df)
+    print(f"\n{'='*60}")
+    print(f"Total rows:        {total}")
+    status = df["gt_file_status"]
+    print(f"File missing:      {(status == 'missing').sum()}")
+    print(f"File unreadable:   {status.isin(['binary', 'too_large']).sum()} "
+          f"(binary {(status == 'binary').sum()}, over {MAX_FILE_SIZE // 1000}KB {(status == 'too_large').sum()})")
+    print(f"Answer off-range:  {((status == 'ok') & ~df['gt_in_range']).sum()}")
+    print(f"Verified:          {df['gt_verified'].sum()} ({df['gt_verified'].mean():.1%})")
+    print(f"\n=== Ambiguity (files containing the answer) ===")
+    print(f"Unique (1 file):   {(df['gt_match_files'] == 1).sum()}")
+    print(f"2-5 files:         {df['gt_match_files'].between(2, 5).sum()}")
+    print(f"6+ files:          {(df['gt_match_files'] > 5).sum()}")
+    print(f"Not found:         {(df['gt_match_files'] == 0).sum()}")
+    print(f"Not counted:       {(df['gt_match_files'] == -1).sum()} (answer has no identifier tokens)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("dataset", help="Parquet file from data_gen_line.py")
+    parser.add_argument("--repo", default=None, help="Local checkout to verify against (default: from the dataset's repo/commit, else ./vscode)")
+    parser.add_argument("--commit", default=None, help="Commit the dataset was generated from")
+    parser.add_argument("--out", default=None, help="Where to write the dataset with verdict columns")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    df = pd.read_parquet(args.dataset)
+    if args.repo is None and {"repo", "commit"} <= set(df.columns):
+        pairs = df[["repo", "commit"]].drop_duplicates()
+        if len(pairs) != 1:
+            raise SystemExit(f"dataset spans {len(pairs)} repo/commit pairs; verify each with --repo")
+        args.repo, _ = local_checkout(pairs["repo"].iloc[0], args.commit or pairs["commit"].iloc[0])
+    elif args.commit:
+        checkout_commit(Path(args.repo or "./vscode"), args.commit)
+    df = verify_dataset(df, args.repo or "./vscode", workers=args.workers)
+    print_summary(df)
+    if args.out:
+        df.to_parquet(args.out, index=False)
+        print(f"\nSaved to {args.out}")
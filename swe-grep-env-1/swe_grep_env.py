@@ -1,11 +1,28 @@
 import asyncio
+import json
 import verifiers as vf
 from prime_sandboxes import AsyncSandboxClient
 from datasets import Dataset, load_dataset
 import pandas as pd
 from typing import Any
 import logging
+import shlex
+import time
 from src.debug_wrapper import DebugSandboxClient
+from src import tree_manifest
+from src import repos
+from src import rg_format
+from src import rg_server
+from src.accounting import MeteredSandboxClient, UsageTracker
+from src.shared_metrics import COUNTERS, SharedMetrics, format_report, node_report
+from src import accounting
+from src.prefetch import GrepPrefetcher
+from src.teardown import TeardownQueue
+from src.capture_policy import CapturePolicy
+from src import tracing
+from src.loop_monitor import LoopMonitor, SamplingProfiler
+from src.trajectory_summary import GroupSummary, TrajectorySummary
+import numpy as np
 from datetime import datetime
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -16,30 +33,47 @@ RUN_ID = f"run-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
 
 
 class SandboxMetrics:
+    """Counters live in this process's slot of the node-wide shared metrics file.
+
+    `metrics.setup_success += 1` is an in-place add on shared memory; one
+    process per node (the aggregator) logs the summed totals.
+    """
+
     def __init__(self):
-        self.creation_success = 0
-        self.creation_failed = 0
-        self.exec_502_errors = 0
-        self.exec_409_errors = 0
-        self.exec_other_errors = 0
-        self.clone_failed = 0
-        self.setup_success = 0
-        self.setup_failed = 0
-        self.exec_retries = 0
-        self.setup_retries = 0
-        self._last_log_count = 0
-    
-    def maybe_log(self, every_n: int = 50):
-        total = self.setup_success + self.setup_failed
-        if total > 0 and total % every_n == 0 and total != self._last_log_count:
-            self._last_log_count = total
+        self.shared = SharedMetrics(fresh=True)
+        # Bytes/tokens per tool call and per sandbox command; usage.summary() has the distributions
+        self.usage = UsageTracker()
+        self._last_log = 0.0
+
+    def observe(self, histogram: str, seconds: float):
+        self.shared.observe(histogram, seconds)
+
+    def maybe_log(self, interval: float = 30.0):
+        now = time.monotonic()
+        if now - self._last_log < interval or not self.shared.is_aggregator():
+            return
+        self._last_log = now
+        report = node_report(self.shared.totals())
+        if not report["setups"]:
+            return
+        for line in format_report(report):
+            logger.info(f"[METRICS] node {line}")
+        tokens = self.usage.distribution("rollout.tool_tokens_out")
+        wire = self.usage.distribution("rollout.wire_bytes_out")
+        if tokens and wire:
             logger.info(
-                f"[METRICS] setups={total} ok={self.setup_success} fail={self.setup_failed} "
-                f"502s={self.exec_502_errors} 409s={self.exec_409_errors} "
-                f"clone_fail={self.clone_failed} retries={self.setup_retries}"
+                f"[METRICS] per-rollout tool_tokens p50={tokens['p50']} p90={tokens['p90']} max={tokens['max']} "
+                f"wire_bytes_out p50={wire['p50']} p90={wire['p90']} max={wire['max']}"
             )
 
 
+for _name in COUNTERS:
+    setattr(SandboxMetrics, _name, property(
+        lambda self, _n=_name: self.shared.get(_n),
+        lambda self, value, _n=_name: self.shared.set(_n, value),
+    ))
+
+
 metrics = SandboxMetrics()
 
 
@@ -50,24 +84,82 @@ class SweGrepEnv(vf.SandboxEnv):
         max_setup_retries,
         system_prompt,
         debug: bool = False,
+        snapshot_tree: bool = True,
+        prefetch_top_n: int = 0,
+        prefetch_max_bytes: int = 256_000,
+        teardown_workers: int = 8,
+        capture_policy: CapturePolicy | None = None,
+        repo_source: str = "fetch",
+        max_concurrent_uploads: int = 4,
+        grep_output: str = "text",
+        grep_max_bytes: int = 8000,
+        search_daemon: bool = False,
+        search_daemon_port: int = rg_server.DEFAULT_PORT,
+        loop_lag_threshold: float = 0.25,
         **kwargs
     ):
         super().__init__(max_turns=max_turns, system_prompt=system_prompt, **kwargs)
-        self.client = AsyncSandboxClient()
+        self.client = MeteredSandboxClient(AsyncSandboxClient(), metrics.usage)
+        # Prefetch goes straight to the sandbox so it doesn't interleave with debug command logs
+        self.prefetcher = None
+        if prefetch_top_n > 0:
+            self.prefetcher = GrepPrefetcher(
+                self.client, top_n=prefetch_top_n, max_bytes_per_rollout=prefetch_max_bytes
+            )
         if debug:
-            self.client = DebugSandboxClient(self.client)
+            self.client = DebugSandboxClient(self.client, policy=capture_policy, usage=metrics.usage)
             self.sandbox_client = self.client
 
+        # Sandbox deletes (and debug captures) run off the rollout's completion path
+        self.teardown_queue = TeardownQueue(
+            self.client, workers=teardown_workers, on_deleted=self._sandbox_deleted
+        )
+
         self.max_setup_retries = max_setup_retries
+        # Started on the event loop by the first setup_state
+        self.loop_monitor = None
+        if loop_lag_threshold > 0:
+            self.loop_monitor = LoopMonitor(
+                loop_lag_threshold, on_lag=lambda lag: metrics.observe("loop_lag_seconds", lag)
+            )
+        self.profiler = SamplingProfiler.from_env()
+        self.snapshot_tree = snapshot_tree
+        # "fetch": the sandbox fetches the pinned commit itself; "snapshot": upload a tarball built from the
+        # node-local git cache (each upload is read into memory, so only a few run at once)
+        self.repo_source = repo_source
+        self._upload_slots = asyncio.Semaphore(max_concurrent_uploads)
+        # "text": raw `rg -n` lines; "grouped": rg --json grouped per file by src/rg_format.py in the sandbox
+        self.grep_output = grep_output
+        self.grep_max_bytes = grep_max_bytes
+        # Text-mode grep_tool calls go to a warm in-sandbox daemon (src/rg_server.py), rg as fallback
+        self.search_daemon = search_daemon
+        self.search_daemon_port = search_daemon_port
+        self._daemon_sandboxes: set[str] = set()
+        self.git_cache = repos.GitObjectCache()
+        # repo@commit -> in-flight resolve + snapshot
+        self._repo_loads: dict[str, asyncio.Task] = {}
+        # sandbox_id -> repo directory inside the sandbox
+        self._repo_paths: dict[str, str] = {}
+        # sandbox_id -> commit of its tree manifest; commit -> in-flight capture
+        self._tree_commits: dict[str, str] = {}
+        self._tree_loads: dict[str, asyncio.Task] = {}
         self.remove_tool(self.bash)
         self.add_tool(self.grep_tool, args_to_skip=["sandbox_id"])
         self.add_tool(self.list_files, args_to_skip=["sandbox_id"])
         self.add_tool(self.read_file, args_to_skip=["sandbox_id"])
 
     async def _execute_with_retry(self, sandbox_id: str, command: str, operation_name: str, max_retries: int = 2) -> tuple[bool, str]:
+        with tracing.span(operation_name):
+            return await self._execute_attempts(sandbox_id, command, operation_name, max_retries)
+
+    async def _execute_attempts(self, sandbox_id: str, command: str, operation_name: str, max_retries: int) -> tuple[bool, str]:
         for attempt in range(max_retries + 1):
+            metrics.exec_attempts += 1
+            start = time.perf_counter()
             try:
-                result = await self.client.execute_command(sandbox_id, command)
+                with tracing.span("exec_attempt", attempt=attempt):
+                    result = await self.client.execute_command(sandbox_id, command)
+                metrics.observe("exec_seconds", time.perf_counter() - start)
                 return True, result.stdout if result.stdout else ""
             except Exception as e:
                 error_str = str(e)
@@ -89,28 +181,94 @@ class SweGrepEnv(vf.SandboxEnv):
         return False, "Max retries exceeded"
 
     async def setup_state(self, state, **kwargs):
-        state = await super().setup_state(state, **kwargs)
+        # Everything later in this rollout's task is traced under its trajectory id
+        tracing.set_rollout(state["trajectory_id"])
+        if self.loop_monitor is not None:
+            self.loop_monitor.start()
+        self.profiler.install()
+        # Starts deleting sandboxes orphaned by a crashed earlier run
+        self.teardown_queue.start()
+        start = time.perf_counter()
+        try:
+            with tracing.span("setup_state"):
+                with tracing.span("create_sandbox"):
+                    state = await super().setup_state(state, **kwargs)
+                return await self._setup_sandbox(state)
+        finally:
+            metrics.observe("setup_seconds", time.perf_counter() - start)
+
+    async def _prepare_repo(self, state) -> tuple[repos.RepoSpec, str | None, Any]:
+        """Resolve the row's repo/commit against the git cache; returns (spec, sha, local snapshot or None)."""
+        info = state.get("info") or {}
+        spec = repos.REPOS[info.get("repo") or repos.DEFAULT_REPO]
+        commit = info.get("commit") or spec.commit
+        if commit != spec.commit:
+            spec = repos.RepoSpec(spec.name, spec.url, commit, spec.path)
+        # Rollouts starting together share one fetch (and one snapshot) per repo@commit
+        key = f"{spec.name}@{commit or 'HEAD'}"
+        task = self._repo_loads.get(key)
+        if task is None:
+            task = asyncio.create_task(self._resolve_snapshot(spec))
+            self._repo_loads[key] = task
+        try:
+            with tracing.span("resolve_repo", repo=spec.name):
+                sha, snapshot = await asyncio.shield(task)
+            return spec, sha, snapshot
+        except Exception as e:
+            logger.warning(f"[SETUP] git cache unavailable for {spec.name}: {str(e)[:100]}")
+            return spec, commit, None
+        finally:
+            if task.done() and self._repo_loads.get(key) is task:
+                del self._repo_loads[key]
+
+    async def _resolve_snapshot(self, spec: repos.RepoSpec) -> tuple[str, Any]:
+        sha = await asyncio.to_thread(self.git_cache.resolve, spec)
+        snapshot = None
+        if self.repo_source == "snapshot":
+            snapshot = await asyncio.to_thread(self.git_cache.snapshot, spec, sha)
+        return sha, snapshot
+
+    async def _upload_repo(self, sandbox_id: str, spec: repos.RepoSpec, sha: str, snapshot) -> tuple[bool, str]:
+        remote = f"/tmp/{spec.name}-{sha}.tar.gz"
+        try:
+            async with self._upload_slots:
+                with tracing.span("upload_repo"):
+                    await self.client.upload_file(sandbox_id, remote, str(snapshot))
+        except Exception as e:
+            logger.error(f"[upload_repo] {type(e).__name__}: {str(e)[:100]}")
+            return False, str(e)
+        return await self._execute_with_retry(
+            sandbox_id, f"tar -xzf {shlex.quote(remote)} && rm -f {shlex.quote(remote)}", "unpack_repo"
+        )
+
+    async def _setup_sandbox(self, state):
         sandbox_id = state["sandbox_id"]
+        metrics.usage.open(sandbox_id)
+        spec, sha, snapshot = await self._prepare_repo(state)
 
         last_error = ""
         for attempt in range(self.max_setup_retries):
             if attempt > 0:
                 metrics.setup_retries += 1
                 try:
-                    await self.client.delete(sandbox_id)
+                    await self.teardown_queue.submit(sandbox_id)
                 except:
                     pass
                 try:
-                    new_sandbox = await self.client.create(self.sandbox_request)
+                    with tracing.span("create_sandbox", attempt=attempt):
+                        new_sandbox = await self.client.create(self.sandbox_request)
                     state["sandbox_id"] = new_sandbox.id
+                    metrics.usage.open(new_sandbox.id, previous=sandbox_id)
                     sandbox_id = new_sandbox.id
+                    self.active_sandboxes.add(sandbox_id)
                 except Exception as e:
                     metrics.creation_failed += 1
                     logger.error(f"[SETUP] Failed to create sandbox: {e}")
                     continue
 
             try:
-                await self.client.wait_for_creation(sandbox_id)
+                with tracing.span("wait_for_creation", attempt=attempt):
+                    await self.client.wait_for_creation(sandbox_id)
                 metrics.creation_success += 1
             except Exception as e:
                 metrics.creation_failed += 1
@@ -125,18 +283,42 @@ class SweGrepEnv(vf.SandboxEnv):
                 last_error = output
                 continue
 
-            success, output = await self._execute_with_retry(
-                sandbox_id, "git clone --depth 1 https://github.com/microsoft/vscode.git", "git_clone", max_retries=2
-            )
+            if self.grep_output == "grouped":
+                success, output = await self._execute_with_retry(
+                    sandbox_id, rg_format.install_command(), "install_rg_format"
+                )
+                if not success:
+                    last_error = output
+                    continue
+
+            success = False
+            if snapshot is not None:
+                success, output = await self._upload_repo(sandbox_id, spec, sha, snapshot)
+            if not success:
+                if sha:
+                    clone_cmd = repos.sandbox_fetch_command(spec, sha)
+                else:
+                    clone_cmd = f"git clone --depth 1 {shlex.quote(spec.url)} {shlex.quote(spec.path)}"
+                success, output = await self._execute_with_retry(sandbox_id, clone_cmd, "git_clone", max_retries=2)
             if not success:
                 metrics.clone_failed += 1
                 last_error = output
                 continue
 
-            success, output = await self._execute_with_retry(sandbox_id, "ls vscode", "verify_clone")
+            success, output = await self._execute_with_retry(sandbox_id, f"ls {shlex.quote(spec.path)}", "verify_clone")
             if not success or not output.strip():
                 last_error = "clone verification failed"
                 continue
+            self._repo_paths[sandbox_id] = spec.path
+            state["repo"] = {"name": spec.name, "commit": sha, "path": spec.path}
+
+            if self.search_daemon and self.grep_output == "text":
+                with tracing.span("search_daemon"):
+                    await self._start_search_daemon(sandbox_id, spec.path)
+
+            if self.snapshot_tree:
+                with tracing.span("tree_manifest"):
+                    await self._load_tree_manifest(sandbox_id, spec.path, f"{spec.name}@{sha}" if sha else None)
 
             metrics.setup_success += 1
             metrics.maybe_log()
@@ -149,14 +331,82 @@ class SweGrepEnv(vf.SandboxEnv):
                     sandbox_id=sandbox_id,
                     question=state.get("prompt"),
                     answer=state.get("answer"),
-                    tools=tool_names
+                    tools=tool_names,
+                    setup_retries=attempt
                 )
             return state
         
         metrics.setup_failed += 1
+        metrics.usage.close(sandbox_id)
         metrics.maybe_log()
         raise RuntimeError(f"Sandbox setup failed after {self.max_setup_retries} attempts: {last_error}")
 
+    async def _start_search_daemon(self, sandbox_id: str, root: str):
+        """Best effort: grep_tool runs rg directly in sandboxes where this fails."""
+        success, output = await self._execute_with_retry(
+            sandbox_id,
+            f"{rg_server.install_command()} && {rg_server.start_command(root, self.search_daemon_port)}",
+            "start_search_daemon",
+            max_retries=1,
+        )
+        if success:
+            self._daemon_sandboxes.add(sandbox_id)
+        else:
+            logger.warning(f"[SETUP] search daemon unavailable in {sandbox_id}, using rg: {output[:100]}")
+
+    async def _load_tree_manifest(self, sandbox_id: str, root: str, commit: str | None = None):
+        """Snapshot the repo tree once per commit so list_files can be answered locally."""
+        if commit is None:
+            success, commit = await self._execute_with_retry(
+                sandbox_id, tree_manifest.commit_command(root), "tree_commit"
+            )
+            commit = f"{root}@{commit.strip()}"
+            if not success or commit.endswith("@"):
+                return
+
+        if tree_manifest.get_manifest(commit) is None:
+            # Rollouts on the same commit share one capture
+            task = self._tree_loads.get(commit)
+            if task is None:
+                task = asyncio.create_task(self._capture_tree(sandbox_id, root, commit))
+                self._tree_loads[commit] = task
+            try:
+                await asyncio.shield(task)
+            except Exception as e:
+                logger.warning(f"[SETUP] tree snapshot failed: {str(e)[:100]}")
+            finally:
+                self._tree_loads.pop(commit, None)
+
+        if tree_manifest.get_manifest(commit) is not None:
+            self._tree_commits[sandbox_id] = commit
+
+    async def _capture_tree(self, sandbox_id: str, root: str, commit: str):
+        success, output = await self._execute_with_retry(
+            sandbox_id, tree_manifest.capture_command(root), "tree_snapshot"
+        )
+        if not success or not output.strip():
+            raise RuntimeError(output or "empty tree snapshot")
+        manifest = await asyncio.to_thread(tree_manifest.TreeManifest.from_capture, root, output.strip())
+        tree_manifest.put_manifest(commit, manifest)
+        logger.info(f"[SETUP] tree snapshot for {commit[:commit.find('@') + 13]}: {len(manifest)} entries")
+
+    async def get_model_response(self, *args, **kwargs):
+        with tracing.span("model_turn"):
+            return await super().get_model_response(*args, **kwargs)
+
+    async def call_tool(self, tool_name: str, tool_args: dict, tool_call_id: str, **kwargs):
+        token = accounting.set_label(tool_name)
+        start = time.perf_counter()
+        try:
+            with tracing.span(f"tool.{tool_name}", tool_call_id=tool_call_id):
+                message = await super().call_tool(tool_name, tool_args, tool_call_id, **kwargs)
+        finally:
+            accounting.reset_label(token)
+            metrics.observe("tool_seconds", time.perf_counter() - start)
+        content = message.get("content") if isinstance(message, dict) else message
+        metrics.usage.tool_call(tool_args.get("sandbox_id"), tool_name, tool_args, str(content or ""))
+        return message
+
     def update_tool_args(self, tool_name: str, tool_args: dict[str, Any], messages, state, **kwargs):
         updated_args = dict(tool_args)
         if tool_name in ["grep_tool", "list_files", "read_file"]:
@@ -183,11 +433,114 @@ class SweGrepEnv(vf.SandboxEnv):
             if sandbox_id and reward is not None:
                 self.client.set_reward(sandbox_id, reward)
 
+    @vf.cleanup(priority=-10)
+    async def destroy_sandbox(self, state):
+        """Queue the sandbox for background deletion instead of awaiting it."""
+        await self.post_rollout(state)
+        sandbox_id = state.get("sandbox_id")
+        if sandbox_id is None:
+            return
+        after = None
+        if isinstance(self.client, DebugSandboxClient):
+            if state.get("reward") is not None or not self._expects_reward():
+                # Already scored, or nothing will score it: decide now rather than at decision_timeout
+                self.client.finalize(sandbox_id, state.get("reward"), had_error=state.get("error") is not None)
+            # Reward-based capture needs the sandbox alive until the rollout is scored
+            after = self.client.wait_for_decision(sandbox_id)
+        await self.teardown_queue.submit(sandbox_id, after=after)
+
+    def _expects_reward(self) -> bool:
+        """Whether a score hook will call finalize_rollouts for rollouts of this run."""
+        rubric = self.rubric
+        return (
+            isinstance(rubric, SweGrepRubric)
+            and self.finalize_rollouts in rubric.score_hooks
+            and not rubric.dummy_scoring
+        )
+
+    def finalize_rollouts(self, states: list):
+        """Called once rollouts are scored; settles reward-time capture decisions."""
+        if not isinstance(self.client, DebugSandboxClient):
+            return
+        for state in states:
+            sandbox_id = state.get("sandbox_id")
+            if sandbox_id:
+                self.client.finalize(sandbox_id, state.get("reward"), had_error=state.get("error") is not None)
+
+    @vf.teardown(priority=10)
+    async def drain_teardown_queue(self):
+        """Let queued deletes finish before the base class bulk-deletes leftovers."""
+        if isinstance(self.client, DebugSandboxClient):
+            # Scoring is over: nothing still waiting for a reward will get one
+            self.client.settle_all()
+        await self.teardown_queue.drain()
+        if isinstance(self.client, DebugSandboxClient):
+            self.client.flush_awaiting_reward()
+
+    @vf.teardown
+    async def stop_loop_monitor(self):
+        if self.loop_monitor is not None:
+            self.loop_monitor.stop()
+        if self.profiler.enabled:
+            self.profiler.stop()
+            self.profiler.dump()
+
+    @vf.teardown
+    async def report_usage(self):
+        """Log run-wide byte/token distributions once every delete (and capture) has finished."""
+        logger.info(f"[METRICS] usage {json.dumps(metrics.usage.summary())}")
+
+    @vf.cleanup
+    async def release_prefetch(self, state):
+        """Cancel in-flight prefetches and record how useful they were."""
+        if self.prefetcher is None:
+            return
+        stats = self.prefetcher.release(state.get("sandbox_id"))
+        if stats:
+            state["prefetch"] = stats
+            metrics.prefetch_hits += stats["hits"]
+            metrics.prefetch_misses += stats["misses"]
+            metrics.prefetch_bytes += stats["bytes_fetched"]
+            metrics.prefetch_wasted_bytes += stats["bytes_wasted"]
+
+    def _sandbox_deleted(self, sandbox_id: str):
+        self.active_sandboxes.discard(sandbox_id)
+        # Final per-rollout totals include the delete and any debug capture
+        metrics.usage.close(sandbox_id)
+
+    @vf.cleanup
+    async def release_usage(self, state):
+        """Attach the rollout's byte/token totals (up to the end of the rollout) to its state."""
+        sandbox_id = state.get("sandbox_id")
+        usage = metrics.usage.release(sandbox_id)
+        if usage is None:
+            return
+        state["usage"] = usage
+        if isinstance(self.client, DebugSandboxClient):
+            self.client.set_usage(sandbox_id, usage)
+
+    @vf.cleanup(priority=-5)
+    async def summarize_trajectory(self, state):
+        """Walk the trajectory once so reward functions work on compact columns."""
+        state["trajectory_summary"] = TrajectorySummary.from_state(state)
+
+    @vf.cleanup
+    async def count_profiled_rollout(self, state):
+        """Lets the sampling profiler dump collapsed stacks every N rollouts."""
+        self.profiler.rollout_done()
+
+    @vf.cleanup
+    async def release_tree(self, state):
+        """Drop the sandbox's reference to its tree snapshot and repo."""
+        self._tree_commits.pop(state.get("sandbox_id"), None)
+        self._repo_paths.pop(state.get("sandbox_id"), None)
+        self._daemon_sandboxes.discard(state.get("sandbox_id"))
+
     async def grep_tool(
         self,
         pattern: str,
         sandbox_id: str,
-        path: str = "vscode",
+        path: str = "",
         file_pattern: str = "",
         context_lines: int = 2,
         case_insensitive: bool = False
@@ -196,17 +549,20 @@ class SweGrepEnv(vf.SandboxEnv):
 
         Args:
             pattern: Text or regex to search for inside files
-            path: Directory to search in
+            path: Directory to search in (defaults to the repository root)
             file_pattern: Only search files matching this glob (e.g., *.ts, *.py)
             context_lines: Lines of context around each match
             case_insensitive: Ignore case when matching
         """
         import shlex
 
+        path = path or self._repo_paths.get(sandbox_id, repos.REPOS[repos.DEFAULT_REPO].path)
         max_lines = 50
-        flags = ["-n", "--max-filesize", "100K"]
+        grouped = self.grep_output == "grouped"
+        context_lines = min(max(context_lines, 0), 5)
+        flags = ["--json" if grouped else "-n", "--max-filesize", "100K"]
         if context_lines > 0:
-            flags.extend(["-C", str(min(context_lines, 5))])
+            flags.extend(["-C", str(context_lines)])
         if case_insensitive:
             flags.append("-i")
         if file_pattern:
@@ -215,16 +571,39 @@ class SweGrepEnv(vf.SandboxEnv):
             flags.extend(["-g", shlex.quote(file_pattern)])
 
         cmd = f"rg {' '.join(flags)} {shlex.quote(pattern)} {shlex.quote(path)} 2>&1 | head -{max_lines + 1}"
+        if sandbox_id in self._daemon_sandboxes and not grouped:
+            request = {
+                "pattern": pattern,
+                "path": path,
+                "glob": file_pattern,
+                "context": context_lines,
+                "ignore_case": case_insensitive,
+                "max_lines": max_lines + 1,
+            }
+            cmd = rg_server.client_command(request, fallback=cmd, port=self.search_daemon_port)
+        metrics.exec_attempts += 1
+        if grouped:
+            cmd = (
+                f"rg {' '.join(flags)} {shlex.quote(pattern)} {shlex.quote(path)} 2>&1 "
+                f"| python3 {rg_format.REMOTE_PATH} --context {context_lines} --max-bytes {self.grep_max_bytes}"
+            )
         try:
             result = await self.client.execute_command(sandbox_id, cmd)
             output = result.stdout.strip() if result.stdout else ""
             if not output:
                 return self._log_tool_response(sandbox_id, "No matches found.")
+            if grouped:
+                # Already grouped, collapsed and budgeted in the sandbox
+                if self.prefetcher is not None:
+                    self.prefetcher.schedule(sandbox_id, output, grouped=True)
+                return self._log_tool_response(sandbox_id, output)
 
             lines = output.split('\n')
             # truncate lines that are really long
             # line minified JS files
             lines = [line[:300] + '...' if len(line) > 300 else line for line in lines]
+            if self.prefetcher is not None:
+                self.prefetcher.schedule(sandbox_id, output)
             if len(lines) > max_lines:
                 output = '\n'.join(lines[:max_lines])
                 return self._log_tool_response(sandbox_id, f"{output}\n\n[TRUNCATED - results exceed {max_lines} lines. Narrow your search with a more specific pattern or file_pattern]")
@@ -246,6 +625,13 @@ class SweGrepEnv(vf.SandboxEnv):
         import shlex
 
         cmd = f"ls -la {shlex.quote(path)}"
+        commit = self._tree_commits.get(sandbox_id)
+        manifest = tree_manifest.get_manifest(commit) if commit else None
+        listing = manifest.ls_la(path) if manifest else None
+        if listing is not None:
+            if isinstance(self.client, DebugSandboxClient):
+                self.client.log_local_command(sandbox_id, cmd, listing)
+            return self._log_tool_response(sandbox_id, listing.strip() or "Empty directory.")
         try:
             result = await self.client.execute_command(sandbox_id, cmd)
             output = result.stdout.strip() if result.stdout.strip() else "Empty directory."
@@ -268,8 +654,14 @@ class SweGrepEnv(vf.SandboxEnv):
         # Get one extra line to detect if there's more
         cmd = f"sed -n '{start_line},{end_line + 1}p' {shlex.quote(file_path)}"
         try:
-            result = await self.client.execute_command(sandbox_id, cmd)
-            output = result.stdout if result.stdout else ""
+            output = None
+            if self.prefetcher is not None:
+                output = await self.prefetcher.lookup(sandbox_id, file_path, start_line, end_line + 1)
+                if output is not None and isinstance(self.client, DebugSandboxClient):
+                    self.client.log_local_command(sandbox_id, cmd, output)
+            if output is None:
+                result = await self.client.execute_command(sandbox_id, cmd)
+                output = result.stdout if result.stdout else ""
             if not output.strip():
                 return self._log_tool_response(sandbox_id, f"No content at lines {start_line}-{end_line} (file may be shorter or not exist)")
 
@@ -289,6 +681,11 @@ class SweGrepEnv(vf.SandboxEnv):
 def convert_dataset(train_ratio=0.9):
     dataset = load_dataset("cdreetz/swe-grep-env-v3", split="2k_v3")
     dataset = dataset.rename_columns({"user_query": "question", "ground_truth": "answer"}).remove_columns(["file"])
+    if "commit" in dataset.column_names:
+        # Pin each rollout to the snapshot its question was generated from
+        dataset = dataset.map(lambda row: {"info": {
+            **(row.get("info") or {}), "repo": row.get("repo") or repos.DEFAULT_REPO, "commit": row["commit"]
+        }})
     
     split = dataset.train_test_split(test_size=1 - train_ratio, seed=42)
     return split["train"], split["test"]
@@ -300,6 +697,41 @@ def convert_dataset(train_ratio=0.9):
 #    return dataset.rename_columns({"user_query": "question", "ground_truth": "answer"}).remove_columns(["file"])
 
 
+class SweGrepRubric(vf.JudgeRubric):
+    """JudgeRubric that notifies hooks once a group's final rewards are set."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.score_hooks = []
+        # Set once the run scores with dummy_score_group, which leaves rewards unset
+        self.dummy_scoring = False
+
+    async def score_group(self, states, score_sem):
+        await super().score_group(states, score_sem=score_sem)
+        for hook in self.score_hooks:
+            hook(states)
+
+    async def score_rollout(self, state, score_sem):
+        await super().score_rollout(state, score_sem=score_sem)
+        for hook in self.score_hooks:
+            hook([state])
+
+    async def dummy_score_group(self, states, *args, **kwargs):
+        self.dummy_scoring = True
+        result = await super().dummy_score_group(states, *args, **kwargs)
+        for hook in self.score_hooks:
+            hook(states)
+        return result
+
+    async def _call_individual_reward_func(self, func, state, score_sem):
+        with tracing.span(f"reward.{func.__name__}", rollout=state.get("trajectory_id")):
+            return await super()._call_individual_reward_func(func, state, score_sem)
+
+    async def _call_group_reward_func(self, func, states, score_sem):
+        with tracing.span(f"reward.{func.__name__}", lane="scoring", group_size=len(states)):
+            return await super()._call_group_reward_func(func, states, score_sem)
+
+
 JUDGE_PROMPT = """Given a ground truth answer and a response, determine if the answer is correct.
 
 Question:
@@ -321,25 +753,19 @@ async def correct_answer_reward_func(judge, prompt, completion, answer, state, *
     state["_is_correct"] = is_correct  # Store for the group function
     return 1.0 if is_correct else 0.0
 
-def parallel_tool_calls_reward_func(completion, state, **kwargs):
+async def parallel_tool_calls_reward_func(states: list, **kwargs) -> list[float]:
     """Reward for making parallel tool calls per turn."""
-    trajectory = state["trajectory"]
-    if not trajectory:
-        return 0.0
+    group = GroupSummary.from_states(states)
+    return np.minimum(group.mean_parallel / 8.0, 1.0).tolist()
 
-    tool_calls_per_turn = []
-    for step in trajectory:
-        response = step["response"]
-        if response.choices:
-            choice = response.choices[0]
-            if choice.message and choice.message.tool_calls:
-                tool_calls_per_turn.append(len(choice.message.tool_calls))
+def tool_response_tokens(state, **kwargs):
+    """Metric: estimated tokens the tools returned to the model over the rollout."""
+    return float((state.get("usage") or {}).get("tool_tokens_out", 0))
 
-    if not tool_calls_per_turn:
-        return 0.0
 
-    avg_calls = sum(tool_calls_per_turn) / len(tool_calls_per_turn)
-    return min(avg_calls / 8.0, 1.0)
+def sandbox_bytes_out(state, **kwargs):
+    """Metric: bytes the rollout's sandbox commands sent back over the wire."""
+    return float((state.get("usage") or {}).get("wire_bytes_out", 0))
 
 # group reward func
 # takes list of states
@@ -351,18 +777,11 @@ def parallel_tool_calls_reward_func(completion, state, **kwargs):
 
 async def efficiency_bonus_for_correct(states: list, **kwargs) -> list[float]:
     """Among correct rollouts, bonus for fewest turns."""
-    rewards = [0.0] * len(states)
-
-    correct_indices = [i for i, s in enumerate(states) if s["_is_correct"]]
-    turn_counts = [len(s["trajectory"]) for s in states]
-
-    if correct_indices:
-        min_turns = min(turn_counts[i] for i in correct_indices)
-        for i in correct_indices:
-            if turn_counts[i] == min_turns:
-                rewards[i] = 1.0
-
-    return rewards
+    group = GroupSummary.from_states(states)
+    if not group.correct.any():
+        return [0.0] * group.size
+    min_turns = group.turns[group.correct].min()
+    return (group.correct & (group.turns == min_turns)).astype(np.float64).tolist()
 
 SYSTEM_PROMPT = """You are a helpful assistant that can answer questions and help with tasks.
 You have access to a set of tools to help you answer questions and help with tasks.
@@ -377,20 +796,70 @@ def load_environment(
     max_setup_retries: int = 3,
     system_prompt: str = SYSTEM_PROMPT,
     debug: bool = True,
+    snapshot_tree: bool = True,
+    prefetch_top_n: int = 0,
+    prefetch_max_bytes: int = 256_000,
+    teardown_workers: int = 8,
+    capture: dict | None = None,
+    trace_path: str | None = None,
+    trace_format: str = "chrome",
+    repos_config: dict | None = None,
+    repo_source: str = "fetch",
+    max_concurrent_uploads: int = 4,
+    grep_output: str = "text",
+    grep_max_bytes: int = 8000,
+    search_daemon: bool = False,
+    loop_lag_threshold: float = 0.25,
     **kwargs
 ) -> vf.Environment:
+    """
+    Args:
+        capture: CapturePolicy options for debug traces, e.g.
+            {"sample_rate": 0.05, "first_k": 20, "per_bucket": 10, "reward_buckets": [0.5, 1.5]}
+        trace_path: Write timing spans here ("chrome" trace events or "otlp" JSON lines)
+        repos_config: Extra/overridden repo registry entries, e.g.
+            {"vscode": {"commit": "<sha>"}, "ts": {"url": "https://github.com/microsoft/TypeScript.git"}}
+        repo_source: "fetch" fetches the pinned commit in-sandbox; "snapshot" uploads a tarball from the
+            node-local git cache, at most max_concurrent_uploads at a time (node egress and memory scale with it)
+        grep_output: "text" (rg -n lines) or "grouped" (per-file blocks, collapsed long lines,
+            capped matches per file, grep_max_bytes enforced in the sandbox)
+        search_daemon: Serve "text" grep_tool calls from a warm in-sandbox search daemon instead of a
+            fresh rg process per call (holds up to 128MB of repo text in the sandbox); requests it can't answer
+            exactly or faster (no 3+ char literal, case-insensitive, rg-only syntax, path globs) run rg
+        loop_lag_threshold: Log the blocking stack when the event loop stalls longer than this (0 disables).
+            Set SWE_GREP_PROFILE=<dir> (or send SIGUSR1) for a sampling profile every SWE_GREP_PROFILE_EVERY rollouts
+    """
+    if trace_path:
+        tracing.configure(trace_path, trace_format)
+    if repos_config:
+        repos.register_repos(repos_config)
     train_dataset, test_dataset = convert_dataset()
-    rubric = vf.JudgeRubric(judge_prompt=JUDGE_PROMPT)
+    rubric = SweGrepRubric(judge_prompt=JUDGE_PROMPT)
     rubric.add_reward_func(parallel_tool_calls_reward_func, weight=0.0)
     rubric.add_reward_func(correct_answer_reward_func, weight=1.0)
     rubric.add_reward_func(efficiency_bonus_for_correct, weight=1.0)
+    rubric.add_reward_func(tool_response_tokens, weight=0.0)
+    rubric.add_reward_func(sandbox_bytes_out, weight=0.0)
 
-    return SweGrepEnv(
+    env = SweGrepEnv(
         dataset=train_dataset,
         eval_dataset=test_dataset,
         rubric=rubric,
         max_turns=max_turns,
         max_setup_retries=max_setup_retries,
         system_prompt=SYSTEM_PROMPT,
-        debug=debug
+        debug=debug,
+        snapshot_tree=snapshot_tree,
+        prefetch_top_n=prefetch_top_n,
+        prefetch_max_bytes=prefetch_max_bytes,
+        teardown_workers=teardown_workers,
+        capture_policy=CapturePolicy(**capture) if capture else None,
+        repo_source=repo_source,
+        max_concurrent_uploads=max_concurrent_uploads,
+        grep_output=grep_output,
+        grep_max_bytes=grep_max_bytes,
+        search_daemon=search_daemon,
+        loop_lag_threshold=loop_lag_threshold
     )
+    rubric.score_hooks.append(env.finalize_rollouts)
+    return env
@@ -0,0 +1,122 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from src import accounting
+from src.accounting import MeteredSandboxClient, Reservoir, UsageTracker, estimate_tokens
+from src.capture_policy import CapturePolicy
+from src.debug_wrapper import DebugSandboxClient
+
+
+class FakeClient:
+    def __init__(self, stdout="ok"):
+        self.stdout = stdout
+
+    async def execute_command(self, sandbox_id, command, **kwargs):
+        return SimpleNamespace(stdout=self.stdout, stderr="")
+
+    async def upload_file(self, sandbox_id, file_path, local_file_path):
+        return None
+
+    async def delete(self, sandbox_id, **kwargs):
+        return None
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("abcd") == 1
+    assert estimate_tokens("abcde") == 2
+    assert estimate_tokens("é" * 2) == 1  # counted in UTF-8 bytes
+    assert estimate_tokens(b"12345678") == 2
+
+
+def test_tool_and_wire_totals_by_label(tmp_path):
+    tracker = UsageTracker()
+    client = MeteredSandboxClient(FakeClient(stdout="x" * 100), tracker)
+    upload = tmp_path / "repo.tar.gz"
+    upload.write_bytes(b"\0" * 1000)
+
+    async def main():
+        tracker.open("sb-1")
+        await client.upload_file("sb-1", "/tmp/repo.tar.gz", str(upload))
+        token = accounting.set_label("grep_tool")
+        try:
+            await client.execute_command("sb-1", "rg foo")
+        finally:
+            accounting.reset_label(token)
+        tracker.tool_call("sb-1", "grep_tool", {"pattern": "foo", "sandbox_id": "sb-1"}, "y" * 40)
+
+    asyncio.run(main())
+    usage = tracker.release("sb-1")
+    assert usage["wire"] == {
+        "setup": {"commands": 1, "bytes_in": 1000, "bytes_out": 0},
+        "grep_tool": {"commands": 1, "bytes_in": len("rg foo"), "bytes_out": 100},
+    }
+    # sandbox_id is injected by the env, not sent by the model
+    assert usage["tools"]["grep_tool"] == {"calls": 1, "bytes_in": len('{"pattern": "foo"}'), "bytes_out": 40, "tokens_out": 10}
+    assert usage["tool_tokens_out"] == 10
+
+
+def test_teardown_traffic_is_charged_until_close():
+    tracker = UsageTracker()
+    tracker.open("sb-1")
+    tracker.wire("sb-1", 10, 100)
+    released = tracker.release("sb-1")
+    assert released["wire_bytes_out"] == 100
+    tracker.wire("sb-1", 5, 5000)  # debug capture during delete
+    assert tracker.snapshot("sb-1")["wire"]["teardown"]["bytes_out"] == 5000
+    final = tracker.close("sb-1")
+    assert final["wire_bytes_out"] == 5100
+    assert tracker.distribution("rollout.wire_bytes_out")["max"] == 5100
+    assert tracker.close("sb-1") is None
+    # After close the sandbox is unknown: traffic is sampled but not charged
+    tracker.wire("sb-1", 1, 1)
+    assert tracker.snapshot("sb-1") is None
+
+
+def test_failed_setup_attempt_carries_over():
+    tracker = UsageTracker()
+    tracker.open("sb-1")
+    tracker.wire("sb-1", 1, 10)
+    tracker.open("sb-2", previous="sb-1")
+    tracker.wire("sb-2", 1, 20)
+    assert tracker.snapshot("sb-1") is None
+    assert tracker.snapshot("sb-2")["wire_bytes_out"] == 30
+
+
+def test_reservoir_is_bounded_with_exact_moments():
+    reservoir = Reservoir(size=64)
+    for value in range(10_000):
+        reservoir.add(value)
+    assert len(reservoir.samples) == 64
+    dist = reservoir.distribution()
+    assert dist["n"] == 10_000
+    assert dist["mean"] == 4999.5
+    assert dist["max"] == 9999
+    assert 0 <= dist["p50"] <= dist["p90"] <= dist["p99"] <= 9999
+    assert Reservoir().distribution() == {"n": 0}
+
+
+def test_debug_metadata_includes_the_capture(tmp_path):
+    tracker = UsageTracker()
+    inner = MeteredSandboxClient(FakeClient(stdout=""), tracker)
+    client = DebugSandboxClient(inner, output_dir=tmp_path, policy=CapturePolicy(), usage=tracker)
+
+    async def main():
+        client.set_context("run", "r1", "sb-1")
+        tracker.open("sb-1")
+        client.set_usage("sb-1", tracker.release("sb-1"))
+        client.finalize("sb-1", reward=1.0)
+        inner._client.stdout = "A" * 400  # the capture's base64 tarball (not a valid one: ignored)
+        await client.delete("sb-1")
+
+    asyncio.run(main())
+    metadata = json.loads((tmp_path / "runs/run/rollouts/r1/metadata.json").read_text())
+    assert metadata["usage"]["wire"]["teardown"]["bytes_out"] == 400
+
+
+@pytest.mark.parametrize("key", ["rollout.tool_tokens_out", "wire.setup.bytes_out"])
+def test_distribution_of_unknown_series_is_none(key):
+    assert UsageTracker().distribution(key) is None
@@ -0,0 +1,127 @@
+import asyncio
+import base64
+import io
+import json
+import tarfile
+from types import SimpleNamespace
+
+from src.capture_policy import CapturePolicy
+from src.debug_wrapper import DebugSandboxClient
+from src.teardown import TeardownQueue
+
+
+def tarball() -> str:
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode="w:gz") as tar:
+        info = tarfile.TarInfo("vscode/a.ts")
+        data = b"export {};\n"
+        info.size = len(data)
+        tar.addfile(info, io.BytesIO(data))
+    return base64.b64encode(buf.getvalue()).decode()
+
+
+class FakeClient:
+    def __init__(self):
+        self.deleted = []
+
+    async def execute_command(self, sandbox_id, command, **kwargs):
+        return SimpleNamespace(stdout=tarball(), stderr="")
+
+    async def delete(self, sandbox_id, **kwargs):
+        self.deleted.append(sandbox_id)
+
+
+def deferring_client(tmp_path, **policy):
+    # sample_rate=0: nothing is decided at setup, errors are captured once known
+    policy = CapturePolicy(sample_rate=0.0, capture_errors=True, **policy)
+    client = DebugSandboxClient(FakeClient(), output_dir=tmp_path, policy=policy)
+    return client
+
+
+def metadata(tmp_path, rollout_id="r1"):
+    return json.loads((tmp_path / "runs" / "run" / "rollouts" / rollout_id / "metadata.json").read_text())
+
+
+def test_decision_waits_for_the_reward(tmp_path):
+    client = deferring_client(tmp_path)
+
+    async def main():
+        client.set_context("run", "r1", "sb-1")
+        waiter = asyncio.create_task(client.wait_for_decision("sb-1"))
+        await asyncio.sleep(0.01)
+        assert not waiter.done()
+        client.finalize("sb-1", reward=0.0, had_error=True)
+        await asyncio.wait_for(waiter, 1)
+        await client.delete("sb-1")
+
+    asyncio.run(main())
+    assert metadata(tmp_path)["reward"] == 0.0
+    assert (tmp_path / "runs" / "run" / "rollouts" / "r1" / "filesystem.zip").exists()
+
+
+def test_settle_all_releases_rollouts_no_reward_will_reach(tmp_path):
+    client = deferring_client(tmp_path)
+
+    async def main():
+        client.set_context("run", "r1", "sb-1")
+        client.set_context("run", "r2", "sb-2", setup_retries=1)
+        client.settle_all()
+        # Returns at once instead of after decision_timeout
+        await asyncio.wait_for(client.wait_for_decision("sb-1"), 0.1)
+        await asyncio.wait_for(client.wait_for_decision("sb-2"), 0.1)
+        await client.delete("sb-1")
+        await client.delete("sb-2")
+
+    asyncio.run(main())
+    # Without a reward only the rollout that needed setup retries is kept
+    assert not (tmp_path / "runs" / "run" / "rollouts" / "r1").exists()
+    assert metadata(tmp_path, "r2")["reward"] is None
+    assert client._sandbox_state == {} and client._awaiting_reward == {}
+
+
+def test_reward_after_delete_updates_metadata(tmp_path):
+    client = DebugSandboxClient(FakeClient(), output_dir=tmp_path, policy=CapturePolicy())
+
+    async def main():
+        client.set_context("run", "r1", "sb-1")
+        await client.delete("sb-1")
+        assert "sb-1" in client._awaiting_reward
+        client.finalize("sb-1", reward=1.0)
+
+    asyncio.run(main())
+    assert metadata(tmp_path)["reward"] == 1.0
+    assert client._awaiting_reward == {}
+
+
+def test_awaiting_reward_is_dropped_after_the_timeout(tmp_path):
+    client = DebugSandboxClient(FakeClient(), output_dir=tmp_path, policy=CapturePolicy(decision_timeout=0.01))
+
+    async def main():
+        client.set_context("run", "r1", "sb-1")
+        client.set_context("run", "r2", "sb-2")
+        await client.delete("sb-1")
+        await asyncio.sleep(0.05)
+        assert client._awaiting_reward == {}
+        await client.delete("sb-2")
+        client.flush_awaiting_reward()
+        assert client._awaiting_reward == {}
+
+    asyncio.run(main())
+    assert metadata(tmp_path, "r2")["finished_at"] is not None
+
+
+def test_drain_cancels_deletes_still_waiting_for_a_decision(tmp_path):
+    client = deferring_client(tmp_path / "debug")
+    queue = TeardownQueue(client, workers=1, journal_dir=tmp_path / "journal")
+
+    async def main():
+        queue.start()
+        client.set_context("run", "r1", "sb-1")
+        await queue.submit("sb-1", after=client.wait_for_decision("sb-1"))
+        await queue.drain(timeout=0.05)
+
+    asyncio.run(main())
+    assert client._client.deleted == []
+    assert queue._deferred == set()
+    # Left journaled for the next process to delete
+    assert len(list((tmp_path / "journal").iterdir())) == 1
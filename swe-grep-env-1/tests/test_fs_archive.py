@@ -0,0 +1,113 @@
+import calendar
+import io
+import tarfile
+import zipfile
+
+import pytest
+
+from src import fs_archive
+from src.fs_archive import CaptureArchive, convert_tree, tar_bytes_to_zip
+
+MTIME = calendar.timegm((2024, 3, 1, 12, 30, 0))
+
+
+def _add(tar, name, data=None, **attrs):
+    info = tarfile.TarInfo(name)
+    info.mtime = MTIME
+    for key, value in attrs.items():
+        setattr(info, key, value)
+    if data is not None:
+        info.size = len(data)
+    tar.addfile(info, io.BytesIO(data) if data is not None else None)
+
+
+def make_tar() -> bytes:
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode="w:gz") as tar:
+        _add(tar, "./", type=tarfile.DIRTYPE, mode=0o755)
+        _add(tar, "./vscode/", type=tarfile.DIRTYPE, mode=0o755)
+        _add(tar, "./vscode/package.json", b'{"name": "code"}\n', mode=0o644)
+        _add(tar, "./vscode/src/main.ts", b"export {};\n", mode=0o644)
+        _add(tar, "./vscode/logo.png", b"\x89PNG" + bytes(100), mode=0o644)
+        _add(tar, "./vscode/run.sh", b"#!/bin/sh\n", mode=0o755)
+        _add(tar, "./vscode/pkg", type=tarfile.SYMTYPE, linkname="package.json")
+        _add(tar, "./vscode/hard.json", type=tarfile.LNKTYPE, linkname="./vscode/package.json")
+        _add(tar, "./vscode/etc", type=tarfile.SYMTYPE, linkname="/etc/passwd")
+        _add(tar, "./vscode/up", type=tarfile.SYMTYPE, linkname="../../outside")
+        _add(tar, "./vscode/loop", type=tarfile.SYMTYPE, linkname="loop")
+    return buf.getvalue()
+
+
+@pytest.fixture
+def archive(tmp_path):
+    dest = tar_bytes_to_zip(make_tar(), tmp_path / fs_archive.ARCHIVE_NAME)
+    with CaptureArchive(dest) as archive:
+        yield archive
+
+
+def test_listdir_includes_implicit_directories(archive):
+    assert [(e.path, e.type) for e in archive.listdir("")] == [("vscode", "directory")]
+    children = {e.path: e.type for e in archive.listdir("./vscode/")}
+    assert children == {
+        "vscode/etc": "symlink",
+        "vscode/hard.json": "file",
+        "vscode/logo.png": "file",
+        "vscode/loop": "symlink",
+        "vscode/package.json": "file",
+        "vscode/pkg": "symlink",
+        "vscode/run.sh": "file",
+        "vscode/src": "directory",  # only implied by vscode/src/main.ts
+        "vscode/up": "symlink",
+    }
+
+
+def test_read_file_and_metadata(archive):
+    assert archive.read("vscode/src/main.ts") == b"export {};\n"
+    entry = archive.stat("vscode/run.sh")
+    assert entry.mode == 0o755
+    assert entry.mtime == MTIME
+    assert archive.stat("missing") is None
+    with pytest.raises(FileNotFoundError):
+        archive.read("vscode")
+
+
+def test_incompressible_suffixes_are_stored(archive):
+    assert archive._infos["vscode/logo.png"].compress_type == zipfile.ZIP_STORED
+    assert archive._infos["vscode/src/main.ts"].compress_type == zipfile.ZIP_DEFLATED
+
+
+def test_symlinks_read_their_target(archive):
+    assert archive.readlink("vscode/pkg") == "package.json"
+    assert archive.read("vscode/pkg") == b'{"name": "code"}\n'
+    with archive.open("vscode/pkg") as f:
+        assert f.read() == b'{"name": "code"}\n'
+
+
+def test_symlinks_outside_the_capture_are_not_found(archive):
+    with pytest.raises(FileNotFoundError):
+        archive.read("vscode/etc")
+    with pytest.raises(FileNotFoundError):
+        archive.read("vscode/up")
+    with pytest.raises(OSError):
+        archive.read("vscode/loop")
+
+
+def test_hard_links_copy_the_target(archive):
+    assert archive.stat("vscode/hard.json").type == "file"
+    assert archive.read("vscode/hard.json") == b'{"name": "code"}\n'
+
+
+def test_convert_tree(tmp_path):
+    rollout = tmp_path / "run" / "rollout_0"
+    rollout.mkdir(parents=True)
+    (rollout / fs_archive.LEGACY_NAME).write_bytes(make_tar())
+    (tmp_path / "run" / "rollout_1").mkdir()
+    (tmp_path / "run" / "rollout_1" / fs_archive.LEGACY_NAME).write_bytes(b"not a tarball")
+
+    assert convert_tree(tmp_path, keep=True) == 1
+    assert (rollout / fs_archive.LEGACY_NAME).exists()
+    with CaptureArchive(rollout / fs_archive.ARCHIVE_NAME) as archive:
+        assert archive.read("vscode/package.json") == b'{"name": "code"}\n'
+    # Already converted: only the legacy file is removed
+    assert convert_tree(tmp_path) == 0
+    assert not (rollout / fs_archive.LEGACY_NAME).exists()
@@ -0,0 +1,83 @@
+import asyncio
+import logging
+import time
+
+from src.loop_monitor import LoopMonitor, SamplingProfiler
+
+
+def blocking_call(seconds):
+    time.sleep(seconds)
+
+
+def test_reports_a_blocked_loop_with_the_blocking_stack(caplog):
+    lags = []
+    monitor = LoopMonitor(threshold=0.1, interval=0.02, on_lag=lags.append)
+
+    async def main():
+        monitor.start()
+        monitor.start()  # idempotent
+        await asyncio.sleep(0.1)
+        blocking_call(0.4)
+        await asyncio.sleep(0.1)
+        monitor.stop()
+
+    with caplog.at_level(logging.WARNING, logger="SweGrepEnv.loop"):
+        asyncio.run(main())
+    assert monitor.stalls == 1
+    assert 0.3 < monitor.max_lag < 1.0
+    assert max(lags) == monitor.max_lag
+    assert sum(lag > 0.1 for lag in lags) == 1
+    # The watchdog dumps the stack once, while the loop is still blocked
+    dumps = [r.getMessage() for r in caplog.records if "so far, in:" in r.getMessage()]
+    assert len(dumps) == 1
+    assert "blocking_call" in dumps[0]
+
+
+def test_quiet_loop_has_no_stalls():
+    monitor = LoopMonitor(threshold=0.1, interval=0.01)
+
+    async def main():
+        monitor.start()
+        for _ in range(20):
+            await asyncio.sleep(0.005)
+        monitor.stop()
+
+    asyncio.run(main())
+    assert monitor.stalls == 0
+
+
+def test_profiler_samples_the_loop_thread_and_dumps_every_n_rollouts(tmp_path):
+    profiler = SamplingProfiler(str(tmp_path), every=2, interval=0.001)
+
+    async def main():
+        profiler.install()
+        assert profiler.enabled
+        blocking_call(0.1)
+        profiler.rollout_done()
+        assert not list(tmp_path.iterdir())
+        blocking_call(0.1)
+        profiler.rollout_done()
+        profiler.stop()
+
+    asyncio.run(main())
+    dumps = sorted(tmp_path.glob("*.collapsed"))
+    assert len(dumps) == 1
+    lines = dumps[0].read_text().splitlines()
+    stack, count = lines[0].rsplit(" ", 1)
+    assert "blocking_call (test_loop_monitor.py:" in stack
+    assert stack.index("main (") < stack.index("blocking_call (")  # root first
+    assert int(count) > 0
+
+
+def test_profiler_is_off_by_default(tmp_path, monkeypatch):
+    monkeypatch.delenv("SWE_GREP_PROFILE", raising=False)
+    profiler = SamplingProfiler.from_env()
+
+    async def main():
+        profiler.install()
+        profiler.rollout_done()
+
+    asyncio.run(main())
+    assert not profiler.enabled
+    assert profiler.rollouts == 0
+    assert profiler.dump() is None
@@ -0,0 +1,38 @@
+from src.prefetch import parse_grep_hits, parse_grouped_hits
+
+
+def test_context_text_that_looks_like_a_match():
+    output = "\n".join([
+        'src/a.ts-10-const t = "12:30:00";',
+        "src/a.ts:11:registerAction(x)",
+        "src/a.ts-12-x:1:y",
+        "--",
+        "src/b.ts-3-see b.ts:40: for details",
+        "src/b.ts:4:registerAction(y)",
+    ])
+    assert parse_grep_hits(output, 5) == [("src/a.ts", [11]), ("src/b.ts", [4])]
+
+
+def test_paths_containing_separators():
+    output = "\n".join([
+        "lib/rfc-2822-parser.ts-3-// header",
+        "lib/rfc-2822-parser.ts:4:registerAction",
+        "lib/v-1-2.ts:9:registerAction",
+        "lib/foo:12:bar.ts:2:registerAction",
+        "lib/foo:12:bar.ts-3-}",
+    ])
+    assert parse_grep_hits(output, 5) == [
+        ("lib/rfc-2822-parser.ts", [4]),
+        ("lib/v-1-2.ts", [9]),
+        ("lib/foo:12:bar.ts", [2]),
+    ]
+
+
+def test_top_n_keeps_output_order():
+    output = "a.ts:1:x\nb.ts:2:x\na.ts:5:x\nc.ts:3:x\n"
+    assert parse_grep_hits(output, 2) == [("a.ts", [1, 5]), ("b.ts", [2])]
+
+
+def test_grouped_hits():
+    output = "src/a.ts\n10-ctx\n11:match\n12:again\n\nsrc/b.ts\n4:match\n"
+    assert parse_grouped_hits(output, 5) == [("src/a.ts", [11, 12]), ("src/b.ts", [4])]
@@ -0,0 +1,48 @@
+import os
+import subprocess
+import tarfile
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src.repos import GitObjectCache, RepoSpec
+
+
+def git(*args, cwd):
+    subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True)
+
+
+@pytest.fixture
+def origin(tmp_path):
+    repo = tmp_path / "origin"
+    repo.mkdir()
+    git("init", "--quiet", cwd=repo)
+    (repo / "src").mkdir()
+    (repo / "src" / "a.ts").write_text("export const a = 1;\n")
+    git("add", "-A", cwd=repo)
+    git("-c", "user.name=t", "-c", "user.email=t@t", "commit", "--quiet", "-m", "init", cwd=repo)
+    return repo
+
+
+def test_resolve_snapshot_checkout(tmp_path, origin):
+    cache = GitObjectCache(tmp_path / "cache")
+    spec = RepoSpec("demo", f"file://{origin}", path="demo")
+    with ThreadPoolExecutor(4) as pool:
+        shas = set(pool.map(lambda _: cache.resolve(spec), range(8)))
+    assert len(shas) == 1
+    sha = shas.pop()
+    repo_dir = cache.checkout(spec, sha, tmp_path / "work")
+    assert (repo_dir / "src" / "a.ts").read_text() == "export const a = 1;\n"
+    # Same commit again: reused, not re-extracted
+    assert cache.checkout(spec, sha, tmp_path / "work") == repo_dir
+
+
+@pytest.mark.skipif(not hasattr(tarfile, "data_filter"), reason="no tar extraction filters")
+def test_checkout_refuses_links_out_of_dest(tmp_path, origin):
+    os.symlink("/etc/passwd", origin / "passwd")
+    git("add", "-A", cwd=origin)
+    git("-c", "user.name=t", "-c", "user.email=t@t", "commit", "--quiet", "-m", "link", cwd=origin)
+    cache = GitObjectCache(tmp_path / "cache")
+    spec = RepoSpec("demo", f"file://{origin}", path="demo")
+    with pytest.raises(tarfile.FilterError):
+        cache.checkout(spec, cache.resolve(spec), tmp_path / "work")
@@ -0,0 +1,89 @@
+import base64
+import json
+import shutil
+import subprocess
+
+import pytest
+
+from src.rg_format import TRUNCATED_NOTE, collapse, format_stream
+
+
+def rg_json(files: dict[str, list[tuple[int, bool, str]]]) -> list[str]:
+    """An `rg --json` stream: per file, (line number, is_match, text) in order."""
+    out = []
+    for path, lines in files.items():
+        out.append(json.dumps({"type": "begin", "data": {"path": {"text": path}}}))
+        for line_number, is_match, text in lines:
+            data = {"path": {"text": path}, "lines": {"text": text + "\n"}, "line_number": line_number}
+            start = text.find("hit")
+            data["submatches"] = [{"start": start, "end": start + 3}] if is_match and start >= 0 else []
+            out.append(json.dumps({"type": "match" if is_match else "context", "data": data}))
+        out.append(json.dumps({"type": "end", "data": {"path": {"text": path}}}))
+    out.append(json.dumps({"type": "summary", "data": {}}))
+    return [line + "\n" for line in out]
+
+
+def test_groups_by_file_and_merges_context():
+    stream = rg_json({
+        "a.ts": [(1, False, "one"), (2, True, "hit two"), (3, False, "three"), (4, True, "hit four"),
+                 (5, False, "five"), (9, False, "nine"), (10, True, "hit ten")],
+        "b.ts": [(7, True, "hit seven")],
+    })
+    assert list(format_stream(stream, context=1)) == [
+        "a.ts", "1-one", "2:hit two", "3-three", "4:hit four", "5-five", "--", "9-nine", "10:hit ten",
+        "",
+        "b.ts", "7:hit seven",
+    ]
+
+
+def test_more_matches_note():
+    lines = [(i, True, f"hit {i}") for i in range(1, 9)]
+    out = list(format_stream(rg_json({"a.ts": lines}), context=0, max_per_file=3))
+    assert out == ["a.ts", "1:hit 1", "2:hit 2", "3:hit 3", "(+5 more matches)"]
+
+
+def test_budget_stops_at_a_whole_line():
+    files = {f"dir/file{i}.ts": [(1, True, "hit " + "x" * 50)] for i in range(20)}
+    out = list(format_stream(rg_json(files), context=0, max_bytes=300))
+    assert out[-1] == TRUNCATED_NOTE
+    assert sum(len(line.encode()) + 1 for line in out[:-1]) <= 300
+    assert out[:2] == ["dir/file0.ts", "1:hit " + "x" * 50]
+
+
+def test_budget_stops_reading():
+    consumed = []
+
+    def stream():
+        for line in rg_json({f"f{i}.ts": [(1, True, "hit")] for i in range(1000)}):
+            consumed.append(line)
+            yield line
+
+    list(format_stream(stream(), max_bytes=100))
+    assert len(consumed) < 100
+
+
+def test_errors_and_binary_paths_pass_through():
+    stream = ["rg: regex parse error:\n", "\n"] + rg_json({"a.ts": [(1, True, "hit")]})
+    stream[2] = json.dumps({"type": "begin", "data": {"path": {"bytes": base64.b64encode(b"caf\xe9.ts").decode()}}})
+    out = list(format_stream(stream))
+    assert out[0] == "rg: regex parse error:"
+    assert out[1] == "caf�.ts"
+
+
+def test_collapse_long_lines():
+    line = "a" * 300 + "hit" + "b" * 300
+    short = collapse(line, [(300, 303)], max_line=100)
+    assert short.startswith("...") and short.endswith("... [603 chars]")
+    assert "hit" in short and len(short) < 150
+    assert collapse("x" * 500, [], max_line=100) == "[500 chars]"
+    assert collapse("short", [(0, 1)], max_line=100) == "short"
+
+
+@pytest.mark.skipif(shutil.which("rg") is None, reason="ripgrep not installed")
+def test_real_rg_output(tmp_path):
+    (tmp_path / "a.ts").write_text("\n".join(["ctx"] * 3 + ["registerAction(x)"] + ["ctx"] * 3) + "\n")
+    raw = subprocess.run(["rg", "--json", "-C", "1", "registerAction", "a.ts"], cwd=tmp_path,
+                         capture_output=True, text=True).stdout
+    assert list(format_stream(raw.splitlines(keepends=True), context=1)) == [
+        "a.ts", "3-ctx", "4:registerAction(x)", "5-ctx",
+    ]
@@ -0,0 +1,110 @@
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from src import rg_server
+
+needs_rg = pytest.mark.skipif(shutil.which("rg") is None, reason="ripgrep not installed")
+
+FILES = {
+    "src/a.py": "foo start\nbar foo\n  foo indented\nfoo\n",
+    "src/sub/b.py": 'class Foo:\n    def foo_bar(self):\n        return {"a":1}\n\n\ndef foo():\n    pass\n',
+    "docs/d.md": "no newline foo",
+    "docs/u.txt": "héllo wörld foo\n日本語 foo 日本\nemoji 🎉 foo\n",
+    "docs/c.txt": "crlf foo\r\nnext\r\n",
+    "img/logo.png": "foo\0binary",
+}
+
+# (pattern, path, glob, context)
+CASES = [
+    ("foo", "repo", "", 0), ("foo", "repo", "", 2), (r"\Afoo", "repo", "", 0), (r"foo\Z", "repo", "", 0),
+    (r"^foo", "repo", "", 0), (r"foo$", "repo", "", 0), (r"\bfoo\b", "repo", "", 0), (r"foo\w+", "repo", "", 1),
+    (r"def \w+\(", "repo", "", 0), (r"(def|class)\s+foo", "repo", "", 0), (r"foo(?=_)", "repo", "", 0),
+    ("foo", "repo/src", "", 1), ("foo", "repo/src/", "", 0), ("foo", "repo/src/a.py", "", 1), ("foo", "repo", "*.py", 0),
+    ("foo", "repo/src/a.py", "*.txt", 0), ("日本", "repo", "", 0), (r"w.rld", "repo", "", 0), (r"\w+ foo", "repo", "", 0),
+    (r"foo\s*$", "repo", "", 0), (r'"a":\d', "repo", "", 0), (r"pass|return", "repo", "", 0), ("o$", "repo", "", 0),
+    (r"\p{L}oo", "repo", "", 0), ("fo", "repo", "", 0), (r"[^x]foo", "repo", "", 0), (r"foo.*", "repo", "", 0),
+    ("nowhere", "repo", "", 0), ("foo", "repo/missing", "", 0),
+    # rg rejects these; Python's re would read the braces or the comment its own way
+    ("class Foo {", "repo", "", 0), ("bar() {}", "repo", "", 0), ("x{,2}Foo", "repo", "", 0), ("Foo(?#c)", "repo", "", 0),
+    (r"o{1}", "repo", "", 0), (r"fo{1,}", "repo", "", 0), (r"[{]a", "repo", "", 0), (r"\{\s*$", "repo", "", 0),
+]
+
+
+@pytest.fixture(scope="module")
+def index(tmp_path_factory):
+    """An index over `repo/`, with the working directory set to its parent as in the sandbox."""
+    base = tmp_path_factory.mktemp("parity")
+    for rel, text in FILES.items():
+        path = base / "repo" / rel
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(text.encode())
+    cwd = os.getcwd()
+    os.chdir(base)
+    try:
+        idx = rg_server.Index("repo")
+        idx.preload()
+        yield idx
+    finally:
+        os.chdir(cwd)
+
+
+def search(index, pattern, path="repo", glob="", context=0, max_lines=51):
+    req = {"pattern": pattern, "path": path, "glob": glob, "context": context, "max_lines": max_lines}
+    return rg_server.search(index, req)
+
+
+@needs_rg
+@pytest.mark.parametrize("pattern, path, glob, context", CASES)
+def test_matches_rg(index, pattern, path, glob, context):
+    flags = ["-n", "--max-filesize", "100K"] + (["-C", str(context)] if context else []) + (["-g", glob] if glob else [])
+    out = subprocess.run(["rg", *flags, pattern, path], capture_output=True).stdout
+    expected = out.decode("utf-8", "replace").split("\n")[:-1]
+    got = search(index, pattern, path, glob, context)
+    if got is not None:  # None: the daemon declined and grep_tool runs rg itself
+        assert sorted(got) == sorted(expected)
+
+
+@needs_rg
+@pytest.mark.parametrize("pattern", ["class Foo {", "bar() {}", "x{,2}Foo", "Foo(?#c)", "a{", "}{"])
+def test_patterns_rg_rejects_fall_back(index, pattern):
+    # grep_tool must show rg's parse error, not "No matches found."
+    assert subprocess.run(["rg", pattern, "repo"], capture_output=True).returncode == 2
+    assert search(index, pattern) is None
+
+
+def test_answers_common_patterns(index):
+    assert index.ready
+    assert sorted(search(index, "foo", "repo/src")) == [
+        "repo/src/a.py:1:foo start", "repo/src/a.py:2:bar foo", "repo/src/a.py:3:  foo indented", "repo/src/a.py:4:foo",
+        "repo/src/sub/b.py:2:    def foo_bar(self):", "repo/src/sub/b.py:6:def foo():",
+    ]
+    assert search(index, r"\bfoo\b") is not None
+    assert search(index, r"def \w+\(") is not None
+    assert search(index, r"bar fo{1,2}") is not None
+    # An explicit file prints no name, and rg ignores -g for it
+    assert search(index, "foo", "repo/src/a.py", glob="*.txt") == ["1:foo start", "2:bar foo", "3:  foo indented", "4:foo"]
+
+
+@pytest.mark.parametrize("pattern", [r"\Afoo", r"foo\Z", r"foo(?=_)", r"(?<!x)foo", r"\p{L}oo", "fo", "(?i)foo", "a\nb"])
+def test_falls_back_where_semantics_differ(index, pattern):
+    assert search(index, pattern) is None
+
+
+def test_falls_back_for_ignore_case_and_outside_paths(index):
+    assert rg_server.search(index, {"pattern": "foo", "path": "repo", "ignore_case": True}) is None
+    assert search(index, "foo", "elsewhere") is None
+    assert search(index, "foo", "repo/img/logo.png") is None  # explicit binary file: rg's call
+
+
+def test_stops_at_max_lines(index):
+    assert len(search(index, "foo", max_lines=3)) == 3
+
+
+def test_over_memory_cap_falls_back(index):
+    small = rg_server.Index(index.root, max_memory=16)
+    small.preload()
+    assert not small.ready
+    assert search(small, "foo") is None
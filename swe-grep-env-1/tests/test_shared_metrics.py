@@ -0,0 +1,177 @@
+import logging
+import multiprocessing as mp
+
+import pytest
+
+from src import procs, shared_metrics
+from src.shared_metrics import SharedMetrics, node_report, percentile
+
+fork = pytest.mark.skipif("fork" not in mp.get_all_start_methods(), reason="needs fork")
+
+
+def _count(path, n, release=None, done=None):
+    metrics = SharedMetrics(path, slots=2)
+    metrics.incr("setup_success", n)
+    metrics.observe("tool_seconds", 0.003)
+    if done is not None:
+        done.set()
+        release.wait(10)
+
+
+def _run(ctx, path, n, **events):
+    p = ctx.Process(target=_count, args=(path, n), kwargs=events)
+    p.start()
+    return p
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "metrics")
+
+
+def test_counts_per_process_and_totals(path):
+    metrics = SharedMetrics(path, slots=4)
+    metrics.incr("setup_success")
+    metrics.incr("setup_success", 2)
+    metrics.observe("exec_seconds", 0.0015)
+    metrics.observe("exec_seconds", 1000)
+    totals = metrics.totals()
+    assert totals["workers"] == totals["live_workers"] == 1
+    assert totals["counters"]["setup_success"] == 3
+    hist = totals["histograms"]["exec_seconds"]
+    assert hist[1] == 1  # (1ms, 2ms]
+    assert hist[-2] == 1  # overflow
+    assert percentile(hist, 0.5) == 0.002
+    assert percentile(hist, 0.99) == float("inf")
+    assert node_report(totals)["latency"]["exec_seconds"]["n"] == 2
+
+
+def test_reopening_keeps_this_process_slot(path):
+    first = SharedMetrics(path, slots=4)
+    first.incr("setup_failed")
+    second = SharedMetrics(path, slots=4)
+    second.incr("setup_failed")
+    assert second.totals()["workers"] == 1
+    assert second.get("setup_failed") == 2
+
+
+@fork
+def test_dead_workers_slots_are_reclaimed(path):
+    ctx = mp.get_context("fork")
+    SharedMetrics(path, slots=2)  # create the file before the children race for it
+    for n in (1, 10, 100):
+        p = _run(ctx, path, n)
+        p.join()
+        assert p.exitcode == 0
+    totals = SharedMetrics(path).totals()
+    # Three workers through two slots; exited workers' counts are kept
+    assert totals["counters"]["setup_success"] == 111
+    assert totals["workers"] == 2
+    assert sum(totals["histograms"]["tool_seconds"][:-1]) == 3
+
+
+@fork
+def test_live_slots_are_not_taken(path, caplog):
+    ctx = mp.get_context("fork")
+    release, done = ctx.Event(), ctx.Event()
+    holder = _run(ctx, path, 5, release=release, done=done)
+    try:
+        assert done.wait(10)
+        metrics = SharedMetrics(path)
+        metrics.incr("setup_success")  # claims the second slot
+        with caplog.at_level(logging.WARNING, logger="SweGrepEnv.metrics"):
+            # Same file, but pretend this process is a third worker: both slots are held by live pids
+            crowded = SharedMetrics(path)
+            second = shared_metrics._HEADER_WORDS + 1 * shared_metrics._SLOT_WORDS
+            crowded._words[second + shared_metrics._OWNER] = holder.pid
+            crowded._words[second + shared_metrics._STARTED] = procs.start_time(holder.pid)
+            crowded.incr("setup_failed")
+        assert "held by live workers" in caplog.text
+        assert crowded.path is None
+    finally:
+        release.set()
+        holder.join()
+
+
+@fork
+def test_fresh_clears_a_finished_run_only(path):
+    ctx = mp.get_context("fork")
+    p = _run(ctx, path, 7)
+    p.join()
+    assert SharedMetrics(path).totals()["counters"]["setup_success"] == 7
+
+    release, done = ctx.Event(), ctx.Event()
+    holder = _run(ctx, path, 3, release=release, done=done)
+    try:
+        assert done.wait(10)
+        # A live owner means a run is in progress: fresh keeps its counts
+        assert SharedMetrics(path, fresh=True).totals()["counters"]["setup_success"] == 10
+    finally:
+        release.set()
+        holder.join()
+    fresh = SharedMetrics(path, fresh=True)
+    assert fresh.totals()["counters"]["setup_success"] == 0
+    assert fresh.totals()["workers"] == 0
+
+
+def test_incompatible_file_falls_back_to_private_counts(path, caplog):
+    with open(path, "wb") as f:
+        f.write(b"\1" * 4096)
+    with caplog.at_level(logging.WARNING, logger="SweGrepEnv.metrics"):
+        metrics = SharedMetrics(path)
+    assert metrics.path is None
+    metrics.incr("clone_failed")
+    assert metrics.totals()["counters"]["clone_failed"] == 1
+
+
+def test_restarted_worker_with_the_same_pid_starts_fresh(path):
+    old = SharedMetrics(path, slots=2)
+    old.incr("setup_failed", 42)
+    # Same pid, earlier start time: the previous process in a restarted container
+    old._words[old._slot + shared_metrics._STARTED] -= 100
+    restarted = SharedMetrics(path, fresh=True)
+    assert restarted.totals()["counters"]["setup_failed"] == 0
+    restarted.incr("setup_failed")
+    assert restarted.totals()["workers"] == 1
+
+
+def test_restarted_worker_takes_over_its_predecessors_slot(path):
+    old = SharedMetrics(path, slots=1)
+    old.incr("setup_success", 3)
+    old._words[old._slot + shared_metrics._STARTED] -= 100
+    new = SharedMetrics(path)  # not fresh: the predecessor's counts stay in the totals
+    new.incr("setup_success")
+    assert new.totals()["counters"]["setup_success"] == 4
+    assert new.path == path
+
+
+@fork
+def test_reset_leaves_live_slots_to_their_owners(path):
+    ctx = mp.get_context("fork")
+    release, done = ctx.Event(), ctx.Event()
+    holder = _run(ctx, path, 5, release=release, done=done)
+    try:
+        assert done.wait(10)
+        reader = SharedMetrics(path)
+        base = shared_metrics._HEADER_WORDS
+        before = reader._words[base:base + shared_metrics._SLOT_WORDS].tolist()
+        reader.reset()
+        # The holder's slot is untouched, but its pre-reset counts no longer show
+        assert reader._words[base:base + shared_metrics._SLOT_WORDS].tolist() == before
+        totals = reader.totals()
+        assert totals["counters"]["setup_success"] == 0
+        assert totals["live_workers"] == 1
+        reader.incr("setup_success")
+        assert reader.totals()["counters"]["setup_success"] == 1
+    finally:
+        release.set()
+        holder.join()
+
+
+def test_owner_applies_the_reset_itself(path):
+    metrics = SharedMetrics(path)
+    metrics.incr("exec_attempts", 9)
+    SharedMetrics(path).reset()
+    assert metrics.get("exec_attempts") == 0
+    metrics.incr("exec_attempts")
+    assert metrics.totals()["counters"]["exec_attempts"] == 1
@@ -0,0 +1,120 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from src import procs
+from src.teardown import TeardownQueue, journal_name
+
+
+class FakeClient:
+    def __init__(self, fail: int = 0):
+        self.deleted: list[str] = []
+        self.fail = fail
+
+    async def delete(self, sandbox_id):
+        if self.fail:
+            self.fail -= 1
+            raise RuntimeError("502 Bad Gateway")
+        self.deleted.append(sandbox_id)
+
+
+def write_journal(path, *sandbox_ids, done=()):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as f:
+        for sandbox_id in sandbox_ids:
+            f.write(json.dumps({"op": "add", "sandbox_id": sandbox_id}) + "\n")
+        for sandbox_id in done:
+            f.write(json.dumps({"op": "done", "sandbox_id": sandbox_id}) + "\n")
+
+
+def run(queue, *submits):
+    async def main():
+        queue.start()
+        for sandbox_id in submits:
+            await queue.submit(sandbox_id)
+        await queue.drain(timeout=10)
+
+    asyncio.run(main())
+
+
+def my_journal(tmp_path, pid=None, started=None):
+    pid = os.getpid() if pid is None else pid
+    started = procs.start_time(pid) if started is None else started
+    return tmp_path / journal_name(procs.hostname(), pid, started)
+
+
+def test_deletes_and_removes_its_journal(tmp_path):
+    client = FakeClient()
+    queue = TeardownQueue(client, workers=2, journal_dir=tmp_path)
+    run(queue, "sb-1", "sb-2")
+    assert sorted(client.deleted) == ["sb-1", "sb-2"]
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_adopts_predecessor_with_the_same_pid(tmp_path):
+    # A restarted container: same host and pid, earlier start time
+    write_journal(my_journal(tmp_path, started=procs.start_time(os.getpid()) - 100), "orphan-1", "orphan-2", done=["orphan-2"])
+    write_journal(tmp_path / f"{os.getpid()}.jsonl", "legacy-1")
+    client = FakeClient()
+    queue = TeardownQueue(client, workers=2, journal_dir=tmp_path)
+    run(queue)
+    assert sorted(client.deleted) == ["legacy-1", "orphan-1"]
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_adopts_a_journal_at_its_own_path(tmp_path):
+    write_journal(my_journal(tmp_path), "left-behind")
+    client = FakeClient()
+    run(TeardownQueue(client, workers=1, journal_dir=tmp_path))
+    assert client.deleted == ["left-behind"]
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_reused_pid_does_not_block_adoption(tmp_path):
+    live = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(30)"])
+    try:
+        # The journal's owner had this pid but started earlier; the live process is someone else
+        write_journal(my_journal(tmp_path, live.pid, procs.start_time(live.pid) - 100), "orphan")
+        write_journal(my_journal(tmp_path, live.pid), "still-owned")
+        client = FakeClient()
+        run(TeardownQueue(client, workers=1, journal_dir=tmp_path))
+        assert client.deleted == ["orphan"]
+        assert [p.name for p in tmp_path.iterdir()] == [my_journal(tmp_path, live.pid).name]
+    finally:
+        live.kill()
+        live.wait()
+
+
+def test_other_hosts_journals_wait_until_stale(tmp_path):
+    fresh = tmp_path / journal_name("other-node.example", 1234, 99)
+    stale = tmp_path / journal_name("other-node.example", 5678, 99)
+    write_journal(fresh, "theirs")
+    write_journal(stale, "abandoned")
+    old = time.time() - 3600
+    os.utime(stale, (old, old))
+    client = FakeClient()
+    run(TeardownQueue(client, workers=1, stale_after=600, journal_dir=tmp_path))
+    assert client.deleted == ["abandoned"]
+    assert [p.name for p in tmp_path.iterdir()] == [fresh.name]
+
+
+@pytest.mark.parametrize("retry_interval, deleted", [(0.01, ["sb-1"]), (60, [])])
+def test_failed_deletes_are_retried_while_running(tmp_path, retry_interval, deleted):
+    client = FakeClient(fail=1)
+    queue = TeardownQueue(client, workers=1, max_retries=0, retry_interval=retry_interval, journal_dir=tmp_path)
+
+    async def main():
+        queue.start()
+        await queue.submit("sb-1")
+        await asyncio.sleep(0.2)
+        await queue.drain(timeout=1)
+
+    asyncio.run(main())
+    assert client.deleted == deleted
+    # Still pending: stays journaled for the next process
+    assert bool(list(tmp_path.iterdir())) == (not deleted)
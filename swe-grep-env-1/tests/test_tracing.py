@@ -0,0 +1,76 @@
+import asyncio
+import json
+import threading
+
+from src import tracing
+from src.teardown import TeardownQueue
+
+
+def load_chrome(path) -> list[dict]:
+    return json.loads(path.read_text().rstrip().rstrip(",") + "]")
+
+
+def test_full_batches_are_written_off_the_calling_thread(tmp_path, monkeypatch):
+    tracer = tracing.Tracer(str(tmp_path / "trace.json"), flush_every=4)
+    writers = []
+    write = tracer._write
+
+    def recording_write(*args):
+        writers.append(threading.current_thread())
+        write(*args)
+
+    monkeypatch.setattr(tracer, "_write", recording_write)
+
+    async def main():
+        for i in range(10):
+            with tracer.span(f"step{i}", rollout="r1"):
+                await asyncio.sleep(0)
+
+    asyncio.run(main())
+    tracer.flush()
+    # Two full batches went to the writer thread; flush wrote the last two spans itself
+    assert [t is threading.main_thread() for t in writers] == [False, False, True]
+    events = [e for e in load_chrome(tmp_path / "trace.json") if e["ph"] == "X"]
+    assert [e["name"] for e in events] == [f"step{i}" for i in range(10)]
+
+
+def test_otlp_parent_links(tmp_path):
+    tracer = tracing.Tracer(str(tmp_path / "trace.jsonl"), fmt="otlp")
+    with tracer.span("outer", rollout="r" * 32):
+        with tracer.span("inner", rollout="r" * 32, n=1):
+            pass
+    tracer.flush()
+    spans = json.loads((tmp_path / "trace.jsonl").read_text())["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    inner, outer = spans
+    assert inner["parentSpanId"] == outer["spanId"]
+    assert "parentSpanId" not in outer
+
+
+class SlowClient:
+    async def delete(self, sandbox_id):
+        await asyncio.sleep(0.01)
+
+
+def test_teardown_workers_get_their_own_lanes(tmp_path, monkeypatch):
+    tracer = tracing.Tracer(str(tmp_path / "trace.json"))
+    monkeypatch.setattr(tracing, "tracer", tracer)
+    queue = TeardownQueue(SlowClient(), workers=3, journal_dir=tmp_path / "journal")
+
+    async def main():
+        tracing.set_rollout("rollout-1")  # submitted from a rollout, deleted in the background
+        queue.start()
+        for i in range(9):
+            await queue.submit(f"sb-{i}")
+        await queue.drain(timeout=10)
+
+    asyncio.run(main())
+    tracer.flush()
+    events = load_chrome(tmp_path / "trace.json")
+    lanes = {e["tid"]: e["args"]["name"] for e in events if e["ph"] == "M"}
+    deletes = [e for e in events if e["ph"] == "X" and e["name"] == "delete"]
+    assert len(deletes) == 9
+    assert {lanes[e["tid"]] for e in deletes} == {"teardown-0", "teardown-1", "teardown-2"}
+    # Within a lane, X events must not overlap or the viewer mis-nests them
+    for tid in {e["tid"] for e in deletes}:
+        spans = sorted((e["ts"], e["ts"] + e["dur"]) for e in deletes if e["tid"] == tid)
+        assert all(end <= next_start for (_, end), (next_start, _) in zip(spans, spans[1:]))
@@ -0,0 +1,71 @@
+from types import SimpleNamespace
+
+import numpy as np
+
+from src.trajectory_summary import GroupSummary, TrajectorySummary, summarize, tool_id
+
+
+def step(*tools):
+    calls = [SimpleNamespace(function=SimpleNamespace(name=name)) for name in tools]
+    message = SimpleNamespace(tool_calls=calls or None)
+    return {"response": SimpleNamespace(choices=[SimpleNamespace(message=message)])}
+
+
+def rollout(*turns, correct=None, usage=None):
+    state = {"trajectory": [step(*tools) for tools in turns], "usage": usage or {}}
+    if correct is not None:
+        state["_is_correct"] = correct
+    return state
+
+
+def test_summary_of_one_rollout():
+    state = rollout(("grep_tool", "grep_tool", "list_files"), (), ("read_file",),
+                    usage={"tool_tokens_out": 120, "wire_bytes_out": 4096})
+    state["trajectory"].append({"response": SimpleNamespace(choices=[])})
+    summary = TrajectorySummary.from_state(state)
+    assert summary.turns == 4
+    assert list(summary.calls_per_turn) == [3, 0, 1, 0]
+    assert [tool_id(n) for n in ("grep_tool", "grep_tool", "list_files", "read_file")] == list(summary.call_tools)
+    assert summary.total_calls == 4
+    assert summary.mean_parallel == 2.0  # over the two turns that made calls
+    assert (summary.tool_tokens_out, summary.wire_bytes_out) == (120, 4096)
+    assert TrajectorySummary.from_state({}).mean_parallel == 0.0
+
+
+def test_summarize_builds_once():
+    state = rollout(("grep_tool",))
+    first = summarize(state)
+    assert state["trajectory_summary"] is first
+    state["trajectory"].append(step("grep_tool"))
+    assert summarize(state) is first
+
+
+def test_group_columns_match_per_rollout_summaries():
+    states = [
+        rollout(("grep_tool",) * 4, ("read_file", "grep_tool"), correct=True, usage={"tool_tokens_out": 10}),
+        rollout((), (), correct=False),
+        rollout(("list_files",), ("list_files",), ("read_file",)),
+    ]
+    for state in states[:2]:
+        summarize(state)  # as the end-of-rollout hook would
+    states[2]["_is_correct"] = True  # judged after the summary was built
+
+    group = GroupSummary.from_states(states)
+    assert group.size == 3
+    assert group.turns.tolist() == [2, 2, 3]
+    assert group.total_calls.tolist() == [6, 0, 3]
+    assert group.correct.tolist() == [True, False, True]
+    assert group.tool_tokens_out.tolist() == [10, 0, 0]
+    assert np.allclose(group.mean_parallel, [3.0, 0.0, 1.0])
+    assert np.allclose(group.mean_parallel, [summarize(s).mean_parallel for s in states])
+    grep, read, ls = tool_id("grep_tool"), tool_id("read_file"), tool_id("list_files")
+    assert group.tool_counts[:, grep].tolist() == [5, 0, 0]
+    assert group.tool_counts[:, read].tolist() == [1, 0, 1]
+    assert group.tool_counts[:, ls].tolist() == [0, 0, 2]
+    assert group.tool_counts.sum() == group.total_calls.sum()
+
+
+def test_empty_group():
+    group = GroupSummary.from_states([])
+    assert group.size == 0
+    assert group.mean_parallel.shape == (0,)
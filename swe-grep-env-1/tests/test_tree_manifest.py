@@ -0,0 +1,47 @@
+import os
+import subprocess
+
+import pytest
+
+from src.tree_manifest import TreeManifest, capture_command
+
+
+def sh(cmd: str, cwd) -> str:
+    env = dict(os.environ, LC_ALL="C", TZ="UTC")
+    return subprocess.run(["bash", "-c", cmd], cwd=cwd, env=env, capture_output=True, text=True, check=True).stdout
+
+
+@pytest.fixture
+def workspace(tmp_path):
+    repo = tmp_path / "repo"
+    (repo / "src" / "vs").mkdir(parents=True)
+    (repo / "src" / "vs" / "main.ts").write_text("export {};\n")
+    (repo / "src" / "B.ts").write_text("x" * 5000)
+    (repo / "README.md").write_text("# repo\n")
+    (repo / "run.sh").write_text("#!/bin/sh\n")
+    (repo / "run.sh").chmod(0o755)
+    os.symlink("src/vs/main.ts", repo / "main")
+    old = 946684800  # 2000-01-01: shown with a year instead of a time
+    os.utime(repo / "README.md", (old, old))
+    return tmp_path
+
+
+@pytest.fixture
+def manifest(workspace):
+    return TreeManifest.from_capture("repo", sh(capture_command("repo"), workspace))
+
+
+@pytest.mark.parametrize("path", ["repo", "repo/", "repo/src", "./repo/src/vs", "repo/README.md", "repo/run.sh", "repo/main"])
+def test_matches_ls_la(workspace, manifest, path):
+    assert manifest.ls_la(path) == sh(f"ls -la {path}", workspace).rstrip("\n")
+
+
+def test_absolute_paths_resolve_against_the_sandbox_cwd(workspace, manifest):
+    assert manifest.ls_la(f"{workspace}/repo/src") == manifest.ls_la("repo/src")
+
+
+def test_declines_what_the_snapshot_cannot_answer(manifest):
+    assert manifest.ls_la("repo/missing") is None
+    assert manifest.ls_la("/etc") is None
+    assert manifest.ls_la("other") is None
+    assert manifest.ls_la("repo/main/") is None  # trailing slash follows the link
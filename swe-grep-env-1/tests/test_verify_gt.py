@@ -0,0 +1,76 @@
+import pandas as pd
+import pytest
+
+from src import verify_gt
+
+
+@pytest.fixture
+def repo(tmp_path):
+    (tmp_path / "src").mkdir()
+    (tmp_path / "src/a.ts").write_text("export function registerAction(x) {\n  return x.id;\n}\n")
+    (tmp_path / "src/b.ts").write_text("registerAction(foo);\nconst registerActionLater = 1;\n")
+    (tmp_path / "src/c.ts").write_text("// return x.id; is mentioned here\nreturn  x.id;\n")
+    (tmp_path / "logo.png").write_bytes(b"\x89PNG\0\0registerAction")
+    (tmp_path / "big.json").write_text("registerAction " * (verify_gt.MAX_FILE_SIZE // 10))
+    return tmp_path
+
+
+def verify(repo, rows):
+    df = pd.DataFrame(rows, columns=["answer", "gt_files", "gt_lines"])
+    return verify_gt.verify_dataset(df, repo, workers=2)
+
+
+def test_identifier_counts_exact_token_hits(repo):
+    out = verify(repo, [("registerAction", ["src/a.ts"], ["src/a.ts:1-1"])])
+    # a.ts and b.ts; logo.png (binary) and big.json (oversized) are never indexed
+    assert out.loc[0, "gt_match_files"] == 2
+    assert out.loc[0, "gt_verified"]
+    assert out.loc[0, "gt_found_line"] == 1
+
+
+def test_phrase_needs_every_token_and_the_literal(repo):
+    out = verify(repo, [("return x.id;", ["src/a.ts"], ["src/a.ts:2-2"])])
+    # c.ts holds all the tokens but the literal only in its comment
+    assert out.loc[0, "gt_match_files"] == 2
+    assert out.loc[0, "gt_in_range"]
+
+
+def test_off_range_and_missing(repo):
+    out = verify(repo, [
+        ("registerAction", ["src/a.ts"], ["src/a.ts:2-3"]),
+        ("registerAction", ["src/gone.ts"], ["src/gone.ts:1-1"]),
+    ])
+    assert out.loc[0, "gt_file_status"] == "ok"
+    assert not out.loc[0, "gt_in_range"]
+    assert out.loc[0, "gt_found_line"] == 1
+    assert out.loc[1, "gt_file_status"] == "missing"
+    assert not out.loc[1, "gt_file_exists"]
+
+
+def test_unreadable_files_exist_but_do_not_verify(repo):
+    out = verify(repo, [
+        ("registerAction", ["logo.png"], ["logo.png:1-1"]),
+        ("registerAction", ["big.json"], ["big.json:1-1"]),
+    ])
+    assert list(out["gt_file_status"]) == ["binary", "too_large"]
+    assert out["gt_file_exists"].all()
+    assert not out["gt_verified"].any()
+
+
+def test_answer_without_tokens_is_not_counted(repo):
+    out = verify(repo, [("=> {", ["src/a.ts"], ["src/a.ts:1-1"])])
+    assert out.loc[0, "gt_match_files"] == -1
+
+
+def test_rows_keep_their_order(repo):
+    rows = [("x", ["src/c.ts"], ["src/c.ts:2-2"]), ("foo", ["src/b.ts"], ["src/b.ts:1-1"])]
+    out = verify(repo, rows)
+    assert list(out["answer"]) == ["x", "foo"]
+    assert out["gt_verified"].all()
+
+
+def test_parse_line_range():
+    assert verify_gt.parse_line_range(["a/b.ts:45-67"]) == (45, 67)
+    assert verify_gt.parse_line_range(["a/b.ts:12"]) == (12, 12)
+    assert verify_gt.parse_line_range([]) is None
+    assert verify_gt.parse_line_range(["a/b.ts"]) is None